@@ -0,0 +1,494 @@
+"""Benchmark runner for the encrypt-bin build pipeline.
+
+Every case runs in a fresh interpreter so that its peak RSS is measured on its own.
+Results are printed as a table and can be saved as JSON and compared against a stored
+baseline, created by a first --save run on the same machine (none is committed, as
+throughput depends on the machine):
+
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json --tolerance 0.15
+
+The exit code is 1 when any case is slower than the baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+FULL_IMAGE_SIZES = [64 * KB, 1 * MB, 16 * MB, 256 * MB, 1 * GB]
+QUICK_IMAGE_SIZES = [64 * KB, 1 * MB, 16 * MB]
+FULL_KEY_COUNTS = [10, 1000, 100_000, 1_000_000]
+QUICK_KEY_COUNTS = [10, 1000, 10_000]
+
+KEY = bytes(range(16))
+IV = bytes(range(16, 32))
+PAGE_LENGTH = 2048
+
+
+# -----------------------
+# Synthetic inputs
+# -----------------------
+
+
+def make_image(path, size):
+    """Writes a synthetic firmware image: code-like bytes with erased (0xFF) regions."""
+    block = bytes((i * 31 + (i >> 7)) & 0xFF for i in range(64 * KB)) + b"\xFF" * (16 * KB)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            n = min(len(block), remaining)
+            f.write(block[:n])
+            remaining -= n
+    return path
+
+
+def make_firmware(path, size, seed=1):
+    """Writes a firmware-like image for compression cases.
+
+    Mixes a Thumb-style instruction stream, string and lookup tables, incompressible
+    data such as embedded certificates, and erased 0xFF gaps between sections.
+    """
+    import random
+
+    rng = random.Random(seed)
+    # Instruction words follow a Zipf-like distribution, as in compiled code
+    instructions = [rng.getrandbits(16).to_bytes(2, "little") for _ in range(512)]
+    weights = [1 / rank for rank in range(1, len(instructions) + 1)]
+    words = [b"error", b"timeout", b"flash", b"sensor", b"config", b"update", b"CAN", b"UART", b"init", b"ok"]
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            kind = rng.random()
+            if kind < 0.6:
+                section = b"".join(rng.choices(instructions, weights, k=8 * KB))
+            elif kind < 0.75:
+                section = b"\0".join(b" ".join(rng.choice(words) for _ in range(rng.randint(2, 6))) for _ in range(512))
+            elif kind < 0.85:
+                section = b"".join((i * i * 2654435761 >> 8 & 0xFFFF).to_bytes(4, "little") for i in range(4 * KB))
+            elif kind < 0.9:
+                section = rng.randbytes(4 * KB) if hasattr(rng, "randbytes") else os.urandom(4 * KB)
+            else:
+                section = b"\xFF" * rng.randint(1, 32) * KB
+            n = min(len(section), remaining)
+            f.write(section[:n])
+            remaining -= n
+    return path
+
+
+def make_key_file(path, count):
+    """Writes a key file with count entries in the 'device_id;key' format."""
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(f"0x{0x00A0000000000000 + i:016X};{(i * 0x9E3779B97F4A7C15 & ((1 << 128) - 1)):032X}\n")
+    os.chmod(path, 0o600)
+    return path
+
+
+def warm_up():
+    """Loads the lazily imported crypto modules so that their import is not timed."""
+    from encrypt_bin.core.builder import encrypt_aes_cbc
+
+    encrypt_aes_cbc(bytes(16), KEY, IV)
+
+
+def heap_peak_bytes(func, *args):
+    """Returns the peak Python heap allocated while func(*args) runs."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def read_image(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# -----------------------
+# Cases: each returns {"seconds": ..., "bytes"|"items": ..., "stages": {...}}
+# -----------------------
+
+
+def bench_generate_bin(workdir, size):
+    from encrypt_bin.core.builder import generate_bin
+    from encrypt_bin.core.timing import StageTimings
+
+    src = make_image(os.path.join(workdir, "in.bin"), size)
+    dst = os.path.join(workdir, "out.bin")
+    warm_up()
+    start = time.perf_counter()
+    generate_bin(src, dst, 0x1234, 1, 0, 1, KEY, PAGE_LENGTH)
+    seconds = time.perf_counter() - start
+
+    # Second, instrumented run for the per-stage breakdown (not part of the throughput figure)
+    timings = StageTimings()
+    generate_bin(src, dst, 0x1234, 1, 0, 1, KEY, PAGE_LENGTH, timings=timings)
+    stages = {row["stage"]: row["seconds"] for row in timings.summary() if row["stage"] != "total"}
+
+    # Third run under tracemalloc: Python heap allocated on top of the input, per input byte
+    heap_peak = heap_peak_bytes(generate_bin, src, dst, 0x1234, 1, 0, 1, KEY, PAGE_LENGTH)
+    return {"seconds": seconds, "bytes": size, "stages": stages, "heap_peak_bytes": heap_peak, "heap_per_input_byte": heap_peak / size}
+
+
+def bench_pipeline_stages(workdir, size):
+    """Runs the build stages one by one on an in-memory image to time each of them.
+
+    This is the original whole-image pipeline; its heap/B figure is the reference for the
+    copies saved by the streaming generate_bin.
+    """
+    from encrypt_bin.core.builder import encrypt_aes_cbc, pad_bytes
+
+    src = make_image(os.path.join(workdir, "in.bin"), size)
+    warm_up()
+
+    t0 = time.perf_counter()
+    data = read_image(src)
+    t1 = time.perf_counter()
+    data = pad_bytes(data, PAGE_LENGTH)
+    t2 = time.perf_counter()
+    enc = encrypt_aes_cbc(data, KEY, IV)
+    t3 = time.perf_counter()
+    zlib.crc32(data)
+    t4 = time.perf_counter()
+    with open(os.path.join(workdir, "out.bin"), "wb") as f:
+        f.write(enc)
+    t5 = time.perf_counter()
+
+    stages = {"read": t1 - t0, "pad": t2 - t1, "encrypt": t3 - t2, "crc": t4 - t3, "write": t5 - t4}
+    del data, enc
+
+    def in_memory_build():
+        padded = pad_bytes(read_image(src), PAGE_LENGTH)
+        zlib.crc32(padded)
+        return encrypt_aes_cbc(padded, KEY, IV)
+
+    heap_peak = heap_peak_bytes(in_memory_build)
+    return {"seconds": t5 - t0, "bytes": size, "stages": stages, "heap_peak_bytes": heap_peak, "heap_per_input_byte": heap_peak / size}
+
+
+def bench_pad_bytes(workdir, size):
+    from encrypt_bin.core.builder import pad_bytes
+
+    data = read_image(make_image(os.path.join(workdir, "in.bin"), size - 1))
+    start = time.perf_counter()
+    pad_bytes(data, PAGE_LENGTH)
+    return {"seconds": time.perf_counter() - start, "bytes": size}
+
+
+def bench_encrypt_aes_cbc(workdir, size):
+    from encrypt_bin.core.builder import encrypt_aes_cbc
+
+    data = read_image(make_image(os.path.join(workdir, "in.bin"), size))
+    warm_up()
+    start = time.perf_counter()
+    encrypt_aes_cbc(data, KEY, IV)
+    return {"seconds": time.perf_counter() - start, "bytes": size}
+
+
+def bench_encrypt_segmented(workdir, size):
+    """Times a segmented build with all CPUs and reports MB/s for 1, 2, 4, ... worker threads."""
+    from encrypt_bin.core.builder import write_image
+
+    data = read_image(make_image(os.path.join(workdir, "in.bin"), size))
+    dst_path = os.path.join(workdir, "out.bin")
+    segment_size = 256 * KB
+    warm_up()
+
+    counts = sorted({1 << i for i in range((os.cpu_count() or 1).bit_length())} | {os.cpu_count() or 1})
+    workers = {}
+    for count in counts:
+        with open(dst_path, "wb") as dst:
+            start = time.perf_counter()
+            write_image(data, dst, 0x1234, 1, 0, 1, KEY, PAGE_LENGTH, iv=IV, segment_size=segment_size, segment_workers=count)
+            seconds = time.perf_counter() - start
+        workers[count] = {"seconds": seconds, "mb_per_s": size / MB / max(seconds, 1e-9)}
+    return {"seconds": workers[counts[-1]]["seconds"], "bytes": size, "workers": workers}
+
+
+def _bench_compression(workdir, size, codec):
+    """Times compress_payload at the automatically chosen level and reports ratio and speed per level.
+
+    The per-level figures are measured on the first MB of the image.
+    """
+    from encrypt_bin.core.compression import CODECS, choose_level, compress_payload
+
+    data = read_image(make_firmware(os.path.join(workdir, "in.bin"), size))
+    start = time.perf_counter()
+    level = choose_level(data, codec, PAGE_LENGTH)
+    t_choose = time.perf_counter() - start
+    result = compress_payload(data, codec, level, PAGE_LENGTH)
+    seconds = time.perf_counter() - start
+
+    sample = data[:MB]
+    levels = {}
+    for lvl in CODECS[codec].levels:
+        t0 = time.perf_counter()
+        packed = compress_payload(sample, codec, lvl, PAGE_LENGTH)
+        levels[lvl] = {"ratio": packed.ratio, "mb_per_s": len(sample) / MB / max(time.perf_counter() - t0, 1e-9)}
+    return {
+        "seconds": seconds,
+        "bytes": size,
+        "stages": {"choose_level": t_choose, "compress": seconds - t_choose},
+        "level": level,
+        "ratio": result.ratio,
+        "levels": levels,
+    }
+
+
+def bench_compress_zlib(workdir, size):
+    return _bench_compression(workdir, size, "zlib")
+
+
+def bench_compress_lzma(workdir, size):
+    return _bench_compression(workdir, size, "lzma")
+
+
+def bench_parse_key(workdir, count):
+    from encrypt_bin.cli.utils import parse_key
+
+    key_strings = [" ".join(f"{(i + j) & 0xFF:02X}" for j in range(16)) for i in range(count)]
+    start = time.perf_counter()
+    for key_str in key_strings:
+        parse_key(key_str)
+    return {"seconds": time.perf_counter() - start, "items": count}
+
+
+def bench_find_key_in_file(workdir, count):
+    """Looks up the last device of the file (worst case for a linear scan)."""
+    from encrypt_bin.cli.utils import find_key_in_file
+
+    path = make_key_file(os.path.join(workdir, "keys.txt"), count)
+    start = time.perf_counter()
+    find_key_in_file(path, 0x00A0000000000000 + count - 1)
+    return {"seconds": time.perf_counter() - start, "items": count}
+
+
+def bench_keystore_load(workdir, count):
+    from encrypt_bin.cli.keystore import KeyStore
+
+    path = make_key_file(os.path.join(workdir, "keys.txt"), count)
+    start = time.perf_counter()
+    KeyStore.from_file(path)
+    return {"seconds": time.perf_counter() - start, "items": count}
+
+
+def bench_sharded_lookup(workdir, count):
+    """Opens a shard directory and looks up the last device (the conversion is not timed)."""
+    from encrypt_bin.cli.keystore import KeyStore, shard_key_file
+
+    path = make_key_file(os.path.join(workdir, "keys.txt"), count)
+    shard_dir = os.path.join(workdir, "keys.d")
+    shard_key_file(path, shard_dir)
+    start = time.perf_counter()
+    KeyStore.open(shard_dir).get(0x00A0000000000000 + count - 1)
+    return {"seconds": time.perf_counter() - start, "items": count}
+
+
+def bench_derive_key(workdir, count):
+    """Derives count device keys one by one (uncached), as single-device lookups do."""
+    from encrypt_bin.core.kdf import DerivedKeys
+
+    provider = DerivedKeys(KEY, cache_size=0)
+    base = 0x00A0000000000000
+    start = time.perf_counter()
+    for device_id in range(base, base + count):
+        provider.get(device_id)
+    return {"seconds": time.perf_counter() - start, "items": count}
+
+
+def bench_derive_many(workdir, count):
+    """Derives count device keys in one call, as batch builds do."""
+    from encrypt_bin.core.kdf import DerivedKeys
+
+    provider = DerivedKeys(KEY, cache_size=0)
+    base = 0x00A0000000000000
+    start = time.perf_counter()
+    provider.derive_many(range(base, base + count))
+    return {"seconds": time.perf_counter() - start, "items": count}
+
+
+IMAGE_CASES = {
+    "generate_bin": bench_generate_bin,
+    "pipeline_stages": bench_pipeline_stages,
+    "pad_bytes": bench_pad_bytes,
+    "encrypt_aes_cbc": bench_encrypt_aes_cbc,
+    "encrypt_segmented": bench_encrypt_segmented,
+    "compress_zlib": bench_compress_zlib,
+    "compress_lzma": bench_compress_lzma,
+}
+# Compression is orders of magnitude slower than encryption; larger images add no information
+COMPRESSION_CASES = {"compress_zlib", "compress_lzma"}
+COMPRESSION_MAX_SIZE = 16 * MB
+KEY_CASES = {
+    "parse_key": bench_parse_key,
+    "find_key_in_file": bench_find_key_in_file,
+    "keystore_load": bench_keystore_load,
+    "sharded_lookup": bench_sharded_lookup,
+    "derive_key": bench_derive_key,
+    "derive_many": bench_derive_many,
+}
+CASES = {**IMAGE_CASES, **KEY_CASES}
+
+
+# -----------------------
+# Runner
+# -----------------------
+
+
+def _peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * KB
+
+
+def run_case_in_process(name, param):
+    """Worker side: runs one case and prints its result as JSON on stdout."""
+    with tempfile.TemporaryDirectory(prefix="encrypt-bin-bench-") as workdir:
+        result = CASES[name](workdir, param)
+    result["peak_rss_bytes"] = _peak_rss_bytes()
+    print(json.dumps(result))
+
+
+def run_case(name, param, repeat):
+    """Runs a case repeat times in fresh interpreters and keeps the fastest run."""
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", name, str(param)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+
+    best.update(case=name, param=param)
+    seconds = max(best["seconds"], 1e-9)
+    if "bytes" in best:
+        best["mb_per_s"] = best["bytes"] / MB / seconds
+    else:
+        best["items_per_s"] = best["items"] / seconds
+    return best
+
+
+def result_id(result):
+    return f"{result['case']}[{result['param']}]"
+
+
+def throughput(result):
+    return result.get("mb_per_s", result.get("items_per_s"))
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Returns a list of messages for results slower than the baseline by more than tolerance."""
+    reference = {result_id(r): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        ref = reference.get(result_id(r))
+        if ref is None:
+            continue
+        if throughput(r) < throughput(ref) * (1.0 - tolerance):
+            regressions.append(f"{result_id(r)}: {throughput(r):.1f}/s vs baseline {throughput(ref):.1f}/s")
+    return regressions
+
+
+def print_header():
+    print(f"{'case':<32} {'throughput':>21} {'time [s]':>10} {'peak RSS [MB]':>14} {'heap/B':>7}  stages")
+
+
+def print_row(r):
+    unit = "MB/s" if "mb_per_s" in r else "items/s"
+    rss = f"{r['peak_rss_bytes'] / MB:.1f}" if r.get("peak_rss_bytes") else "n/a"
+    heap = f"{r['heap_per_input_byte']:.3f}" if "heap_per_input_byte" in r else "-"
+    stages = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in r.get("stages", {}).items())
+    if "ratio" in r:
+        per_level = " ".join(f"L{lvl}:{v['ratio']:.3f}@{v['mb_per_s']:.1f}" for lvl, v in r["levels"].items())
+        stages += f" level={r['level']} ratio={r['ratio']:.3f} [{per_level}]"
+    if "workers" in r:
+        stages += " " + " ".join(f"{n}T:{v['mb_per_s']:.1f}MB/s" for n, v in r["workers"].items())
+    print(f"{result_id(r):<32} {throughput(r):>13.1f} {unit:<7} {r['seconds']:>10.4f} {rss:>14} {heap:>7}  {stages}")
+
+
+def parse_sizes(text):
+    units = {"K": KB, "M": MB, "G": GB}
+    sizes = []
+    for item in text.split(","):
+        item = item.strip().upper().rstrip("B")
+        sizes.append(int(item[:-1]) * units[item[-1]] if item[-1] in units else int(item))
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the encrypt-bin build pipeline.")
+    parser.add_argument("--quick", action="store_true", help="Small sizes only (64K-16M images, 10-10k keys)")
+    parser.add_argument("--cases", help=f"Comma-separated subset of cases ({', '.join(CASES)})")
+    parser.add_argument("--sizes", type=parse_sizes, help="Image sizes, e.g. '64K,1M,1G'")
+    parser.add_argument("--key-counts", type=lambda s: [int(x) for x in s.split(",")], help="Key file sizes, e.g. '10,1000'")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is kept (default: 3)")
+    parser.add_argument("--save", metavar="FILE", help="Write results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare with a previously saved JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed throughput drop vs baseline (default: 0.10)")
+    parser.add_argument("--worker", nargs=2, metavar=("CASE", "PARAM"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_case_in_process(args.worker[0], int(args.worker[1]))
+        return 0
+
+    sizes = args.sizes or (QUICK_IMAGE_SIZES if args.quick else FULL_IMAGE_SIZES)
+    key_counts = args.key_counts or (QUICK_KEY_COUNTS if args.quick else FULL_KEY_COUNTS)
+    selected = args.cases.split(",") if args.cases else list(CASES)
+
+    results = []
+    print_header()
+    for name in selected:
+        for param in sizes if name in IMAGE_CASES else key_counts:
+            if name in COMPRESSION_CASES and param > COMPRESSION_MAX_SIZE:
+                continue
+            results.append(run_case(name, param, args.repeat))
+            print_row(results[-1])
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for msg in regressions:
+            print(f"REGRESSION {msg}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,128 @@
+import os
+import sys
+
+from encrypt_bin.cli.commands import COMMANDS
 from encrypt_bin.cli.parser import get_parsed_args
 from encrypt_bin.core.config import Config
-from encrypt_bin.core.builder import generate_bin
+from encrypt_bin.core.builder import generate_bin, image_size
+from encrypt_bin.core.delta import generate_delta_bin
+from encrypt_bin.core.output import DEFAULT_FSYNC, DEFAULT_WRITE_BUFFER_SIZE
+from encrypt_bin.core.timing import StageTimings
+from encrypt_bin.errors import BuildError, EncryptBinError
 
 
 def main():
+    """CLI entry point; the only place where encrypt-bin errors become an exit status."""
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+            COMMANDS[sys.argv[1]](sys.argv[2:])
+        else:
+            _build_from_args()
+    except EncryptBinError as e:
+        sys.exit(f"Error: {e}")
+
+
+def _build_from_args():
+    """Runs the default single-image build described by the command line."""
     args = get_parsed_args()
     config = Config.from_args(args)
 
     print("Parameters loaded successfully:")
     config.print_summary()
 
+    timings = StageTimings() if getattr(args, "timings", None) is not None else None
+    profiler = None
+    if getattr(args, "profile", None):
+        import cProfile
+
+        profiler = cProfile.Profile()
+
     # Generate the binary file
+    prev_input = getattr(args, "prev_input", None)
+    build_params = dict(
+        input_path=config.input_path,
+        output_path=config.output_path,
+        product_id=config.device_id,
+        app_version=config.app_version,
+        prev_app_version=config.prev_app_version,
+        bootloader_id=config.bootloader_id,
+        key=config.key,
+        page_length=config.page_length,
+        timings=timings,
+        compression=getattr(args, "compress", None),
+        compression_level=getattr(args, "compress_level", None),
+        fsync=getattr(args, "fsync", DEFAULT_FSYNC),
+        write_buffer_size=getattr(args, "write_buffer", DEFAULT_WRITE_BUFFER_SIZE // 1024) * 1024,
+    )
+    if getattr(args, "segment_size", None) is not None:
+        build_params["segment_size"] = args.segment_size
+    if getattr(args, "deterministic_iv", False):
+        build_params.update(deterministic_iv=True, iv_key=args.iv_key)
     try:
-        generate_bin(
-            input_path=config.input_path,
-            output_path=config.output_path,
-            product_id=config.device_id,
-            app_version=config.app_version,
-            prev_app_version=config.prev_app_version,
-            bootloader_id=config.bootloader_id,
-            key=config.key,
-            page_length=config.page_length,
-        )
-        print(f"\nOutput file '{config.output_path}' generated successfully.")
+        if profiler:
+            profiler.enable()
+        result = _build(args, build_params)
+        outcome = "taken from the build cache" if result is True else "generated successfully"
+        print(f"\nOutput file '{config.output_path}' {outcome}.")
+    except EncryptBinError:
+        raise
     except Exception as e:
-        print(f"\nError while generating the output file: {e}")
+        raise BuildError(f"cannot generate the output file: {e}") from e
+    finally:
+        if profiler:
+            profiler.disable()
+
+    if prev_input:
+        _print_delta_summary(result)
+    elif build_params["compression"]:
+        _print_compression_summary(config)
+    _report_instrumentation(args, timings, profiler)
+
+
+def _build(args, build_params):
+    """Runs the build selected on the command line.
+
+    Returns the DeltaSummary of a delta build, whether the image came from the build
+    cache for cached builds, and None otherwise.
+    """
+    prev_input = getattr(args, "prev_input", None)
+    if prev_input:
+        return generate_delta_bin(prev_input, **build_params)
+    if getattr(args, "cache", None):
+        return _open_cache(args).generate_bin(**build_params)
+    generate_bin(**build_params)
+    return None
+
+
+def _open_cache(args):
+    """Returns the BuildCache selected on the command line."""
+    from encrypt_bin.core.cache import BuildCache
+
+    return BuildCache(args.cache, max_bytes=args.cache_size * 1024 * 1024, hardlink=args.cache_hardlink)
+
+
+def _print_delta_summary(delta):
+    """Prints how much smaller the delta image is than a full image."""
+    print(f"\nDelta image: {delta.changed_pages} of {delta.total_pages} pages changed")
+    print(f" Full image size:     {delta.full_size} bytes")
+    print(f" Delta image size:    {delta.delta_size} bytes ({delta.reduction:.1%} smaller)")
+
+
+def _print_compression_summary(config):
+    """Prints the size of the compressed image compared with an uncompressed one."""
+    full_size = image_size(os.path.getsize(config.input_path), config.page_length)
+    size = os.path.getsize(config.output_path)
+    print(f"\nCompressed image size: {size} bytes (uncompressed: {full_size} bytes, {1 - size / full_size:.1%} smaller)")
+
+
+def _report_instrumentation(args, timings, profiler):
+    """Prints/saves the stage timings and profile requested on the command line."""
+    if timings is not None:
+        print("\nStage timings:")
+        timings.print_summary()
+        if args.timings:
+            timings.save_json(args.timings)
+            print(f"Timing trace written to '{args.timings}'.")
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to '{args.profile}'.")
@@ -0,0 +1,199 @@
+"""Entry points of the CLI commands other than the default single build.
+
+Each command imports the core modules it needs when it runs, so that starting the
+CLI (or printing its help) does not pay for the other commands' dependencies.
+"""
+
+import json
+import os
+import sys
+import time
+
+from encrypt_bin.cli.subparsers import get_batch_args, get_manifest_args, get_rewrap_args, get_serve_args, get_shard_keys_args, get_verify_args
+from encrypt_bin.errors import BuildError, EncryptBinError, KeyFileError, KeyNotFoundError
+
+
+def run_batch(argv):
+    """Builds one image per device of a key file (or of --device-ids with --master-key) and prints a single summary."""
+    from encrypt_bin.core.batch import build_batch
+
+    args = get_batch_args(argv)
+    if args.master_key:
+        from encrypt_bin.cli.utils import load_master_key
+        from encrypt_bin.core.kdf import DerivedKeys
+
+        keys = DerivedKeys(load_master_key(args.master_key), cache_size=0).derive_many(args.device_ids)
+    else:
+        keys = _load_batch_keys(args.key_file, args.key_index, args.device_ids)
+
+    start = time.perf_counter()
+    results = build_batch(
+        input_path=args.input,
+        keys=keys,
+        output_template=args.output,
+        app_version=args.app_version,
+        prev_app_version=args.prev_app_version,
+        bootloader_id=args.bootloader_id,
+        page_length=args.page_length,
+        max_workers=args.jobs,
+        fsync=args.fsync,
+        write_buffer_size=args.write_buffer * 1024,
+    )
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if not r.ok]
+    for r in failed:
+        print(f"Error for device 0x{r.device_id:016X} ('{r.output_path}'): {r.error}")
+    print(f"\nBatch finished in {elapsed:.2f} s: {len(results) - len(failed)} of {len(results)} images generated successfully.")
+    if failed:
+        sys.exit(1)
+
+
+def _load_batch_keys(key_file, key_index, device_ids):
+    """Returns {device_id: key} for every entry of a key file, or only for device_ids."""
+    from encrypt_bin.cli.keystore import KeyStore
+
+    store = KeyStore.open(key_file, key_index)
+    if device_ids is None:
+        keys = dict(store.items())
+        if not keys:
+            raise KeyFileError(f"no keys found in file '{key_file}'.")
+        return keys
+
+    keys = {device_id: store.get(device_id) for device_id in device_ids}
+    missing = [hex(device_id) for device_id, key in keys.items() if key is None]
+    if missing:
+        shown = ", ".join(missing[:5]) + (f" and {len(missing) - 5} more" if len(missing) > 5 else "")
+        raise KeyNotFoundError(f"could not find keys for device_id(s) {shown} in file '{key_file}'.")
+    return keys
+
+
+def run_manifest(argv):
+    """Builds every target of a manifest file and optionally writes a JSON report."""
+    from encrypt_bin.cli.manifest import load_manifest
+    from encrypt_bin.core.manifest import build_manifest
+
+    args = get_manifest_args(argv)
+    try:
+        targets = load_manifest(args.manifest)
+    except EncryptBinError as e:
+        if args.report:
+            # Nothing was built; the report lists why, so pipelines reading it see the failure
+            errors = getattr(e, "errors", [str(e)])
+            _write_report(args.report, {"ok": False, "targets": 0, "failed": 0, "seconds": 0.0, "inputs": [], "results": [], "errors": errors})
+        raise
+    report = build_manifest(targets, max_workers=args.jobs, fsync=args.fsync, write_buffer_size=args.write_buffer * 1024)
+
+    for r in report.failed:
+        print(f"Error for target '{r.name}' ('{r.output_path}'): {r.error}")
+    if args.report:
+        _write_report(args.report, report.as_dict())
+    ok = len(report.results) - len(report.failed)
+    print(
+        f"\nManifest finished in {report.seconds:.2f} s: {ok} of {len(report.results)} images generated successfully "
+        f"from {len(report.inputs)} input file(s)."
+    )
+    if report.failed:
+        sys.exit(1)
+
+
+def _write_report(path: str, report: dict):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def run_rewrap(argv):
+    """Changes header fields of an existing image, reusing its encrypted payload."""
+    from encrypt_bin.core.builder import rewrap_header
+
+    args = get_rewrap_args(argv)
+    try:
+        rewrap_header(
+            input_path=args.input,
+            output_path=args.output,
+            bootloader_id=args.bootloader_id,
+            app_version=args.app_version,
+            prev_app_version=args.prev_app_version,
+        )
+    except (OSError, ValueError) as e:
+        raise BuildError(f"cannot rewrite the header: {e}") from e
+    print(f"Output file '{args.output or args.input}' updated successfully.")
+
+
+def _collect_bin_files(paths):
+    """Expands directories in paths to the .bin files they contain."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, _, names in sorted(os.walk(path)):
+            files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(".bin"))
+    return files
+
+
+def run_verify(argv):
+    """Verifies images and prints one line per file plus a summary."""
+    from encrypt_bin.cli.keystore import open_key_provider
+    from encrypt_bin.core.verifier import verify_many
+
+    args = get_verify_args(argv)
+    get_key = args.key if args.key is not None else open_key_provider(args.key_file, args.key_index, args.master_key).get
+    files = _collect_bin_files(args.paths)
+
+    results = verify_many(files, get_key, max_workers=args.jobs)
+
+    failed = 0
+    for r in results:
+        if r.ok:
+            print(f"OK    {r.path} (device 0x{r.header.device_id:016X}, app version 0x{r.header.app_version:X})")
+        else:
+            failed += 1
+            print(f"FAIL  {r.path}: {r.error}")
+    print(f"\nVerified {len(results)} file(s): {len(results) - failed} OK, {failed} failed.")
+    if failed or not results:
+        sys.exit(1)
+
+
+def run_serve(argv):
+    """Runs the build server until it is interrupted."""
+    from encrypt_bin.cli.server import BuildServer, read_token, serve
+
+    args = get_serve_args(argv)
+    defaults = {
+        "key_file": args.key_file,
+        "key_index": args.key_index,
+        "bootloader_id": args.bootloader_id,
+        "app_version": args.app_version,
+        "prev_app_version": args.prev_app_version,
+        "page_length": args.page_length,
+        "compress": args.compress,
+        "compress_level": args.compress_level,
+    }
+    token = read_token(args.token_file) if args.token_file else None
+    server = BuildServer(defaults, max_workers=args.jobs, token=token)
+    if args.key_file:
+        # Parse the key file (and build its index) before the first request arrives
+        store = server.key_store(args.key_file, args.key_index)
+        print(f"Loaded {len(store)} key(s) from '{args.key_file}'.")
+    serve(server, socket_path=args.socket, port=args.port)
+
+
+def run_shard_keys(argv):
+    """Converts a flat key file into a shard directory."""
+    from encrypt_bin.cli.keystore import shard_key_file
+
+    args = get_shard_keys_args(argv)
+    start = time.perf_counter()
+    store = shard_key_file(args.key_file, args.directory, args.prefix_bits)
+    print(f"Wrote {len(store)} key(s) to '{args.directory}' ({args.prefix_bits} prefix bits) in {time.perf_counter() - start:.2f} s.")
+
+
+COMMANDS = {
+    "batch": run_batch,
+    "manifest": run_manifest,
+    "rewrap": run_rewrap,
+    "serve": run_serve,
+    "shard-keys": run_shard_keys,
+    "verify": run_verify,
+}
@@ -0,0 +1,346 @@
+"""Key providers – indexed key files and derived keys behind one lookup interface.
+
+A key provider is any object with get(device_id) returning the 16-byte key of a
+device, or None if the device is unknown: KeyStore (a parsed key file), KeyIndex (its
+memory-mapped binary index), ShardedKeyStore (a directory of per-prefix indexes) and
+encrypt_bin.core.kdf.DerivedKeys (keys derived from a master key). open_key_provider
+returns the one selected on the command line.
+
+A shard directory (written by shard_key_file) splits the keys by the top prefix_bits
+bits of the 64-bit device ID. Every shard is a binary index file named after its
+prefix in hex (e.g. 00a0.idx), and shards.idx records the key file the shards were
+made from and lists the prefixes present:
+
+    magic "EBKS" | version (u16) | prefix bits (u16) | shard count (u64)
+    source mtime_ns (i64) | source size (u64) | source path length (u16) | source path (UTF-8)
+    shard count x (prefix (u64), key count (u64)), sorted by prefix
+
+Opening the directory fails while the recorded key file exists but has changed since,
+so a key added after sharding is not silently reported as missing.
+
+Shards are only mapped when a device of their prefix is looked up, so memory use
+follows the devices requested rather than the size of the fleet.
+"""
+
+import mmap
+import os
+import struct
+from typing import NamedTuple
+
+from encrypt_bin.cli.utils import iter_key_file, load_master_key, stat_key_file
+from encrypt_bin.core.output import atomic_output
+from encrypt_bin.errors import KeyFileError
+
+# Binary index layout: header followed by fixed-size records sorted by device ID.
+INDEX_MAGIC = b"EBKI"
+INDEX_VERSION = 1
+_INDEX_HEADER = struct.Struct("<4sHHqQQ")  # magic, version, reserved, source mtime_ns, source size, record count
+_INDEX_RECORD = struct.Struct("<Q16s")  # device_id, key
+
+SHARD_INDEX_NAME = "shards.idx"
+SHARD_MAGIC = b"EBKS"
+SHARD_VERSION = 2
+DEFAULT_PREFIX_BITS = 16
+# magic, version, prefix bits, shard count, source mtime_ns, source size, source path length
+_SHARD_HEADER = struct.Struct("<4sHHQqQH")
+_SHARD_RECORD = struct.Struct("<QQ")  # prefix, key count
+
+
+def _write_private_file(path: str, data):
+    """Writes data to path atomically, readable by the owner only (the files hold keys).
+
+    Every writer uses its own temporary file, so processes rebuilding the same index
+    concurrently do not interfere; the last complete one wins.
+    """
+    try:
+        with atomic_output(path, size=len(data), mode=0o600) as f:
+            f.write(data)
+    except OSError as e:
+        raise KeyFileError(f"cannot write key index: {e}") from e
+
+
+def _write_index(index_path: str, items, mtime_ns: int = 0, size: int = 0):
+    """Writes a binary index of (device_id, key) pairs sorted by device ID, stamped with a source mtime and size."""
+    buf = bytearray(_INDEX_HEADER.size + _INDEX_RECORD.size * len(items))
+    _INDEX_HEADER.pack_into(buf, 0, INDEX_MAGIC, INDEX_VERSION, 0, mtime_ns, size, len(items))
+    offset = _INDEX_HEADER.size
+    for device_id, key in items:
+        _INDEX_RECORD.pack_into(buf, offset, device_id, key)
+        offset += _INDEX_RECORD.size
+    _write_private_file(index_path, buf)
+
+
+class KeyStore:
+    """In-memory mapping of device IDs to 16-byte keys."""
+
+    def __init__(self, keys=None, source=None):
+        self._keys = dict(keys or {})
+        self.source = source
+
+    @classmethod
+    def from_file(cls, key_file_path: str):
+        """Parses a whole key file once. Raises KeyFileError on conflicting entries for the same device ID."""
+        keys = {}
+        first_line = {}
+        for line_no, device_id, key in iter_key_file(key_file_path):
+            if device_id in keys:
+                if keys[device_id] != key:
+                    raise KeyFileError(
+                        f"conflicting keys for device_id {hex(device_id)} in file '{key_file_path}' "
+                        f"(lines {first_line[device_id]} and {line_no})."
+                    )
+                print(f"Warning: duplicate entry for device_id {hex(device_id)} in file '{key_file_path}' (line {line_no}).")
+                continue
+
+            keys[device_id] = key
+            first_line[device_id] = line_no
+
+        return cls(keys, source=key_file_path)
+
+    @classmethod
+    def open(cls, key_file_path: str, index_path: str = None):
+        """Returns a key store for key_file_path, using the binary index at index_path if given.
+
+        The index is only trusted while the key file's mtime and size match the values
+        recorded in it; otherwise the key file is parsed again and the index rebuilt.
+        A shard directory opens as a ShardedKeyStore (index_path is then not used).
+        """
+        if os.path.isdir(key_file_path):
+            return ShardedKeyStore.open(key_file_path)
+        if index_path is None:
+            return cls.from_file(key_file_path)
+
+        st = stat_key_file(key_file_path)
+        index = KeyIndex.load(index_path, st)
+        if index is not None:
+            return index
+
+        store = cls.from_file(key_file_path)
+        store.save_index(index_path, st)
+        return KeyIndex.load(index_path, st) or store
+
+    def get(self, device_id: int):
+        """Returns the key for device_id, or None if it is not in the store."""
+        return self._keys.get(device_id)
+
+    def items(self):
+        """Returns (device_id, key) pairs sorted by device ID."""
+        return sorted(self._keys.items())
+
+    def __contains__(self, device_id):
+        return device_id in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def save_index(self, index_path: str, source_stat=None):
+        """Writes a binary index sorted by device ID, stamped with the key file's mtime and size."""
+        if source_stat is None:
+            source_stat = stat_key_file(self.source)
+        _write_index(index_path, self.items(), source_stat.st_mtime_ns, source_stat.st_size)
+
+
+class KeyIndex:
+    """Read-only key store backed by a memory-mapped binary index (binary search per lookup)."""
+
+    def __init__(self, mm, count):
+        self._mm = mm
+        self._count = count
+
+    @classmethod
+    def load(cls, index_path: str, source_stat=None):
+        """Maps an index file; returns None if it is missing, malformed or stale for source_stat."""
+        try:
+            with open(index_path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(mm) < _INDEX_HEADER.size:
+            mm.close()
+            return None
+
+        magic, version, _, mtime_ns, size, count = _INDEX_HEADER.unpack_from(mm, 0)
+        valid = magic == INDEX_MAGIC and version == INDEX_VERSION and len(mm) == _INDEX_HEADER.size + count * _INDEX_RECORD.size
+        if valid and source_stat is not None:
+            valid = mtime_ns == source_stat.st_mtime_ns and size == source_stat.st_size
+        if not valid:
+            mm.close()
+            return None
+
+        return cls(mm, count)
+
+    def _record(self, i):
+        return _INDEX_RECORD.unpack_from(self._mm, _INDEX_HEADER.size + i * _INDEX_RECORD.size)
+
+    def get(self, device_id: int):
+        """Returns the key for device_id, or None if it is not in the index."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_id, key = self._record(mid)
+            if mid_id == device_id:
+                return key
+            if mid_id < device_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def items(self):
+        """Returns (device_id, key) pairs sorted by device ID."""
+        return [self._record(i) for i in range(self._count)]
+
+    def __contains__(self, device_id):
+        return self.get(device_id) is not None
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._mm.close()
+
+
+class _SourceStamp(NamedTuple):
+    """The mtime and size of the key file a shard directory was made from (as in os.stat_result)."""
+
+    st_mtime_ns: int
+    st_size: int
+
+
+class ShardedKeyStore:
+    """Read-only key store over a shard directory; each shard is memory-mapped on first use.
+
+    shards.idx records the path, mtime and size of the key file the shards were made
+    from. open rejects the directory while that key file exists with a different mtime
+    or size; a key file that is absent (e.g. shards deployed without it) is not checked.
+    Every shard carries the same stamps and is only used while they match shards.idx.
+    """
+
+    def __init__(self, directory: str, prefix_bits: int, counts: dict, source: str = None, source_stamp=None):
+        self.directory = directory
+        self.prefix_bits = prefix_bits
+        self.source = source
+        self._counts = counts
+        self._source_stamp = source_stamp
+        self._shards = {}
+
+    @classmethod
+    def open(cls, directory: str):
+        """Reads the shard list of directory.
+
+        Raises KeyFileError if it is missing or malformed, or older than its key file.
+        """
+        index_path = os.path.join(directory, SHARD_INDEX_NAME)
+        stat_key_file(index_path)
+        try:
+            with open(index_path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            raise KeyFileError(f"cannot read key shard index: {e}") from e
+
+        valid = len(data) >= _SHARD_HEADER.size
+        if valid:
+            magic, version, prefix_bits, count, mtime_ns, size, path_length = _SHARD_HEADER.unpack_from(data)
+            valid = magic == SHARD_MAGIC and version == SHARD_VERSION and 0 < prefix_bits <= 32
+            records = _SHARD_HEADER.size + path_length
+            valid = valid and len(data) == records + count * _SHARD_RECORD.size
+        if not valid:
+            raise KeyFileError(f"'{index_path}' is not a valid key shard index (run shard-keys again).")
+        source = bytes(data[_SHARD_HEADER.size : records]).decode("utf-8", "replace")
+        _check_source(directory, source, mtime_ns, size)
+        counts = dict(_SHARD_RECORD.iter_unpack(memoryview(data)[records:]))
+        return cls(directory, prefix_bits, counts, source, _SourceStamp(mtime_ns, size))
+
+    def shard_path(self, prefix: int) -> str:
+        """Returns the path of the shard holding the devices with the given ID prefix."""
+        return os.path.join(self.directory, f"{prefix:0{-(-self.prefix_bits // 4)}x}.idx")
+
+    def _shard(self, prefix: int):
+        shard = self._shards.get(prefix)
+        if shard is None:
+            path = self.shard_path(prefix)
+            shard = KeyIndex.load(path, self._source_stamp)
+            if shard is None or len(shard) != self._counts[prefix]:
+                raise KeyFileError(f"key shard '{path}' is missing or does not match '{SHARD_INDEX_NAME}' (run shard-keys again).")
+            self._shards[prefix] = shard
+        return shard
+
+    def get(self, device_id: int):
+        """Returns the key for device_id, or None if it is not in the store (only its shard is loaded)."""
+        prefix = device_id >> (64 - self.prefix_bits)
+        if prefix not in self._counts:
+            return None
+        return self._shard(prefix).get(device_id)
+
+    def items(self):
+        """Returns (device_id, key) pairs sorted by device ID (loads every shard)."""
+        return [item for prefix in sorted(self._counts) for item in self._shard(prefix).items()]
+
+    def loaded_shards(self) -> int:
+        """Returns the number of shards mapped so far."""
+        return len(self._shards)
+
+    def __contains__(self, device_id):
+        return self.get(device_id) is not None
+
+    def __len__(self):
+        return sum(self._counts.values())
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+        self._shards.clear()
+
+
+def _check_source(directory: str, source: str, mtime_ns: int, size: int):
+    """Raises KeyFileError if the key file a shard directory was made from has changed since."""
+    try:
+        st = os.stat(source)
+    except OSError:
+        return  # not available here; the shards are used as they are
+    if st.st_mtime_ns != mtime_ns or st.st_size != size:
+        raise KeyFileError(f"key shards in '{directory}' are older than the key file '{source}' (run shard-keys again).")
+
+
+def shard_key_file(key_file_path: str, directory: str, prefix_bits: int = DEFAULT_PREFIX_BITS) -> ShardedKeyStore:
+    """Converts a key file into a shard directory split by the top prefix_bits bits of the device ID.
+
+    The key file is parsed (and checked for conflicting entries) like by KeyStore.from_file.
+    Shards are written first and the shard list last, so a store being read is never
+    half-converted. The absolute path, mtime and size of the key file are recorded, so
+    ShardedKeyStore.open detects a key file edited after sharding.
+    """
+    if not 0 < prefix_bits <= 32:
+        raise ValueError(f"prefix bits must be between 1 and 32 (given: {prefix_bits})")
+    st = stat_key_file(key_file_path)
+    shards = {}
+    for device_id, key in KeyStore.from_file(key_file_path).items():
+        shards.setdefault(device_id >> (64 - prefix_bits), []).append((device_id, key))
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        raise KeyFileError(f"cannot create key shard directory: {e}") from e
+    source = os.path.abspath(key_file_path)
+    counts = {prefix: len(items) for prefix, items in shards.items()}
+    store = ShardedKeyStore(directory, prefix_bits, counts, source, _SourceStamp(st.st_mtime_ns, st.st_size))
+    for prefix, items in shards.items():
+        _write_index(store.shard_path(prefix), items, st.st_mtime_ns, st.st_size)
+
+    path = source.encode("utf-8")
+    buf = bytearray(_SHARD_HEADER.pack(SHARD_MAGIC, SHARD_VERSION, prefix_bits, len(shards), st.st_mtime_ns, st.st_size, len(path)))
+    buf += path
+    for prefix in sorted(shards):
+        buf += _SHARD_RECORD.pack(prefix, len(shards[prefix]))
+    _write_private_file(os.path.join(directory, SHARD_INDEX_NAME), buf)
+    return store
+
+
+def open_key_provider(key_file: str = None, key_index: str = None, master_key_file: str = None):
+    """Returns the key provider for a key file (with optional index) or a master key file."""
+    if master_key_file is not None:
+        from encrypt_bin.core.kdf import DerivedKeys
+
+        return DerivedKeys(load_master_key(master_key_file))
+    return KeyStore.open(key_file, key_index)
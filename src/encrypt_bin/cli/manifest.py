@@ -0,0 +1,162 @@
+"""Manifest files – describe many build targets with shared defaults.
+
+A manifest is a JSON or TOML file with an optional ``defaults`` table and a list of
+``targets``. Every target is the defaults overridden by its own fields; field names
+are those of the CLI options (and of the build server requests):
+
+    [defaults]
+    input = "firmware.bin"
+    key_file = "keys.txt"
+    bootloader_id = "0x10"
+    app_version = "0x1201"
+    prev_app_version = "0x1100"
+
+    [[targets]]
+    output = "out/1234.bin"
+    device_id = "0x1234"
+
+    [[targets]]
+    name = "lab board"
+    input = "firmware-debug.bin"
+    output = "out/lab.bin"
+    device_id = "0x42"
+    page_length = 4096
+
+Relative paths are resolved against the directory of the manifest.
+"""
+
+import json
+import os
+
+from encrypt_bin.cli.parser import check_page_length, parse_compress_level
+from encrypt_bin.cli.utils import parse_int, parse_key
+from encrypt_bin.cli.validators import validate_file_paths
+from encrypt_bin.core.compression import CODECS
+from encrypt_bin.core.manifest import ManifestTarget
+from encrypt_bin.errors import ConfigFileError, ConfigValidationError, EncryptBinError, ParameterError
+
+REQUIRED_FIELDS = ("input", "output", "device_id", "bootloader_id", "app_version", "prev_app_version")
+OPTIONAL_FIELDS = ("name", "key", "key_file", "key_index", "master_key", "page_length", "compress", "compress_level")
+PATH_FIELDS = ("input", "output", "key_file", "key_index", "master_key")
+
+
+def read_manifest(path: str) -> dict:
+    """Reads a JSON or TOML (by extension) manifest file and returns its raw content."""
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        if path.lower().endswith(".toml"):
+            return _load_toml(content)
+        return json.loads(content)
+    except (OSError, ValueError) as e:
+        raise ConfigFileError(f"cannot read manifest '{path}': {e}") from e
+
+
+def _load_toml(content: bytes) -> dict:
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ConfigFileError("TOML manifests need Python 3.11 or the 'tomli' package; use a JSON manifest instead.") from None
+    return tomllib.loads(content.decode("utf-8"))
+
+
+def _resolve_paths(fields: dict, base_dir: str) -> dict:
+    return {name: os.path.join(base_dir, value) if name in PATH_FIELDS and isinstance(value, str) else value for name, value in fields.items()}
+
+
+def _parse_field(value, name, max_bits):
+    """parse_int for manifest values, which may already be integers."""
+    return parse_int(value if isinstance(value, str) else str(value), name, max_bits)
+
+
+class _KeyStores:
+    """Opens every key file and master key file of a manifest once."""
+
+    def __init__(self):
+        self._providers = {}
+
+    def key(self, key_file: str, key_index: str, master_key: str, device_id: int) -> bytes:
+        from encrypt_bin.cli.keystore import open_key_provider
+
+        if (key_file, key_index, master_key) not in self._providers:
+            self._providers[key_file, key_index, master_key] = open_key_provider(key_file, key_index, master_key)
+        key = self._providers[key_file, key_index, master_key].get(device_id)
+        if key is None:
+            raise ParameterError(f"could not find key for device_id {hex(device_id)} in file '{key_file}'.")
+        return key
+
+
+def _make_target(fields: dict, label: str, key_stores: _KeyStores) -> ManifestTarget:
+    unknown = set(fields) - set(REQUIRED_FIELDS) - set(OPTIONAL_FIELDS)
+    if unknown:
+        raise ParameterError(f"unknown field(s): {', '.join(sorted(unknown))}")
+    missing = [name for name in REQUIRED_FIELDS if fields.get(name) is None]
+    if missing:
+        raise ParameterError(f"missing field(s): {', '.join(missing)}")
+
+    validate_file_paths(fields["input"], fields["output"])
+    device_id = _parse_field(fields["device_id"], "Device ID", 64)
+    if fields.get("key") is not None:
+        key = parse_key(fields["key"])
+    elif fields.get("key_file") is not None or fields.get("master_key") is not None:
+        key = key_stores.key(fields.get("key_file"), fields.get("key_index"), fields.get("master_key"), device_id)
+    else:
+        raise ParameterError("one of 'key', 'key_file' or 'master_key' is required")
+
+    codec = fields.get("compress")
+    if codec is not None and codec not in CODECS:
+        raise ParameterError(f"unknown compression codec '{codec}' (choose from {', '.join(CODECS)}).")
+    return ManifestTarget(
+        name=fields.get("name", label),
+        input_path=fields["input"],
+        output_path=fields["output"],
+        product_id=device_id,
+        app_version=_parse_field(fields["app_version"], "App version", 32),
+        prev_app_version=_parse_field(fields["prev_app_version"], "Previous app version", 32),
+        bootloader_id=_parse_field(fields["bootloader_id"], "Bootloader ID", 32),
+        key=key,
+        page_length=check_page_length(_parse_field(fields.get("page_length", 2048), "Page length", 32)),
+        compression=codec,
+        compression_level=parse_compress_level(codec, str(fields.get("compress_level", "auto"))),
+    )
+
+
+def load_manifest(path: str) -> list:
+    """Reads a manifest and returns its targets as a list of ManifestTarget.
+
+    Every target is validated (paths, numbers, key) before anything is built; all
+    problems are reported together in one ConfigValidationError.
+    """
+    manifest = read_manifest(path)
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("targets"), list) or not manifest["targets"]:
+        raise ConfigFileError(f"manifest '{path}' must contain a non-empty 'targets' list.")
+    defaults = manifest.get("defaults", {})
+    if not isinstance(defaults, dict):
+        raise ConfigFileError(f"'defaults' in manifest '{path}' must be a table.")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = _resolve_paths(defaults, base_dir)
+    key_stores = _KeyStores()
+    targets, errors, outputs = [], [], {}
+    for number, target in enumerate(manifest["targets"], 1):
+        label = f"target {number}"
+        if not isinstance(target, dict):
+            errors.append(f"{label}: must be a table.")
+            continue
+        try:
+            target = _make_target({**defaults, **_resolve_paths(target, base_dir)}, label, key_stores)
+        except EncryptBinError as e:
+            errors.append(f"{label}: {e}")
+            continue
+        output = os.path.realpath(target.output_path)
+        if output in outputs:
+            errors.append(f"{label}: output '{target.output_path}' is also written by {outputs[output]}.")
+        outputs.setdefault(output, label)
+        targets.append(target)
+
+    if errors:
+        raise ConfigValidationError(errors)
+    return targets
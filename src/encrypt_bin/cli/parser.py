@@ -1,13 +1,27 @@
 """Module for handling CLI arguments and requirements file."""
 
 import argparse
-import sys
 import shlex
-from encrypt_bin.cli.validators import validate_file_paths
+from encrypt_bin.cli.validators import validate_file_paths, validate_input_file
+from encrypt_bin.core.compression import CODECS
+from encrypt_bin.core.output import DEFAULT_FSYNC, DEFAULT_WRITE_BUFFER_SIZE, FSYNC_POLICIES
 from encrypt_bin.cli.utils import (
     parse_int,
     parse_key,
     find_key_in_file,
+    load_iv_key,
+    load_master_key,
+)
+from encrypt_bin.errors import ConfigFileError, ConfigValidationError, EncryptBinError, ParameterError
+
+COMMANDS_EPILOG = (
+    "Other commands (run '<command> -h' for details):\n"
+    "  batch    encrypt one firmware image for every device in a key file\n"
+    "  manifest build every target listed in a JSON/TOML manifest file\n"
+    "  rewrap   change version fields of an existing image without re-encrypting it\n"
+    "  serve    keep key files loaded and serve JSON build requests on a local socket\n"
+    "  shard-keys split a key file into per-prefix shards that are loaded on demand\n"
+    "  verify   decrypt generated images and check their header and CRC32\n"
 )
 
 
@@ -18,13 +32,13 @@ def load_requirements_file(path):
             content = f.read()
         args = shlex.split(content, comments=True)
     except Exception as e:
-        sys.exit(f"Error reading requirements file: {e}")
+        raise ConfigFileError(f"cannot read requirements file: {e}") from e
     return args
 
 
 def merge_args(file_args, cli_args):
     """Merges arguments from the requirements file and CLI.
-    If the same flag appears with different values, the program exits with an error.
+    If the same flag appears with different values, ConfigFileError is raised.
     """
 
     def args_to_dict(args_list):
@@ -36,7 +50,7 @@ def merge_args(file_args, cli_args):
                 d[key] = None
             else:
                 if key is None:
-                    sys.exit(f"Error: invalid parameter syntax ({arg})")
+                    raise ConfigFileError(f"invalid parameter syntax ({arg})")
                 d[key] = arg
                 key = None
         return d
@@ -46,8 +60,8 @@ def merge_args(file_args, cli_args):
 
     for flag in file_dict:
         if flag in cli_dict and file_dict[flag] != cli_dict[flag]:
-            sys.exit(
-                f"Error: flag '{flag}' appears in both file and CLI with different values:\n"
+            raise ConfigFileError(
+                f"flag '{flag}' appears in both file and CLI with different values:\n"
                 f" - from file:     {file_dict[flag]}\n"
                 f" - from terminal: {cli_dict[flag]}"
             )
@@ -56,6 +70,140 @@ def merge_args(file_args, cli_args):
     return merged
 
 
+def positive_int(value: str) -> int:
+    """argparse type for counts such as --jobs: an integer of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer (given: {value})")
+    return number
+
+
+def add_build_arguments(parser):
+    """Adds the header and page-layout arguments shared by all build commands."""
+    parser.add_argument(
+        "-b",
+        "--bootloader-id",
+        required=True,
+        metavar="ID",
+        help="Bootloader ID (uint16, decimal or hex, e.g. 0x00001234)",
+    )
+
+    parser.add_argument(
+        "-v",
+        "--app-version",
+        required=True,
+        metavar="VER",
+        help="Application version (uint32, decimal or hex, e.g. 0x20250103)",
+    )
+    parser.add_argument(
+        "-p",
+        "--prev-app-version",
+        required=True,
+        metavar="VER",
+        help="Previous application version (uint32, decimal or hex, e.g. 0x20241231)",
+    )
+    parser.add_argument(
+        "-l",
+        "--page-length",
+        default=2048,
+        type=int,
+        metavar="BYTES",
+        help="Flash page size in bytes. Defines the size of a Flash memory page in the target microcontroller. (default: 2048)",
+    )
+
+
+def add_output_arguments(parser):
+    """Adds the output-file arguments shared by all build commands."""
+    parser.add_argument(
+        "--fsync",
+        choices=FSYNC_POLICIES,
+        default=DEFAULT_FSYNC,
+        help="Durability of the written images, which always replace the output atomically:\n"
+        "'none' (fastest), 'file' (data flushed before the rename, default) or\n"
+        "'full' (also flushes the directory, so the rename itself is durable)",
+    )
+    parser.add_argument(
+        "--write-buffer",
+        type=int,
+        default=DEFAULT_WRITE_BUFFER_SIZE // 1024,
+        metavar="KB",
+        help=f"Size of the output write buffer (default: {DEFAULT_WRITE_BUFFER_SIZE // 1024})",
+    )
+
+
+def collect(errors, func, *args):
+    """Returns func(*args); an EncryptBinError is appended to errors (and None returned) instead."""
+    try:
+        return func(*args)
+    except EncryptBinError as e:
+        errors.append(str(e))
+        return None
+
+
+def check_page_length(page_length):
+    """Returns page_length if it is a positive multiple of the AES block size (16 bytes)."""
+    if page_length <= 0 or page_length % 16:
+        raise ParameterError(f"page length must be a positive multiple of 16 bytes (given: {page_length})")
+    return page_length
+
+
+def parse_build_integers(args, errors):
+    """Converts the header arguments added by add_build_arguments to validated integers.
+
+    Problems are appended to errors, so that all of them can be reported at once.
+    """
+    args.bootloader_id = collect(errors, parse_int, args.bootloader_id, "Bootloader ID", 32)
+    args.app_version = collect(errors, parse_int, args.app_version, "App version", 32)
+    args.prev_app_version = collect(errors, parse_int, args.prev_app_version, "Previous app version", 32)
+    args.page_length = collect(errors, check_page_length, args.page_length)
+
+
+def parse_compress_level(codec, level):
+    """Returns the --compress-level value as an int, or None for 'auto'."""
+    if level == "auto":
+        return None
+    level = parse_int(level, "Compression level", 8)
+    if codec and level not in CODECS[codec].levels:
+        levels = CODECS[codec].levels
+        raise ParameterError(f"{codec} compression level must be between {levels[0]} and {levels[-1]}.")
+    return level
+
+
+def _derive_key(master_key_file, device_id):
+    from encrypt_bin.core.kdf import derive_device_key
+
+    return derive_device_key(load_master_key(master_key_file), device_id)
+
+
+def _parse_keys(args, errors):
+    """Derives the key with --master-key, looks it up with --key-file or parses --key; loads --iv-key."""
+    if getattr(args, "master_key", None):
+        if args.device_id is not None:
+            args.key = collect(errors, _derive_key, args.master_key, args.device_id)
+    elif getattr(args, "key_file", None):
+        if args.device_id is not None:
+            args.key = collect(errors, find_key_in_file, args.key_file, args.device_id, args.key_index)
+    else:
+        args.key = collect(errors, parse_key, args.key)
+    if args.iv_key:
+        args.iv_key = collect(errors, load_iv_key, args.iv_key)
+
+
+def _check_option_combinations(parser, args):
+    """Rejects options that cannot be used together (exits like any other usage error)."""
+    if args.iv_key and not args.deterministic_iv:
+        parser.error("--iv-key requires --deterministic-iv")
+    if args.deterministic_iv and args.prev_input:
+        parser.error("--deterministic-iv cannot be combined with --prev-input")
+    if args.cache and args.prev_input:
+        parser.error("--cache cannot be combined with --prev-input")
+    if args.segment_size is not None and args.prev_input:
+        parser.error("--segment-size cannot be combined with --prev-input")
+
+
 def get_parsed_args(argv=None):
     """Parse and validate all CLI arguments.
 
@@ -96,6 +244,7 @@ def get_parsed_args(argv=None):
     parser = argparse.ArgumentParser(
         parents=[base_parser],
         description="Encrypts and packages binary files for device firmware updates.",
+        epilog=COMMANDS_EPILOG,
         formatter_class=argparse.RawTextHelpFormatter,
     )
 
@@ -121,13 +270,6 @@ def get_parsed_args(argv=None):
         metavar="ID",
         help="Device ID (uint64, decimal or hex, e.g. 0x0000123412341234)",
     )
-    parser.add_argument(
-        "-b",
-        "--bootloader-id",
-        required=True,
-        metavar="ID",
-        help="Bootloader ID (uint16, decimal or hex, e.g. 0x00001234)",
-    )
 
     # Key group
     key_group = parser.add_mutually_exclusive_group(required=True)
@@ -150,47 +292,108 @@ def get_parsed_args(argv=None):
         help="Path to a key mapping file containing pairs: device_id;key"
         "The script automatically looks up and uses the key matching the provided --device-id flag argument.",
     )
+    key_group.add_argument(
+        "--master-key",
+        metavar="FILE",
+        help="File with a 16-byte master key; the device key is derived from it and --device-id\n"
+        "(AES-CMAC key derivation, see encrypt_bin.core.kdf) instead of being stored in a key file.",
+    )
+    parser.add_argument(
+        "--key-index",
+        metavar="FILE",
+        help="Optional binary index of the key file for fast lookups.\n"
+        "Created on first use and rebuilt automatically when the key file changes.",
+    )
 
+    add_build_arguments(parser)
+    add_output_arguments(parser)
     parser.add_argument(
-        "-v",
-        "--app-version",
-        required=True,
-        metavar="VER",
-        help="Application version (uint32, decimal or hex, e.g. 0x20250103)",
+        "--prev-input",
+        metavar="FILE",
+        help="Previous plaintext firmware image. Builds a delta image containing only the pages\n"
+        "that changed since this image, with a manifest of their page indices.",
     )
     parser.add_argument(
-        "-p",
-        "--prev-app-version",
-        required=True,
-        metavar="VER",
-        help="Previous application version (uint32, decimal or hex, e.g. 0x20241231)",
+        "--compress",
+        choices=sorted(CODECS),
+        metavar="CODEC",
+        help=f"Compress the payload page by page before encryption ({', '.join(sorted(CODECS))})",
     )
     parser.add_argument(
-        "-l",
-        "--page-length",
-        default=2048,
+        "--compress-level",
+        default="auto",
+        metavar="N",
+        help="Compression level, or 'auto' to pick one from a measured size/time trade-off (default: auto)",
+    )
+    parser.add_argument(
+        "--segment-size",
         type=int,
         metavar="BYTES",
-        help="Flash page size in bytes. Defines the size of a Flash memory page in the target microcontroller. (default: 2048)",
+        help="Build a segmented image: the payload is split into independently chained CBC\n"
+        "segments of this size (a multiple of the page length), encrypted in parallel",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="Build cache directory. Identical builds (same input bytes, parameters and key)\n"
+        "are taken from the cache instead of being encrypted again.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        metavar="MB",
+        help="Size budget of the build cache; least recently used images are evicted (default: 1024)",
+    )
+    parser.add_argument(
+        "--cache-hardlink",
+        action="store_true",
+        help="Hard-link cached images to the output instead of copying them\n"
+        "(the output then shares its data with the cache and must not be modified in place)",
+    )
+    parser.add_argument(
+        "--deterministic-iv",
+        action="store_true",
+        help="Derive the IV from the input and all parameters (HMAC-SHA256) instead of drawing\n"
+        "it at random, so identical builds produce byte-identical images",
+    )
+    parser.add_argument(
+        "--iv-key",
+        metavar="FILE",
+        help="File with the key of the deterministic IVs (default: derived from the image key)",
+    )
+    parser.add_argument(
+        "--timings",
+        nargs="?",
+        const="",
+        metavar="FILE",
+        help="Print wall time, bytes and throughput per build stage.\n"
+        "If FILE is given, also write them with a per-chunk trace as JSON (Chrome trace-event format).",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Run the build under cProfile and write the statistics to FILE (readable with pstats/snakeviz)",
     )
 
     args = parser.parse_args(merged_args)
+    _check_option_combinations(parser, args)
 
-    # Validate file paths
-    validate_file_paths(args.input, args.output)
+    # Validate every value and report all problems together
+    errors = []
+    collect(errors, validate_file_paths, args.input, args.output)
+    if args.prev_input:
+        collect(errors, validate_input_file, args.prev_input)
 
     # Parse integers (device_id first — may be needed to locate the key)
-    args.device_id = parse_int(args.device_id, "Device ID", 64)
-    args.bootloader_id = parse_int(args.bootloader_id, "Bootloader ID", 32)
-    args.app_version = parse_int(args.app_version, "App version", 32)
-    args.prev_app_version = parse_int(args.prev_app_version, "Previous app version", 32)
-
-    # Parse the key: use --key-file if provided, otherwise parse --key
-    if getattr(args, "key_file", None):
-        # find_key_in_file returns bytes or calls sys.exit on failure
-        args.key = find_key_in_file(args.key_file, args.device_id)
-    else:
-        # parse_key returns bytes or calls sys.exit on failure
-        args.key = parse_key(args.key)
+    args.device_id = collect(errors, parse_int, args.device_id, "Device ID", 64)
+    parse_build_integers(args, errors)
+    args.compress_level = collect(errors, parse_compress_level, args.compress, args.compress_level)
+    if args.segment_size is not None and args.page_length and (args.segment_size <= 0 or args.segment_size % args.page_length):
+        errors.append(f"segment size must be a positive multiple of the page length (given: {args.segment_size})")
+
+    _parse_keys(args, errors)
 
+    if errors:
+        raise ConfigValidationError(errors)
     return args
@@ -0,0 +1,225 @@
+"""Build server – keeps key files and defaults loaded and serves JSON build requests.
+
+Clients connect to a Unix domain socket (or a localhost TCP port) and send one JSON
+object per line; every request is answered with one JSON line. Request fields use the
+names of the CLI options (``input``, ``output``, ``device_id``, ``key`` or ``key_file``,
+``bootloader_id``, ``app_version``, ``prev_app_version``, ``page_length``, ``prev_input``,
+``compress``, ``compress_level``); fields missing from a request are taken from the
+defaults the server was started with. An optional ``id`` is echoed in the response,
+so several requests can be in flight on one connection.
+
+TCP connections cannot be attributed to a local user, so a server started with a
+token answers only requests whose ``token`` field matches it (the CLI requires one
+for --port). Access to the Unix socket is governed by the socket file's permissions.
+
+    {"id": 1, "input": "fw.bin", "output": "out/1234.bin", "device_id": "0x1234"}
+    {"id": 1, "ok": true, "output": "out/1234.bin", "seconds": 0.0012}
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import signal
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from encrypt_bin.cli.parser import check_page_length, parse_compress_level
+from encrypt_bin.cli.utils import parse_int, parse_key
+from encrypt_bin.cli.validators import validate_file_paths, validate_input_file
+from encrypt_bin.core.compression import CODECS
+from encrypt_bin.errors import ParameterError, PathError
+
+REQUIRED_FIELDS = ("input", "output", "device_id", "bootloader_id", "app_version", "prev_app_version")
+# Request fields accepted besides the required ones
+OPTIONAL_FIELDS = ("id", "key", "key_file", "key_index", "page_length", "prev_input", "compress", "compress_level", "timings", "token")
+
+
+class BuildServer:
+    """Serves build requests with warm key stores and a pool of worker threads.
+
+    AES and CRC32 release the GIL on large buffers, so worker threads build several
+    images in parallel while sharing the parsed key files.
+    """
+
+    def __init__(self, defaults=None, max_workers=None, token: str = None):
+        self.defaults = {k: v for k, v in (defaults or {}).items() if v is not None}
+        self._token = token.encode() if token is not None else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._stores = {}
+        self._stores_lock = threading.Lock()
+
+    def key_store(self, key_file: str, key_index: str = None):
+        """Returns the key store of key_file, parsing it again only when the file has changed."""
+        from encrypt_bin.cli.keystore import KeyStore
+
+        st = os.stat(key_file)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._stores_lock:
+            cached = self._stores.get((key_file, key_index))
+            if cached is None or cached[0] != signature:
+                cached = (signature, KeyStore.open(key_file, key_index))
+                self._stores[(key_file, key_index)] = cached
+        return cached[1]
+
+    def _build_params(self, request: dict) -> dict:
+        """Validates a request merged with the defaults and returns the generate_bin arguments."""
+        unknown = set(request) - set(REQUIRED_FIELDS) - set(OPTIONAL_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown request field(s): {', '.join(sorted(unknown))}")
+        fields = {**self.defaults, **request}
+        missing = [name for name in REQUIRED_FIELDS if fields.get(name) is None]
+        if missing:
+            raise ValueError(f"missing request field(s): {', '.join(missing)}")
+        if fields.get("key") is None and fields.get("key_file") is None:
+            raise ValueError("either 'key' or 'key_file' is required")
+
+        validate_file_paths(fields["input"], fields["output"])
+        if fields.get("prev_input"):
+            validate_input_file(fields["prev_input"])
+        device_id = _parse_int_field(fields["device_id"], "Device ID", 64)
+        if fields.get("key") is not None:
+            key = parse_key(fields["key"])
+        else:
+            key = self.key_store(fields["key_file"], fields.get("key_index")).get(device_id)
+            if key is None:
+                raise ValueError(f"no key for device_id {hex(device_id)} in file '{fields['key_file']}'")
+
+        codec, level = fields.get("compress"), fields.get("compress_level")
+        if codec is not None and codec not in CODECS:
+            raise ParameterError(f"unknown compression codec '{codec}' (choose from {', '.join(CODECS)}).")
+        return {
+            "input_path": fields["input"],
+            "output_path": fields["output"],
+            "product_id": device_id,
+            "app_version": _parse_int_field(fields["app_version"], "App version", 32),
+            "prev_app_version": _parse_int_field(fields["prev_app_version"], "Previous app version", 32),
+            "bootloader_id": _parse_int_field(fields["bootloader_id"], "Bootloader ID", 32),
+            "key": key,
+            "page_length": check_page_length(_parse_int_field(fields.get("page_length", 2048), "Page length", 32)),
+            "compression": codec,
+            "compression_level": parse_compress_level(codec, "auto" if level is None else str(level)),
+        }
+
+    def authorized(self, request: dict) -> bool:
+        """Returns whether request carries the server's token (always true without one)."""
+        if self._token is None:
+            return True
+        token = request.get("token")
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self._token)
+
+    def build(self, request: dict) -> dict:
+        """Runs one build request and returns its JSON-serialisable response."""
+        from encrypt_bin.core.builder import generate_bin
+        from encrypt_bin.core.delta import generate_delta_bin
+        from encrypt_bin.core.timing import StageTimings
+
+        response = {"id": request["id"]} if "id" in request else {}
+        if not self.authorized(request):
+            return {**response, "ok": False, "error": "invalid or missing token"}
+        start = time.perf_counter()
+        try:
+            params = self._build_params(request)
+            timings = StageTimings() if request.get("timings") else None
+            prev_input = request.get("prev_input", self.defaults.get("prev_input"))
+            if prev_input:
+                delta = generate_delta_bin(prev_input, timings=timings, **params)
+                response["delta"] = {**delta._asdict(), "reduction": delta.reduction}
+            else:
+                generate_bin(timings=timings, **params)
+        except Exception as e:
+            return {**response, "ok": False, "error": str(e)}
+
+        response.update(ok=True, output=params["output_path"], seconds=time.perf_counter() - start)
+        if timings is not None:
+            response["timings"] = timings.summary()
+        return response
+
+    async def _respond(self, line: bytes, writer):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            response = {"ok": False, "error": f"invalid request: {e}"}
+        else:
+            response = await asyncio.get_running_loop().run_in_executor(self._executor, self.build, request)
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Answers every request line of a connection; requests run concurrently."""
+        tasks = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    tasks.append(asyncio.ensure_future(self._respond(line, writer)))
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def start(self, socket_path: str = None, host: str = "127.0.0.1", port: int = None):
+        """Starts listening on a Unix socket (socket_path) or a TCP port and returns the asyncio server."""
+        if socket_path is not None:
+            _remove_stale_socket(socket_path)
+            return await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+        return await asyncio.start_server(self.handle_connection, host=host, port=port)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _remove_stale_socket(path: str):
+    """Removes a socket left behind at path; any other kind of file is left alone."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _parse_int_field(value, name, max_bits):
+    """parse_int for JSON fields, which may already be integers."""
+    return parse_int(value if isinstance(value, str) else str(value), name, max_bits)
+
+
+def read_token(path: str) -> str:
+    """Returns the token stored in the first line of path."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            token = f.readline().strip()
+    except OSError as e:
+        raise PathError(f"cannot read token file '{path}': {e}") from e
+    if not token:
+        raise ParameterError(f"token file '{path}' is empty.")
+    return token
+
+
+def serve(server: BuildServer, socket_path: str = None, port: int = None):
+    """Runs server until it is interrupted (Ctrl+C) or receives SIGTERM."""
+
+    async def main():
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except (NotImplementedError, AttributeError):  # Windows
+            pass
+        listener = await server.start(socket_path=socket_path, port=port)
+        where = socket_path or f"127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+        print(f"encrypt-bin build server listening on {where} (Ctrl+C to stop)", flush=True)
+        async with listener:
+            await stop.wait()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if socket_path is not None:
+            _remove_stale_socket(socket_path)
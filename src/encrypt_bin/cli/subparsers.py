@@ -0,0 +1,268 @@
+"""Argument parsers of the subcommands (batch, manifest, rewrap, serve, shard-keys, verify).
+
+The options shared with the default build command are defined in
+encrypt_bin.cli.parser and reused here.
+"""
+
+import argparse
+
+from encrypt_bin.cli.parser import add_build_arguments, add_output_arguments, collect, parse_build_integers, positive_int
+from encrypt_bin.cli.utils import parse_device_ids, parse_int, parse_key
+from encrypt_bin.cli.validators import validate_file_paths, validate_input_file, validate_output_template
+from encrypt_bin.core.compression import CODECS
+from encrypt_bin.errors import ConfigValidationError
+
+
+def get_batch_args(argv=None):
+    """Parse and validate the arguments of the 'batch' command."""
+    parser = argparse.ArgumentParser(
+        prog="encrypt-bin batch",
+        description="Encrypts one firmware image for every device listed in a key file.",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        required=True,
+        metavar="FILE",
+        help="Full path to the input .bin file (including filename, e.g. ./input/firmware.bin)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        metavar="TEMPLATE",
+        help="Output-name template, expanded per device (e.g. 'out/{device_id:016X}.bin')",
+    )
+    key_group = parser.add_mutually_exclusive_group(required=True)
+    key_group.add_argument(
+        "-K",
+        "--key-file",
+        metavar="FILE",
+        help="Path to a key mapping file containing pairs: device_id;key, or a shard directory.\n"
+        "One image is built per entry (or per device of --device-ids).",
+    )
+    key_group.add_argument(
+        "--master-key",
+        metavar="FILE",
+        help="File with a 16-byte master key; the keys of the --device-ids are derived from it",
+    )
+    parser.add_argument(
+        "--device-ids",
+        metavar="LIST",
+        help="Devices to build for, e.g. '0x1000-0x10FF,0x2000' (ranges are inclusive).\n"
+        "Required with --master-key; with a key file only these devices are built.",
+    )
+    parser.add_argument(
+        "--key-index",
+        metavar="FILE",
+        help="Optional binary index of the key file for fast lookups.\n"
+        "Created on first use and rebuilt automatically when the key file changes.",
+    )
+    add_build_arguments(parser)
+    add_output_arguments(parser)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=None,
+        metavar="N",
+        help="Number of worker processes (default: number of CPUs)",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.master_key and not args.device_ids:
+        parser.error("--master-key requires --device-ids")
+
+    errors = []
+    collect(errors, validate_input_file, args.input)
+    collect(errors, validate_output_template, args.output)
+    if args.device_ids:
+        args.device_ids = collect(errors, parse_device_ids, args.device_ids)
+    parse_build_integers(args, errors)
+    if errors:
+        raise ConfigValidationError(errors)
+    return args
+
+
+def get_rewrap_args(argv=None):
+    """Parse and validate the arguments of the 'rewrap' command."""
+    parser = argparse.ArgumentParser(
+        prog="encrypt-bin rewrap",
+        description=(
+            "Rewrites the header of an existing encrypted image, reusing its payload, IV and CRC32.\n"
+            "Only the given fields are changed."
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        required=True,
+        metavar="FILE",
+        help="Previously generated encrypted .bin file",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        help="Path for the re-versioned .bin file (default: update the input file in place)",
+    )
+    parser.add_argument("-b", "--bootloader-id", metavar="ID", help="New bootloader ID (uint32, decimal or hex)")
+    parser.add_argument("-v", "--app-version", metavar="VER", help="New application version (uint32, decimal or hex)")
+    parser.add_argument("-p", "--prev-app-version", metavar="VER", help="New previous application version (uint32, decimal or hex)")
+
+    args = parser.parse_args(argv)
+
+    validate_file_paths(args.input, args.output or args.input)
+    if args.bootloader_id is None and args.app_version is None and args.prev_app_version is None:
+        parser.error("at least one of -b, -v or -p is required")
+
+    if args.bootloader_id is not None:
+        args.bootloader_id = parse_int(args.bootloader_id, "Bootloader ID", 32)
+    if args.app_version is not None:
+        args.app_version = parse_int(args.app_version, "App version", 32)
+    if args.prev_app_version is not None:
+        args.prev_app_version = parse_int(args.prev_app_version, "Previous app version", 32)
+    return args
+
+
+def get_shard_keys_args(argv=None):
+    """Parse the arguments of the 'shard-keys' command."""
+    from encrypt_bin.cli.keystore import DEFAULT_PREFIX_BITS
+
+    parser = argparse.ArgumentParser(
+        prog="encrypt-bin shard-keys",
+        description=(
+            "Splits a key file into shards by the top bits of the 64-bit device ID.\n"
+            "Pass the shard directory as --key-file; builds then only load the shards of their devices."
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument("key_file", metavar="KEY_FILE", help="Key mapping file (device_id;key)")
+    parser.add_argument("directory", metavar="DIR", help="Shard directory to write (created if needed)")
+    parser.add_argument(
+        "--prefix-bits",
+        type=int,
+        default=DEFAULT_PREFIX_BITS,
+        metavar="N",
+        help=f"Number of leading device ID bits that select the shard, 1-32 (default: {DEFAULT_PREFIX_BITS})",
+    )
+
+    args = parser.parse_args(argv)
+    if not 0 < args.prefix_bits <= 32:
+        parser.error("--prefix-bits must be between 1 and 32")
+    return args
+
+
+def get_verify_args(argv=None):
+    """Parse and validate the arguments of the 'verify' command."""
+    parser = argparse.ArgumentParser(
+        prog="encrypt-bin verify",
+        description="Decrypts generated images and checks their header and CRC32.",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="Encrypted .bin files or directories (searched recursively for .bin files)",
+    )
+    key_group = parser.add_mutually_exclusive_group(required=True)
+    key_group.add_argument("-k", "--key", metavar="HEX", help="16-byte encryption key used for all images")
+    key_group.add_argument(
+        "-K",
+        "--key-file",
+        metavar="FILE",
+        help="Key mapping file; the key is looked up by the device ID stored in each image header",
+    )
+    key_group.add_argument("--master-key", metavar="FILE", help="Master key file; keys are derived from the device ID in each header")
+    parser.add_argument("--key-index", metavar="FILE", help="Optional binary index of the key file for fast lookups")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=None,
+        metavar="N",
+        help="Number of files verified concurrently (default: number of CPUs)",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.key is not None:
+        args.key = parse_key(args.key)
+    return args
+
+
+def get_manifest_args(argv=None):
+    """Parse the arguments of the 'manifest' command."""
+    parser = argparse.ArgumentParser(
+        prog="encrypt-bin manifest",
+        description=(
+            "Builds every target of a manifest file (JSON, or TOML with Python 3.11+).\n"
+            "Targets sharing an input image read it once; all targets are built in parallel."
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument("manifest", metavar="MANIFEST", help="Manifest file with optional 'defaults' and a list of 'targets'")
+    parser.add_argument("--report", metavar="FILE", help="Write a JSON report with the status and build time of every target")
+    add_output_arguments(parser)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=None,
+        metavar="N",
+        help="Number of builds run concurrently (default: number of CPUs)",
+    )
+    return parser.parse_args(argv)
+
+
+def get_serve_args(argv=None):
+    """Parse and validate the arguments of the 'serve' command."""
+    parser = argparse.ArgumentParser(
+        prog="encrypt-bin serve",
+        description=(
+            "Runs a build server that keeps key files loaded and answers JSON build requests\n"
+            "(one object per line, fields named like the CLI options) on a local socket.\n"
+            "The options below set defaults for fields missing from a request."
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    listen_group = parser.add_mutually_exclusive_group(required=True)
+    listen_group.add_argument("--socket", metavar="PATH", help="Unix domain socket to listen on")
+    listen_group.add_argument("--port", type=int, metavar="N", help="TCP port to listen on at 127.0.0.1 (0 picks a free port); requires --token-file")
+    parser.add_argument(
+        "--token-file",
+        metavar="FILE",
+        help="File whose first line is a secret that every request must send as 'token'",
+    )
+    parser.add_argument("-K", "--key-file", metavar="FILE", help="Key mapping file, loaded at start-up and reloaded when it changes")
+    parser.add_argument("--key-index", metavar="FILE", help="Optional binary index of the key file for fast lookups")
+    parser.add_argument("-b", "--bootloader-id", metavar="ID", help="Default bootloader ID")
+    parser.add_argument("-v", "--app-version", metavar="VER", help="Default application version")
+    parser.add_argument("-p", "--prev-app-version", metavar="VER", help="Default previous application version")
+    parser.add_argument("-l", "--page-length", type=int, metavar="BYTES", help="Default flash page size in bytes (default: 2048)")
+    parser.add_argument("--compress", choices=sorted(CODECS), metavar="CODEC", help="Default compression codec")
+    parser.add_argument("--compress-level", metavar="N", help="Default compression level, or 'auto'")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=None,
+        metavar="N",
+        help="Number of builds run concurrently (default: number of CPUs + 4, capped at 32)",
+    )
+
+    args = parser.parse_args(argv)
+    if args.port is not None and args.token_file is None:
+        parser.error("--port requires --token-file: any local user can connect to a TCP port")
+
+    if args.bootloader_id is not None:
+        args.bootloader_id = parse_int(args.bootloader_id, "Bootloader ID", 32)
+    if args.app_version is not None:
+        args.app_version = parse_int(args.app_version, "App version", 32)
+    if args.prev_app_version is not None:
+        args.prev_app_version = parse_int(args.prev_app_version, "Previous app version", 32)
+    return args
@@ -1,27 +1,53 @@
 """Helper functions for parsing numeric values and encryption keys."""
 
 import re
-import sys
 import os
 
+from encrypt_bin.errors import KeyFileError, KeyNotFoundError, ParameterError
+
+_SEPARATORS = re.compile(r"[\s,]+")
+# Keys that need no per-byte parsing: 32 continuous hex digits, or 16 two-digit bytes
+_HEX_KEY = re.compile(r"(?:0x)?([0-9A-Fa-f]{32})")
+_HEX_BYTE_LIST = re.compile(r"(?:(?:0x)?[0-9A-Fa-f]{2}[\s,]+){15}(?:0x)?[0-9A-Fa-f]{2}")
+# The usual key file line, '<device_id>;<32 hex digits>' or '<device_id> <32 hex digits>' (with an optional comment)
+_KEY_LINE = re.compile(r"\s*(0[xX][0-9A-Fa-f]+|[1-9][0-9]*|0)(?:\s*;\s*|[\s,]+)((?:0x)?([0-9A-Fa-f]{32}))\s*(?:#.*)?", re.DOTALL)
+
 
 def parse_int(value, name, max_bits):
     """Converts a decimal/hex value to int and validates its range."""
     try:
         val = int(value, 0)
     except ValueError:
-        sys.exit(f"Error: {name} must be a decimal or hexadecimal number (given: {value})")
+        raise ParameterError(f"{name} must be a decimal or hexadecimal number (given: {value})") from None
 
     max_val = (1 << max_bits) - 1
     if not (0 <= val <= max_val):
-        sys.exit(f"Error: {name} exceeds uint{max_bits} range ({val})")
+        raise ParameterError(f"{name} exceeds uint{max_bits} range ({val})")
 
     return val
 
 
+def _parse_hex_key(value: str):
+    """Decodes the well-formed key formats with bytes.fromhex; returns None for anything else."""
+    match = _HEX_KEY.fullmatch(value)
+    if match:
+        return bytes.fromhex(match[1])
+    if _HEX_BYTE_LIST.fullmatch(value):
+        try:
+            return bytes.fromhex(value.replace("0x", "").replace(",", " "))
+        except ValueError:
+            return None  # non-ASCII whitespace, left to the general parser
+    return None
+
+
 def parse_key(value):
     """Parses a 16-byte hex key from various formats."""
-    cleaned = re.split(r"[\s,]+", value.strip())
+    value = value.strip()
+    key = _parse_hex_key(value)
+    if key is not None:
+        return key
+
+    cleaned = _SEPARATORS.split(value)
     bytes_list = []
 
     # Single continuous hex string (e.g. "001122...").
@@ -30,7 +56,7 @@ def parse_key(value):
         try:
             bytes_list = [int(hex_str[i : i + 2], 16) for i in range(0, len(hex_str), 2)]
         except Exception:
-            sys.exit("Error: key contains invalid hex characters.")
+            raise ParameterError("key contains invalid hex characters.") from None
     else:
         # List of bytes (e.g. "0x00", "11", "22", ...)
         for item in cleaned:
@@ -39,34 +65,45 @@ def parse_key(value):
                 try:
                     val = int(item, 16)
                 except ValueError:
-                    sys.exit(f"Error: '{item}' is not a valid hex byte.")
+                    raise ParameterError(f"'{item}' is not a valid hex byte.") from None
                 bytes_list.append(val)
 
     if len(bytes_list) != 16:
-        sys.exit(f"Error: key must be exactly 16 bytes long (got {len(bytes_list)}).")
+        raise ParameterError(f"key must be exactly 16 bytes long (got {len(bytes_list)}).")
 
     return bytes(bytes_list)
 
 
-def _read_key_file_lines(path: str) -> list[str]:
-    """Reads lines from a key file, with error handling."""
+def stat_key_file(path: str) -> os.stat_result:
+    """Stats a key file and warns if it is readable by group/other."""
     try:
         st = os.stat(path)
     except Exception as e:
-        sys.exit(f"Error reading key file: {e}")
+        raise KeyFileError(f"cannot read key file: {e}") from e
 
     if st.st_mode & 0o077:
         print(f"Warning: key file '{path}' has group/other permissions (check file security).")
 
+    return st
+
+
+def _read_key_file_lines(path: str) -> list[str]:
+    """Reads lines from a key file, with error handling."""
+    stat_key_file(path)
+
     try:
         with open(path, "r", encoding="utf-8") as f:
             return f.readlines()
     except Exception as e:
-        sys.exit(f"Error reading key file: {e}")
+        raise KeyFileError(f"cannot read key file: {e}") from e
 
 
 def _parse_key_line(line: str):
     """Parses a single key file line and returns (device_id, key_str) or None."""
+    match = _KEY_LINE.fullmatch(line)
+    if match:
+        return int(match[1], 0), match[2]
+
     # Remove comments and whitespace
     line = line.split("#", 1)[0].strip()
     if not line:
@@ -76,7 +113,7 @@ def _parse_key_line(line: str):
         left, right = line.split(";", 1)
         id_str, key_str = left.strip(), right.strip()
     else:
-        parts = re.split(r"[\s,]+", line)
+        parts = _SEPARATORS.split(line)
         if len(parts) < 2:
             return None
         id_str, key_str = parts[0], " ".join(parts[1:])
@@ -90,17 +127,55 @@ def _parse_key_line(line: str):
     return device_id, key_str.strip()
 
 
-def find_key_in_file(key_file_path: str, device_id: int) -> bytes:
+def iter_key_file(path: str):
+    """Yields (line_no, device_id, key) for every entry of a key file, in file order.
+
+    Lines in the usual fixed-width form are matched by one precompiled pattern and their
+    keys decoded with bytes.fromhex; all other lines go through the general parser, so
+    every line is accepted or skipped as by parse_key. An invalid key raises KeyFileError
+    naming the file and line.
+    """
+    match_line = _KEY_LINE.fullmatch
+    for line_no, line in enumerate(_read_key_file_lines(path), start=1):
+        match = match_line(line)
+        if match:
+            yield line_no, int(match[1], 0), bytes.fromhex(match[3])
+            continue
+        parsed = _parse_key_line(line)
+        if parsed:
+            yield line_no, parsed[0], _parse_file_key(parsed[1], path, line_no, parsed[0])
+
+
+def _parse_file_key(key_str: str, path: str, line_no: int, device_id: int) -> bytes:
+    """parse_key for a key file entry; errors name the file and line."""
+    try:
+        return parse_key(key_str)
+    except ParameterError as e:
+        raise KeyFileError(f"invalid key for device_id {hex(device_id)} in file '{path}' (line {line_no}): {e}") from e
+
+
+def find_key_in_file(key_file_path: str, device_id: int, index_path: str = None) -> bytes:
     """
     Searches for a 16-byte key for the given device_id in a key file.
     Supported formats:
       - <device_id>;<hex bytes>
       - <device_id> <hex bytes> (spaces, commas, or continuous 32-character string)
     Lines with comments (#) are ignored.
+    If index_path is given, the lookup goes through a binary index of the key file
+    (see KeyStore), which is rebuilt only when the key file changes. key_file_path may
+    also be a shard directory (see shard_key_file); only the device's shard is read.
     """
+    if index_path is not None or os.path.isdir(key_file_path):
+        from encrypt_bin.cli.keystore import KeyStore
+
+        key = KeyStore.open(key_file_path, index_path).get(device_id)
+        if key is None:
+            raise KeyNotFoundError(f"could not find key for device_id {hex(device_id)} in file '{key_file_path}'.")
+        return key
+
     lines = _read_key_file_lines(key_file_path)
 
-    for line in lines:
+    for line_no, line in enumerate(lines, start=1):
         parsed = _parse_key_line(line)
         if not parsed:
             continue
@@ -110,6 +185,42 @@ def find_key_in_file(key_file_path: str, device_id: int) -> bytes:
             continue
 
         # Validate and convert the key
-        return parse_key(key_str)
+        return _parse_file_key(key_str, key_file_path, line_no, device_id)
 
-    sys.exit(f"Error: could not find key for device_id {hex(device_id)} in file '{key_file_path}'.")
+    raise KeyNotFoundError(f"could not find key for device_id {hex(device_id)} in file '{key_file_path}'.")
+
+
+def _load_single_key(path: str, name: str) -> bytes:
+    for line in _read_key_file_lines(path):
+        line = line.split("#", 1)[0].strip()
+        if line:
+            return parse_key(line)
+    raise KeyFileError(f"no {name} found in file '{path}'.")
+
+
+def load_master_key(path: str) -> bytes:
+    """Reads a master key file: the 16-byte key in any format accepted by parse_key (# comments allowed)."""
+    return _load_single_key(path, "master key")
+
+
+def load_iv_key(path: str) -> bytes:
+    """Reads an IV key file for deterministic IVs, in the format of a master key file."""
+    return _load_single_key(path, "IV key")
+
+
+def parse_device_ids(spec: str) -> list:
+    """Parses a device ID list such as '0x10,0x20-0x2F' (ranges are inclusive) into sorted unique IDs."""
+    device_ids = set()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        first, sep, last = item.partition("-")
+        start = parse_int(first.strip(), "Device ID", 64)
+        end = parse_int(last.strip(), "Device ID", 64) if sep else start
+        if end < start:
+            raise ParameterError(f"invalid device ID range '{item}' (end is lower than start).")
+        device_ids.update(range(start, end + 1))
+    if not device_ids:
+        raise ParameterError("no device IDs given.")
+    return sorted(device_ids)
@@ -1,18 +1,40 @@
 """Functions for validating file paths and directories."""
 
 import os
-import sys
 
+from encrypt_bin.errors import PathError
 
-def validate_file_paths(input_path, output_path):
-    """Checks the existence of the input file and validity of the output path."""
+
+def validate_input_file(input_path):
+    """Checks the existence and extension of the input file."""
     if not os.path.isfile(input_path):
-        sys.exit(f"Error: input file '{input_path}' does not exist.")
+        raise PathError(f"input file '{input_path}' does not exist.")
     if not input_path.lower().endswith(".bin"):
-        sys.exit("Error: input file must have the '.bin' extension.")
+        raise PathError("input file must have the '.bin' extension.")
+
+
+def validate_file_paths(input_path, output_path):
+    """Checks the existence of the input file and validity of the output path."""
+    validate_input_file(input_path)
 
     output_dir = os.path.dirname(output_path) or "."
     if not os.path.exists(output_dir):
-        sys.exit(f"Error: output directory '{output_dir}' does not exist.")
+        raise PathError(f"output directory '{output_dir}' does not exist.")
     if not output_path.lower().endswith(".bin"):
-        sys.exit("Error: output file must have the '.bin' extension.")
+        raise PathError("output file must have the '.bin' extension.")
+
+
+def validate_output_template(template):
+    """Checks that a batch output-name template yields distinct .bin paths in an existing directory."""
+    try:
+        first, second = template.format(device_id=0), template.format(device_id=1)
+    except (KeyError, IndexError, ValueError) as e:
+        raise PathError(f"invalid output template '{template}' ({e}).") from e
+    if first == second:
+        raise PathError("output template must contain a '{device_id}' field, e.g. 'out/{device_id:016X}.bin'.")
+
+    output_dir = os.path.dirname(first) or "."
+    if not os.path.exists(output_dir):
+        raise PathError(f"output directory '{output_dir}' does not exist.")
+    if not first.lower().endswith(".bin"):
+        raise PathError("output file must have the '.bin' extension.")
@@ -0,0 +1,91 @@
+"""asyncio front end of the builder – runs builds off the event loop with bounded concurrency."""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from encrypt_bin.core.batch import BatchResult
+from encrypt_bin.core.builder import BuildCancelled, generate_bin
+
+
+class _NoLimit:
+    """Async context manager standing in for a semaphore when concurrency is not limited."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+_NO_LIMIT = _NoLimit()
+
+
+def _cancellable(progress, cancelled: threading.Event):
+    """Wraps a progress callback so that the build stops once cancelled is set."""
+
+    def check(stage, done):
+        if cancelled.is_set():
+            raise BuildCancelled()
+        if progress is not None:
+            progress(stage, done)
+
+    return check
+
+
+async def generate_bin_async(
+    input_path: str,
+    output_path: str,
+    *args,
+    executor=None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    **kwargs,
+):
+    """Awaitable generate_bin; takes the same arguments and produces the same image.
+
+    The whole build – reading, CRC32, AES and writing – runs in executor (default: the
+    loop's thread pool; AES and CRC32 release the GIL, so threads build in parallel).
+    A semaphore bounds the number of builds running at once. If the awaiting task is
+    cancelled, a thread-based build stops at its next chunk and removes its output.
+    A progress callback is invoked from the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    cancelled = threading.Event()
+    if not isinstance(executor, ProcessPoolExecutor):
+        kwargs["progress"] = _cancellable(kwargs.get("progress"), cancelled)
+    call = functools.partial(generate_bin, input_path, output_path, *args, **kwargs)
+
+    async with semaphore if semaphore is not None else _NO_LIMIT:
+        future = loop.run_in_executor(executor, call)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancelled.set()
+            # Let the worker notice the cancellation and clean up before propagating it
+            try:
+                await future
+            except BuildCancelled:
+                pass
+            raise
+
+
+async def generate_batch_async(jobs, max_concurrency: Optional[int] = None, executor=None) -> list:
+    """Runs many builds concurrently and returns one BatchResult per job, in order.
+
+    Each job is a dict of generate_bin keyword arguments. At most max_concurrency builds
+    (default: number of CPUs) run at once. Failures are reported in the results
+    instead of cancelling the other builds.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or os.cpu_count() or 1)
+
+    async def run(job):
+        try:
+            await generate_bin_async(executor=executor, semaphore=semaphore, **job)
+        except Exception as e:
+            return BatchResult(job["product_id"], job["output_path"], str(e))
+        return BatchResult(job["product_id"], job["output_path"])
+
+    return list(await asyncio.gather(*(run(job) for job in jobs)))
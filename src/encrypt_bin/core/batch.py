@@ -0,0 +1,85 @@
+"""Batch builds – encrypts one firmware image for many devices in parallel."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+from encrypt_bin.core.builder import image_size, write_image
+from encrypt_bin.core.output import DEFAULT_FSYNC, DEFAULT_WRITE_BUFFER_SIZE, atomic_output
+
+# Plaintext image shared by all jobs of a worker process, set once by _init_worker.
+_payload = b""
+
+
+class BatchResult(NamedTuple):
+    """Outcome of building the image for a single device."""
+
+    device_id: int
+    output_path: str
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def format_output_path(template: str, device_id: int) -> str:
+    """Expands an output-name template such as 'out/{device_id:016X}.bin'."""
+    return template.format(device_id=device_id)
+
+
+def _init_worker(payload: bytes):
+    global _payload
+    _payload = payload
+
+
+def _build_one(job):
+    device_id, key, output_path, params, output_options = job
+    try:
+        with atomic_output(output_path, image_size(len(_payload), params["page_length"]), **output_options) as dst:
+            write_image(_payload, dst, device_id, key=key, **params)
+    except Exception as e:
+        return BatchResult(device_id, output_path, str(e))
+    return BatchResult(device_id, output_path)
+
+
+def build_batch(
+    input_path: str,
+    keys: dict,
+    output_template: str,
+    app_version: int,
+    prev_app_version: int,
+    bootloader_id: int,
+    page_length: int = 2048,
+    max_workers: Optional[int] = None,
+    fsync: str = DEFAULT_FSYNC,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+) -> list:
+    """Builds one encrypted image per device in keys (device_id -> 16-byte key).
+
+    The input file is read once and handed to every worker process at start-up, so
+    each job only pays for its own encryption and output write. Failures are reported
+    per device in the returned list of BatchResult instead of aborting the batch.
+    Every image is written atomically with the given fsync policy and buffer size.
+    """
+    if not os.path.isfile(input_path):
+        raise FileNotFoundError(f"Input file '{input_path}' does not exist.")
+
+    with open(input_path, "rb") as f:
+        payload = f.read()
+
+    params = {
+        "app_version": app_version,
+        "prev_app_version": prev_app_version,
+        "bootloader_id": bootloader_id,
+        "page_length": page_length,
+    }
+    output_options = {"fsync": fsync, "buffer_size": write_buffer_size}
+    jobs = [(device_id, key, format_output_path(output_template, device_id), params, output_options) for device_id, key in sorted(keys.items())]
+    if not jobs:
+        return []
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    chunksize = max(1, len(jobs) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(payload,)) as executor:
+        return list(executor.map(_build_one, jobs, chunksize=chunksize))
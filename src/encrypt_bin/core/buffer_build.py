@@ -0,0 +1,127 @@
+"""In-memory builds – images built from a buffer into a buffer or a file-like sink.
+
+build_image produces the same image as encrypt_bin.core.builder.generate_bin, but
+takes the firmware as any buffer-protocol object and never touches the filesystem,
+for callers that already hold the firmware in memory (a GUI, an upload handler).
+"""
+
+import os
+from typing import Optional
+
+from encrypt_bin.core.builder import DEFAULT_CHUNK_SIZE, compress_input, derive_image_iv, image_size, reproducible_level, write_image
+
+
+class _BufferWriter:
+    """Seekable binary sink over a writable buffer, so write_image can build an image in memory.
+
+    reserve(n) returns a view of the next n bytes for the encryption to write into
+    directly; write copies data in. size is the number of bytes written so far.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        if self._view.readonly:
+            raise TypeError("output buffer must be writable")
+        self._pos = 0
+        self.size = 0
+
+    def reserve(self, n: int):
+        end = self._pos + n
+        if end > len(self._view):
+            raise ValueError(f"output buffer is too small ({len(self._view)} bytes)")
+        view = self._view[self._pos : end]
+        self._pos = end
+        self.size = max(self.size, end)
+        return view
+
+    def write(self, data) -> int:
+        with memoryview(data) as data:
+            self.reserve(data.nbytes)[:] = data.cast("B")
+            return data.nbytes
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
+        self._pos = pos if whence == os.SEEK_SET else (self._pos if whence == os.SEEK_CUR else self.size) + pos
+        return self._pos
+
+
+def build_image(
+    data,
+    product_id: int,
+    app_version: int,
+    prev_app_version: int,
+    bootloader_id: int,
+    key: bytes,
+    page_length: int = 2048,
+    out=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timings=None,
+    progress=None,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    iv: Optional[bytes] = None,
+    segment_size: Optional[int] = None,
+    segment_workers: Optional[int] = None,
+    deterministic_iv: bool = False,
+    iv_key: Optional[bytes] = None,
+):
+    """Builds an encrypted image from an in-memory firmware image, without touching the filesystem.
+
+    data is any buffer-protocol object (bytes, bytearray, memoryview, mmap); it is
+    encrypted through zero-copy views. Without out the image is returned as a bytearray
+    of exactly image_size bytes, into which it is encrypted directly. out may instead be
+    a writable buffer, which receives the image at its start, or a binary file-like
+    sink; a sink that cannot seek gets the image in a single write. In both cases the
+    number of bytes written is returned. The other arguments are those of generate_bin,
+    and the image is the same as generate_bin would write for the same data and IV.
+    """
+    payload = memoryview(data).cast("B")
+    if deterministic_iv and iv is None:
+        import hashlib
+
+        if compression is not None and compression_level is None:
+            compression_level = reproducible_level(payload, compression, page_length)
+        params = (product_id, app_version, prev_app_version, bootloader_id, page_length, compression, compression_level, segment_size)
+        iv = derive_image_iv(hashlib.sha256(payload).digest(), key, iv_key, *params)
+    if compression is not None:
+        with payload:
+            payload = memoryview(compress_input(payload, compression, compression_level, page_length, timings))
+    extension_size = 0
+    if segment_size is not None:
+        from encrypt_bin.core.segments import SEGMENT_HEADER
+
+        extension_size = SEGMENT_HEADER.size
+    size = image_size(extension_size + len(payload), page_length)
+
+    image = None
+    if out is None or (hasattr(out, "write") and not (hasattr(out, "seekable") and out.seekable())):
+        image = bytearray(size)
+        dst = _BufferWriter(image)
+    else:
+        dst = out if hasattr(out, "write") else _BufferWriter(out)
+
+    chunk_size = min(chunk_size, max(len(payload), 1))
+    with payload:
+        write_image(
+            payload,
+            dst,
+            product_id,
+            app_version,
+            prev_app_version,
+            bootloader_id,
+            key,
+            page_length,
+            chunk_size,
+            timings,
+            progress,
+            iv,
+            segment_size,
+            segment_workers,
+        )
+    if out is None:
+        return image
+    if image is not None:
+        out.write(image)
+    return size
@@ -1,8 +1,35 @@
+import contextlib
+import math
+import mmap
 import os
+import shutil
 import struct
+import sys
 import zlib
-from Crypto.Cipher import AES
-from Crypto.Random import get_random_bytes
+from typing import Optional
+
+from encrypt_bin.core.output import DEFAULT_FSYNC, DEFAULT_WRITE_BUFFER_SIZE, atomic_output, atomic_path
+
+
+HEADER_SIZE = 48
+# bootloader_id, product_id MSB, product_id LSB, app_version, prev_app_version, num_pages, page_length, iv, crc32
+HEADER_STRUCT = struct.Struct("<7I16sI")
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Size of the blocks that are checksummed and encrypted back to back while still in CPU cache
+FUSED_BLOCK_SIZE = 64 * 1024
+# Inputs of at least this size are memory-mapped instead of read into a private buffer
+DEFAULT_MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+class BuildCancelled(Exception):
+    """Raised from a progress callback to stop a build; the partial output is removed."""
+
+
+def get_random_bytes(n: int) -> bytes:
+    """Returns n cryptographically secure random bytes (pycryptodome is loaded on first use)."""
+    from Crypto.Random import get_random_bytes as _get_random_bytes
+
+    return _get_random_bytes(n)
 
 
 def pad_bytes(data: bytes, page_length: int) -> bytes:
@@ -17,10 +44,224 @@ def encrypt_aes_cbc(input_bytes: bytes, key: bytes, iv: bytes) -> bytes:
     assert len(iv) == 16
     assert len(input_bytes) % 16 == 0  # padding must ensure multiple of 16
 
+    from Crypto.Cipher import AES
+
     cipher = AES.new(key, AES.MODE_CBC, iv)
     return cipher.encrypt(input_bytes)
 
 
+def _aligned_chunk_size(chunk_size: int, page_length: int) -> int:
+    """Rounds chunk_size down to a multiple of both the AES block size and page_length."""
+    step = 16 * page_length // math.gcd(16, page_length)
+    return max(step, chunk_size // step * step)
+
+
+def _read_chunks(readinto, buf):
+    """Yields views of buf filled by readinto; every view except the last one is full."""
+    view = memoryview(buf)
+    while True:
+        n = 0
+        while n < len(view):
+            got = readinto(view[n:])
+            if not got:
+                break
+            n += got
+        if n:
+            yield view[:n]
+        if n < len(view):
+            return
+
+
+def _pad_in_place(buf, n: int, page_length: int) -> int:
+    """Zero-fills buf after its first n bytes up to the next page boundary; returns the padded length."""
+    padded = n + (page_length - n % page_length) % page_length
+    buf[n:padded] = bytes(padded - n)
+    return padded
+
+
+def _encrypt_chunks(chunks, dst, key: bytes, iv: bytes, page_length: int, buf, timings=None, progress=None):
+    """Encrypts a sequence of chunk views into dst and returns (crc32, padded_length).
+
+    Every chunk except the last one is a whole number of AES blocks and pages, so a
+    single CBC cipher and a running CRC32 produce the same result as one pass over the
+    fully padded image. Only the last chunk is padded, in place in the preallocated
+    buffer buf. Each chunk is processed in cache-sized blocks that are checksummed and
+    encrypted in the same step, straight into a preallocated output buffer, so no
+    per-chunk objects are allocated. If dst has a reserve(n) method (see buffer_build._BufferWriter)
+    the ciphertext is written directly into the view it returns instead. progress, if
+    given, is called as progress("encrypt", input_bytes_done) after every chunk.
+    """
+    assert len(key) == 16
+    assert len(iv) == 16
+
+    from Crypto.Cipher import AES
+
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    reserve = getattr(dst, "reserve", None)
+    out = memoryview(bytearray(len(buf))) if reserve is None else None
+    block_size = _aligned_chunk_size(FUSED_BLOCK_SIZE, page_length)
+    crc32_val = 0
+    total = 0
+    done = 0
+
+    pad, crc32, encrypt, write = _pad_in_place, zlib.crc32, cipher.encrypt, dst.write
+    if timings is not None:
+        pad = timings.wrap("pad", pad, count="result")
+        crc32 = timings.wrap("crc", crc32)
+        encrypt = timings.wrap("encrypt", encrypt)
+        write = timings.wrap("write", write)
+
+    for chunk in chunks:
+        n = len(chunk)
+        if total == 0 and chunk[:4] == b"EBSG":
+            _reject_segment_extension(chunk, page_length)
+        done += n
+        if n % page_length:
+            if chunk.obj is not buf:
+                buf[:n] = chunk
+            n = pad(buf, n, page_length)
+            chunk = memoryview(buf)[:n]
+            if n % 16:
+                raise ValueError(f"Padded payload length ({total + n}) is not a multiple of 16 bytes.")
+
+        target = out if reserve is None else reserve(n)
+        for offset in range(0, n, block_size):
+            block = chunk[offset : offset + block_size]
+            crc32_val = crc32(block, crc32_val)
+            encrypt(block, output=target[offset : offset + len(block)])
+        if reserve is None:
+            write(out[:n])
+        total += n
+        if progress is not None:
+            progress("encrypt", done)
+
+    return crc32_val & 0xFFFFFFFF, total
+
+
+def _reject_segment_extension(chunk, page_length: int):
+    """Raises ValueError if the first block of a plain payload would be read as a segment extension.
+
+    Segmented images are only told apart by their first plaintext block, so such a payload
+    would be decrypted as a segmented image by verify and by the bootloader.
+    """
+    from encrypt_bin.core.segments import read_segment_header
+
+    if read_segment_header(chunk[:16], page_length) is not None:
+        raise ValueError("the payload starts with a segment extension (EBSG) and would be read as a segmented image (use --segment-size or compression)")
+
+
+def _buffer_chunks(view, chunk_size: int):
+    """Yields zero-copy chunk_size slices of a memoryview."""
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset : offset + chunk_size]
+
+
+def _encrypt_stream(src, dst, key: bytes, iv: bytes, page_length: int, chunk_size: int, timings=None, progress=None):
+    """Encrypts src into dst and returns (crc32, padded_length).
+
+    src is either a binary stream, read with readinto into a reused buffer, or any
+    object supporting the buffer protocol (bytes, bytearray, memoryview, mmap), which
+    is processed through memoryview slices without copying.
+    """
+    chunk_size = _aligned_chunk_size(chunk_size, page_length)
+    buf = bytearray(chunk_size)
+    try:
+        view = memoryview(src).cast("B")
+    except TypeError:
+        readinto = src.readinto
+        if timings is not None:
+            readinto = timings.wrap("read", readinto, count="result")
+        return _encrypt_chunks(_read_chunks(readinto, buf), dst, key, iv, page_length, buf, timings, progress)
+
+    with view:
+        return _encrypt_chunks(_buffer_chunks(view, chunk_size), dst, key, iv, page_length, buf, timings, progress)
+
+
+def map_input(f):
+    """Memory-maps an open input file read-only, hinting sequential access."""
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+
+def _write_header(f, bootloader_id, product_id, app_version, prev_app_version, num_pages, page_length, iv, crc32_val):
+    """Writes the 48-byte image header at the current position of f with a single write."""
+    product_msb, product_lsb = (product_id >> 32) & 0xFFFFFFFF, product_id & 0xFFFFFFFF
+    f.write(HEADER_STRUCT.pack(bootloader_id, product_msb, product_lsb, app_version, prev_app_version, num_pages, page_length, iv, crc32_val))
+
+
+def image_size(payload_size: int, page_length: int) -> int:
+    """Returns the size of the image built from a payload of payload_size bytes."""
+    return HEADER_SIZE + -(-payload_size // page_length) * page_length
+
+
+def write_image(
+    src,
+    dst,
+    product_id: int,
+    app_version: int,
+    prev_app_version: int,
+    bootloader_id: int,
+    key: bytes,
+    page_length: int = 2048,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timings=None,
+    progress=None,
+    iv: Optional[bytes] = None,
+    segment_size: Optional[int] = None,
+    segment_workers: Optional[int] = None,
+):
+    """Encrypts src and writes the complete image to the seekable stream dst.
+
+    src is a binary stream or a buffer-protocol object (bytes, bytearray, memoryview,
+    mmap); buffers are encrypted through zero-copy views. timings is an optional
+    StageTimings that records time and bytes per pipeline stage. progress is an optional
+    callable(stage, input_bytes_done); it may raise BuildCancelled to stop the build.
+    iv replaces the random IV, e.g. for reproducible builds. segment_size selects the
+    segmented format (see encrypt_bin.core.segments), whose segments are encrypted on
+    segment_workers threads.
+    """
+    if iv is not None and len(iv) != 16:
+        raise ValueError(f"IV must be 16 bytes long (got {len(iv)})")
+    random_bytes, write_header = get_random_bytes, _write_header
+    if timings is not None:
+        random_bytes = timings.wrap("iv", random_bytes, count="result")
+        write_header = timings.wrap("header", write_header, count=HEADER_SIZE)
+
+    # 1. Generate random IV (16 bytes)
+    if iv is None:
+        iv = random_bytes(16)
+
+    # 2. Pad, encrypt and checksum the payload chunk by chunk, leaving room for the header
+    start = dst.tell()
+    dst.seek(start + HEADER_SIZE)
+    if segment_size is None:
+        crc32_val, padded_len = _encrypt_stream(src, dst, key, iv, page_length, chunk_size, timings, progress)
+    else:
+        from encrypt_bin.core.segments import encrypt_segmented
+
+        crc32_val, padded_len = encrypt_segmented(src, dst, key, iv, page_length, segment_size, segment_workers, timings, progress)
+    end = dst.tell()
+
+    # 3. Go back and fill in the header now that the CRC32 is known
+    dst.seek(start)
+    write_header(
+        dst,
+        bootloader_id,
+        product_id,
+        app_version,
+        prev_app_version,
+        padded_len // page_length,
+        page_length,
+        iv,
+        crc32_val,
+    )
+    dst.seek(end)
+    if progress is not None:
+        progress("done", padded_len)
+
+
 def generate_bin(
     input_path: str,
     output_path: str,
@@ -30,37 +271,191 @@ def generate_bin(
     bootloader_id: int,
     key: bytes,
     page_length: int = 2048,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timings=None,
+    progress=None,
+    mmap_threshold: int = DEFAULT_MMAP_THRESHOLD,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    iv: Optional[bytes] = None,
+    segment_size: Optional[int] = None,
+    segment_workers: Optional[int] = None,
+    fsync: str = DEFAULT_FSYNC,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    deterministic_iv: bool = False,
+    iv_key: Optional[bytes] = None,
 ):
-    # 1. Read the entire input file
+    """Builds an encrypted image from input_path and writes it to output_path.
+
+    The input is streamed in chunks of about chunk_size bytes, so peak memory does not
+    depend on the image size. Inputs of at least mmap_threshold bytes (None disables)
+    are memory-mapped instead, so CRC32 and AES work directly on the page cache and
+    parallel builds of the same image share its pages. The output is identical to
+    encrypting the whole padded image in one pass. Pass a StageTimings as timings to
+    record per-stage statistics, and a progress callable to follow (or cancel) the
+    build.
+
+    The image is written atomically (see encrypt_bin.core.output): output_path either
+    keeps its previous content or holds the complete new image, also after a crash or
+    a cancelled build. fsync selects the durability policy and write_buffer_size the
+    size of the output buffer.
+
+    compression names a codec from encrypt_bin.core.compression.CODECS; the input is
+    then compressed page by page before encryption (compression_level None picks the
+    level automatically). iv replaces the random IV; with deterministic_iv it is derived
+    from the input and all parameters instead (see encrypt_bin.core.reproducible), under
+    iv_key or a key derived from key, so identical builds give identical images. The
+    automatic compression level is then chosen by size only and is part of the IV input.
+    segment_size builds a segmented image whose segments are encrypted in parallel on
+    segment_workers threads; the input is then memory-mapped whatever its size.
+    """
+    if not os.path.isfile(input_path):
+        raise FileNotFoundError(f"Input file '{input_path}' does not exist.")
+    if deterministic_iv and iv is None:
+        from encrypt_bin.core.reproducible import content_digest
+
+        if compression is not None and compression_level is None:
+            with open(input_path, "rb") as f:
+                compression_level = reproducible_level(f.read(), compression, page_length)
+        params = (product_id, app_version, prev_app_version, bootloader_id, page_length, compression, compression_level, segment_size)
+        iv = derive_image_iv(content_digest(input_path), key, iv_key, *params)
+
+    # Small images do not need buffers of the full chunk size
+    input_size = os.path.getsize(input_path)
+    chunk_size = min(chunk_size, max(input_size, 1))
+    use_mmap = input_size > 0 and (segment_size is not None or (mmap_threshold is not None and 0 < mmap_threshold <= input_size))
+
+    total = timings.stage("total", input_size) if timings is not None else contextlib.nullcontext()
+    # Preallocate the final size where it is known in advance (not for compressed payloads)
+    expected_size = None
+    if compression is None:
+        expected_size = image_size(input_size, page_length)
+        if segment_size is not None:
+            from encrypt_bin.core.segments import SEGMENT_HEADER
+
+            expected_size = image_size(SEGMENT_HEADER.size + input_size, page_length)
+
+    output = atomic_output(output_path, expected_size, fsync, write_buffer_size)
+    with total, open(input_path, "rb") as f, output as dst:
+        src = map_input(f) if use_mmap else f
+        try:
+            payload = src
+            if compression is not None:
+                payload = compress_input(src if src is not f else f.read(), compression, compression_level, page_length, timings)
+            write_image(
+                payload,
+                dst,
+                product_id,
+                app_version,
+                prev_app_version,
+                bootloader_id,
+                key,
+                page_length,
+                chunk_size,
+                timings,
+                progress,
+                iv,
+                segment_size,
+                segment_workers,
+            )
+        finally:
+            if src is not f:
+                close_mapping(src)
+
+
+def reproducible_level(data, codec: str, page_length: int) -> int:
+    """Resolves the automatic compression level from data alone, so that it can go into a deterministic IV."""
+    from encrypt_bin.core.compression import choose_level
+
+    return choose_level(data, codec, page_length, by_size=True)
+
+
+def derive_image_iv(input_digest: bytes, key: bytes, iv_key: Optional[bytes], *params) -> bytes:
+    """Returns the deterministic IV of a build (params as for encrypt_bin.core.reproducible.derive_iv)."""
+    from encrypt_bin.core.reproducible import default_iv_key, derive_iv
+
+    return derive_iv(iv_key or default_iv_key(key), input_digest, *params)
+
+
+def compress_input(data, codec, level, page_length, timings):
+    """Returns data compressed page by page with the payload compression extension."""
+    from encrypt_bin.core.compression import compress_payload
+
+    stage = timings.stage("compress", len(data)) if timings is not None else contextlib.nullcontext()
+    with stage:
+        return compress_payload(data, codec, level, page_length).data
+
+
+def close_mapping(mm):
+    """Closes a mapping; if views of it are still referenced (e.g. by a traceback) it is left to the GC."""
+    try:
+        mm.close()
+    except BufferError:
+        pass
+
+
+def clone_file(src_path: str, dst_path: str):
+    """Copies src_path to dst_path, sharing data blocks (reflink) where the filesystem supports it."""
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        FICLONE = 0x40049409
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+    # Falls back to the fastest copy the platform offers (copy_file_range/sendfile/fcopyfile)
+    shutil.copyfile(src_path, dst_path)
+
+
+def rewrap_header(
+    input_path: str,
+    output_path: str = None,
+    bootloader_id: int = None,
+    app_version: int = None,
+    prev_app_version: int = None,
+):
+    """Rewrites the version fields of an existing image without re-encrypting its payload.
+
+    The encrypted payload, IV and CRC32 are reused as they are; only the 48-byte header
+    is written. Without output_path the image is updated in place, otherwise a clone of
+    it atomically replaces output_path. Fields left as None keep their current value.
+    """
     if not os.path.isfile(input_path):
         raise FileNotFoundError(f"Input file '{input_path}' does not exist.")
 
     with open(input_path, "rb") as f:
-        input_bytes = f.read()
-
-    # 2. Pad to a multiple of page_length
-    input_bytes = pad_bytes(input_bytes, page_length)
-
-    # 3. Generate random IV (16 bytes)
-    iv = get_random_bytes(16)
-
-    # 4. Encrypt with AES-128 CBC
-    enc_bytes = encrypt_aes_cbc(input_bytes, key, iv)
-
-    # 5. Compute CRC32 of the entire input (after padding)
-    crc32_val = zlib.crc32(input_bytes) & 0xFFFFFFFF
-
-    # 6. Write to the output file
-    with open(output_path, "wb") as f:
-        # Little Endian
-        f.write(struct.pack("<I", bootloader_id))
-        f.write(struct.pack("<I", (product_id >> 32) & 0xFFFFFFFF))  # MSB of product_id
-        f.write(struct.pack("<I", product_id & 0xFFFFFFFF))  # LSB of product_id
-        f.write(struct.pack("<I", app_version))
-        f.write(struct.pack("<I", prev_app_version))
-        num_pages = len(input_bytes) // page_length
-        f.write(struct.pack("<I", num_pages))
-        f.write(struct.pack("<I", page_length))
-        f.write(iv)
-        f.write(struct.pack("<I", crc32_val))
-        f.write(enc_bytes)
+        header = f.read(HEADER_SIZE)
+        payload_size = os.fstat(f.fileno()).st_size - HEADER_SIZE
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"File '{input_path}' is too short to contain an image header.")
+    fields = list(HEADER_STRUCT.unpack(header))
+    if fields[5] * fields[6] != payload_size:
+        raise ValueError(f"File '{input_path}' is not a valid image (payload size does not match the header).")
+
+    if bootloader_id is not None:
+        fields[0] = bootloader_id
+    if app_version is not None:
+        fields[3] = app_version
+    if prev_app_version is not None:
+        fields[4] = prev_app_version
+    header = HEADER_STRUCT.pack(*fields)
+
+    if output_path is None or (os.path.exists(output_path) and os.path.samefile(input_path, output_path)):
+        _rewrite_header(input_path, header)
+        return
+    # The clone is completed under a temporary name, so output_path is replaced atomically
+    with atomic_path(output_path) as tmp_path:
+        clone_file(input_path, tmp_path)
+        _rewrite_header(tmp_path, header)
+
+
+def _rewrite_header(path: str, header: bytes):
+    with open(path, "r+b") as f:
+        if hasattr(os, "pwrite"):
+            os.pwrite(f.fileno(), header, 0)
+        else:
+            f.seek(0)
+            f.write(header)
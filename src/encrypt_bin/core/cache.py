@@ -0,0 +1,194 @@
+"""Content-addressed build cache – reuses the output of identical builds.
+
+Entries are keyed by the SHA-256 of the input bytes together with every build
+parameter and a fingerprint of the key (the key itself is never stored or hashed
+alone). Each entry is one image file named after its key; its modification time
+records the last use, and the least recently used entries are evicted once the
+cache exceeds its size budget.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from encrypt_bin.core.builder import clone_file, generate_bin, reproducible_level
+from encrypt_bin.core.output import atomic_path
+from encrypt_bin.core.reproducible import IV_SCHEME, content_digest, default_iv_key, derive_iv
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+
+def key_fingerprint(key: bytes) -> str:
+    """Returns a fingerprint that identifies a key without revealing it."""
+    return hmac.new(key, b"encrypt-bin key fingerprint", hashlib.sha256).hexdigest()[:32]
+
+
+def build_key(input_digest: bytes, key: bytes, params: dict) -> str:
+    """Returns the cache key of a build: input digest, parameters and key fingerprint."""
+    record = {"version": CACHE_FORMAT_VERSION, "input": input_digest.hex(), "key": key_fingerprint(key), **params}
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+class BuildCache:
+    """Directory of previously built images with an LRU size budget (max_bytes).
+
+    Hits are cloned (reflink where the filesystem supports it, a copy otherwise) to the
+    output path. With hardlink=True they are hard-linked instead, which is cheaper but
+    shares the file with the cache: such outputs must not be modified in place.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_SIZE, hardlink: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hardlink = hardlink
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, cache_key: str) -> str:
+        return os.path.join(self.directory, cache_key + ".bin")
+
+    def _export(self, entry: str, output_path: str):
+        """Places the entry at output_path as a hard link (if enabled) or a clone/copy.
+
+        The export goes to a temporary file that replaces output_path once complete, so a
+        failure never leaves the output missing or partial.
+        """
+        with atomic_path(output_path) as tmp_path:
+            if self.hardlink:
+                os.remove(tmp_path)
+                try:
+                    os.link(entry, tmp_path)
+                    return
+                except OSError:
+                    pass  # e.g. different filesystems
+            clone_file(entry, tmp_path)
+
+    def get(self, cache_key: str, output_path: str) -> bool:
+        """Writes the cached image for cache_key to output_path; returns False on a miss."""
+        entry = self._entry_path(cache_key)
+        try:
+            os.utime(entry)  # mark as recently used
+        except FileNotFoundError:
+            return False
+        self._export(entry, output_path)
+        return True
+
+    def put(self, cache_key: str, image_path: str):
+        """Stores a copy of image_path under cache_key and evicts entries over the budget."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(image_path, tmp)
+            os.replace(tmp, self._entry_path(cache_key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".bin") and entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def size(self) -> int:
+        """Returns the total size of the cached images in bytes."""
+        return sum(e.stat().st_size for e in os.scandir(self.directory) if e.name.endswith(".bin"))
+
+    def generate_bin(
+        self,
+        input_path: str,
+        output_path: str,
+        product_id: int,
+        app_version: int,
+        prev_app_version: int,
+        bootloader_id: int,
+        key: bytes,
+        page_length: int = 2048,
+        deterministic_iv: bool = False,
+        compression=None,
+        compression_level=None,
+        segment_size=None,
+        iv_key: Optional[bytes] = None,
+        **options,
+    ) -> bool:
+        """generate_bin through the cache. Returns True if the image came from the cache.
+
+        With deterministic_iv the IV is derived as in encrypt_bin.core.reproducible
+        (under iv_key, or a key derived from key), so a rebuild after eviction (or on
+        another machine) yields the identical image. The automatic compression level is
+        resolved by size before the lookup, so it is part of the cache key. Remaining
+        options (timings, progress, ...) are passed on to generate_bin.
+        """
+        if compression is not None and compression_level is None:
+            # The automatic level is chosen by speed; resolve it from the data so that the
+            # cache key (and a deterministic IV) names the exact payload
+            with open(input_path, "rb") as f:
+                compression_level = reproducible_level(f.read(), compression, page_length)
+        params = {
+            "product_id": product_id,
+            "app_version": app_version,
+            "prev_app_version": prev_app_version,
+            "bootloader_id": bootloader_id,
+            "page_length": page_length,
+            # The scheme name keeps entries of an earlier derivation from being reused
+            "deterministic_iv": IV_SCHEME if deterministic_iv else False,
+            "compression": compression,
+            "compression_level": compression_level,
+        }
+        if segment_size is not None:
+            # Only segmented builds record it, so the keys of existing entries stay valid
+            params["segment_size"] = segment_size
+        if deterministic_iv and iv_key is not None:
+            params["iv_key"] = key_fingerprint(iv_key)
+        input_digest = content_digest(input_path)
+        cache_key = build_key(input_digest, key, params)
+        if self.get(cache_key, output_path):
+            return True
+
+        iv = None
+        if deterministic_iv:
+            iv = derive_iv(
+                iv_key or default_iv_key(key),
+                input_digest,
+                product_id,
+                app_version,
+                prev_app_version,
+                bootloader_id,
+                page_length,
+                compression,
+                compression_level,
+                segment_size,
+            )
+        generate_bin(
+            input_path,
+            output_path,
+            product_id,
+            app_version,
+            prev_app_version,
+            bootloader_id,
+            key,
+            page_length,
+            compression=compression,
+            compression_level=compression_level,
+            iv=iv,
+            segment_size=segment_size,
+            **options,
+        )
+        self.put(cache_key, output_path)
+        return False
@@ -0,0 +1,189 @@
+"""Optional payload compression – independent blocks recorded in a versioned payload extension.
+
+A compressed image is a regular image whose plaintext payload is:
+
+    magic "EBCZ" | version (u8) | codec id (u8) | level (u8) | reserved (u8)
+    uncompressed size (u32) | block size (u32) | block count (u32)
+    block count x compressed block length (u32, bit 31 set = block stored uncompressed)
+    compressed blocks
+
+Each block decompresses to block_size bytes (the last one to the remainder), so a
+bootloader can decompress and program one flash page at a time with a fixed buffer.
+The payload is then padded, encrypted and checksummed like any other image.
+"""
+
+import struct
+import time
+import zlib
+from typing import Callable, NamedTuple
+
+EXT_MAGIC = b"EBCZ"
+EXT_VERSION = 1
+EXT_HEADER = struct.Struct("<4sBBBBIII")
+STORED_FLAG = 0x80000000
+
+# Number of blocks compressed at every candidate level when the level is chosen automatically
+AUTO_SAMPLE_BLOCKS = 32
+# Levels compressing at most this much worse than the best one are considered equivalent
+AUTO_SIZE_TOLERANCE = 0.01
+
+
+class Codec(NamedTuple):
+    """A block codec: compress(block, level, block_size) and decompress(data, block_size)."""
+
+    codec_id: int
+    levels: tuple
+    compress: Callable
+    decompress: Callable
+
+
+class CompressedPayload(NamedTuple):
+    """Result of compress_payload: the payload with its extension and the settings used."""
+
+    data: bytearray
+    codec: str
+    level: int
+    uncompressed_size: int
+
+    @property
+    def ratio(self) -> float:
+        """Payload size relative to the uncompressed input."""
+        return len(self.data) / self.uncompressed_size if self.uncompressed_size else 1.0
+
+
+def _deflate(block, level, block_size):
+    # Raw deflate without zlib header/trailer; the image CRC32 already covers the data
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(block) + compressor.flush()
+
+
+def _inflate(data, block_size):
+    return zlib.decompress(data, -15)
+
+
+def _lzma_filters(level, block_size):
+    import lzma
+
+    # The dictionary never needs to be larger than a block, which keeps decoder RAM small
+    filters = {"id": lzma.FILTER_LZMA2, "dict_size": max(4096, block_size)}
+    if level is not None:
+        filters["preset"] = level
+    return [filters]
+
+
+def _lzma_compress(block, level, block_size):
+    import lzma
+
+    return lzma.compress(block, format=lzma.FORMAT_RAW, filters=_lzma_filters(level, block_size))
+
+
+def _lzma_decompress(data, block_size):
+    import lzma
+
+    return lzma.decompress(data, format=lzma.FORMAT_RAW, filters=_lzma_filters(None, block_size))
+
+
+CODECS = {
+    "zlib": Codec(1, tuple(range(1, 10)), _deflate, _inflate),
+    "lzma": Codec(2, tuple(range(0, 10)), _lzma_compress, _lzma_decompress),
+}
+
+
+def register_codec(name: str, codec: Codec):
+    """Adds a codec (e.g. an LZ4 or heatshrink binding) under name; its codec_id must be unique."""
+    if any(c.codec_id == codec.codec_id for n, c in CODECS.items() if n != name):
+        raise ValueError(f"codec id {codec.codec_id} is already registered")
+    CODECS[name] = codec
+
+
+def _get_codec(name: str) -> Codec:
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"unknown compression codec '{name}' (available: {', '.join(CODECS)})") from None
+
+
+def choose_level(data, codec: str, block_size: int, by_size: bool = False) -> int:
+    """Picks the fastest level whose output is within AUTO_SIZE_TOLERANCE of the smallest.
+
+    Every level is measured on up to AUTO_SAMPLE_BLOCKS blocks spread evenly over data,
+    so the cost does not depend on the image size. Speed depends on the machine and its
+    load; with by_size the lowest level within the tolerance is picked instead, which
+    only depends on data (as reproducible builds require).
+    """
+    c = _get_codec(codec)
+    with memoryview(data) as view:
+        count = -(-len(view) // block_size)
+        step = max(1, count // AUTO_SAMPLE_BLOCKS)
+        sample = [bytes(view[i * block_size : (i + 1) * block_size]) for i in range(0, count, step)][:AUTO_SAMPLE_BLOCKS]
+
+    measured = []
+    for level in c.levels:
+        start = time.perf_counter()
+        size = sum(len(c.compress(block, level, block_size)) for block in sample)
+        measured.append((level, size, time.perf_counter() - start))
+
+    smallest = min(size for _, size, _ in measured)
+    candidates = [m for m in measured if m[1] <= smallest * (1 + AUTO_SIZE_TOLERANCE)]
+    if by_size:
+        return candidates[0][0]
+    return min(candidates, key=lambda m: m[2])[0]
+
+
+def compress_payload(data, codec: str = "zlib", level=None, block_size: int = 2048) -> CompressedPayload:
+    """Compresses data block by block and prepends the compression extension.
+
+    level None selects the level automatically with choose_level. Blocks that do not
+    shrink are stored as they are.
+    """
+    c = _get_codec(codec)
+    if not 0 < block_size < STORED_FLAG:
+        raise ValueError(f"invalid compression block size ({block_size})")
+    if len(data) > 0xFFFFFFFF:
+        raise ValueError("input is too large for the compression extension (4 GiB maximum)")
+    if level is None:
+        level = choose_level(data, codec, block_size)
+    elif level not in c.levels:
+        raise ValueError(f"invalid {codec} level {level} (valid: {c.levels[0]}-{c.levels[-1]})")
+
+    lengths = []
+    blocks = bytearray()
+    with memoryview(data) as view:
+        for offset in range(0, len(view), block_size):
+            block = view[offset : offset + block_size]
+            packed = c.compress(block, level, block_size)
+            if len(packed) < len(block):
+                lengths.append(len(packed))
+                blocks += packed
+            else:
+                lengths.append(len(block) | STORED_FLAG)
+                blocks += block
+
+    payload = bytearray(EXT_HEADER.pack(EXT_MAGIC, EXT_VERSION, c.codec_id, level, 0, len(data), block_size, len(lengths)))
+    payload += struct.pack(f"<{len(lengths)}I", *lengths)
+    payload += blocks
+    return CompressedPayload(payload, codec, level, len(data))
+
+
+def decompress_payload(payload) -> bytes:
+    """Reference decoder: returns the original data of a (decrypted, padded) compressed payload."""
+    magic, version, codec_id, _, _, size, block_size, count = EXT_HEADER.unpack_from(payload)
+    if magic != EXT_MAGIC:
+        raise ValueError("payload does not start with a compression extension")
+    if version != EXT_VERSION:
+        raise ValueError(f"unsupported compression extension version {version}")
+    codec = next((c for c in CODECS.values() if c.codec_id == codec_id), None)
+    if codec is None:
+        raise ValueError(f"unknown compression codec id {codec_id}")
+
+    lengths = struct.unpack_from(f"<{count}I", payload, EXT_HEADER.size)
+    offset = EXT_HEADER.size + 4 * count
+    out = bytearray()
+    for length in lengths:
+        n = length & ~STORED_FLAG
+        block = payload[offset : offset + n]
+        out += block if length & STORED_FLAG else codec.decompress(block, block_size)
+        offset += n
+    if len(out) != size:
+        raise ValueError(f"decompressed size ({len(out)}) does not match the recorded size ({size})")
+    return bytes(out)
@@ -1,4 +1,15 @@
-"""Configuration module – stores and prints input parameters."""
+"""Configuration module – stores, validates and prints input parameters."""
+
+import os
+
+from encrypt_bin.errors import ConfigValidationError
+
+_INT_FIELDS = (
+    ("device_id", "Device ID", 64),
+    ("bootloader_id", "Bootloader ID", 32),
+    ("app_version", "App version", 32),
+    ("prev_app_version", "Previous app version", 32),
+)
 
 
 class Config:
@@ -38,6 +49,36 @@ class Config:
             args.page_length,
         )
 
+    def validate(self, check_paths=True):
+        """Returns a list with every problem found in the parameters (empty if they are valid).
+
+        Nothing is raised or printed, so a caller can report all problems at once.
+        With check_paths=False only the values are checked, not the file system.
+        """
+        errors = []
+        for attr, name, bits in _INT_FIELDS:
+            value = getattr(self, attr)
+            if not isinstance(value, int) or not 0 <= value < 1 << bits:
+                errors.append(f"{name} must be an integer in the uint{bits} range (given: {value!r})")
+        if not isinstance(self.page_length, int) or self.page_length <= 0 or self.page_length % 16:
+            errors.append(f"page length must be a positive multiple of 16 bytes (given: {self.page_length!r})")
+        if not isinstance(self.key, (bytes, bytearray)) or len(self.key) != 16:
+            errors.append("key must be exactly 16 bytes long.")
+
+        if check_paths:
+            if not os.path.isfile(self.input_path):
+                errors.append(f"input file '{self.input_path}' does not exist.")
+            output_dir = os.path.dirname(self.output_path) or "."
+            if not os.path.isdir(output_dir):
+                errors.append(f"output directory '{output_dir}' does not exist.")
+        return errors
+
+    def check(self, check_paths=True):
+        """Raises ConfigValidationError listing every problem if the parameters are invalid."""
+        errors = self.validate(check_paths)
+        if errors:
+            raise ConfigValidationError(errors)
+
     def print_summary(self):
         """Prints the current configuration parameters."""
         print(f" Input file:          {self.input_path}")
@@ -0,0 +1,148 @@
+"""Delta images – only the pages changed since the previous firmware, plus a manifest.
+
+The plaintext payload of a delta image starts with a manifest, zero-padded to a whole
+number of pages:
+
+    magic "EBDL" | version (u16) | reserved (u16) | total_pages (u32) | count (u32)
+    count x page index (u32, ascending)
+
+followed by the ``count`` changed pages in manifest order. total_pages is the page
+count of the new image, so the bootloader can also truncate a firmware that shrank.
+The payload is then padded, encrypted and checksummed like a full image; the header
+field prev_app_version names the firmware the delta applies to.
+"""
+
+import contextlib
+import hashlib
+import os
+import struct
+from typing import NamedTuple, Optional
+
+from encrypt_bin.core.builder import DEFAULT_CHUNK_SIZE, HEADER_SIZE, close_mapping, compress_input, image_size, map_input, write_image
+from encrypt_bin.core.output import DEFAULT_FSYNC, DEFAULT_WRITE_BUFFER_SIZE, atomic_output
+
+DELTA_MAGIC = b"EBDL"
+DELTA_VERSION = 1
+MANIFEST_HEADER = struct.Struct("<4sHHII")
+PAGE_DIGEST_SIZE = 16
+
+
+class DeltaSummary(NamedTuple):
+    """Size comparison of a delta image with the equivalent full image (sizes include the header)."""
+
+    total_pages: int
+    changed_pages: int
+    full_size: int
+    delta_size: int
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of the full image size saved by the delta image."""
+        return 1 - self.delta_size / self.full_size if self.full_size else 0.0
+
+
+def page_digests(data, page_length: int) -> list:
+    """Returns a BLAKE2b digest per page of data; a trailing partial page is hashed zero-padded.
+
+    The list is the page index used to diff against later images, so the previous image
+    only needs to be hashed once even when many deltas are built from it.
+    """
+    with memoryview(data) as view:
+        full = len(view) - len(view) % page_length
+        digests = [
+            hashlib.blake2b(view[offset : offset + page_length], digest_size=PAGE_DIGEST_SIZE).digest()
+            for offset in range(0, full, page_length)
+        ]
+        if full < len(view):
+            last = bytes(view[full:]).ljust(page_length, b"\0")
+            digests.append(hashlib.blake2b(last, digest_size=PAGE_DIGEST_SIZE).digest())
+    return digests
+
+
+def changed_pages(prev_digests: list, data, page_length: int) -> list:
+    """Returns the ascending indices of the pages of data that differ from prev_digests."""
+    digests = page_digests(data, page_length)
+    return [i for i, digest in enumerate(digests) if i >= len(prev_digests) or digest != prev_digests[i]]
+
+
+def build_delta_payload(prev_digests: list, data, page_length: int) -> tuple:
+    """Returns (plaintext payload, changed page indices) for a delta from prev_digests to data."""
+    if page_length < MANIFEST_HEADER.size or page_length % 16:
+        raise ValueError(f"page_length ({page_length}) must be a multiple of 16 and at least {MANIFEST_HEADER.size}")
+    changed = changed_pages(prev_digests, data, page_length)
+    total_pages = -(-len(data) // page_length)
+
+    payload = bytearray(MANIFEST_HEADER.pack(DELTA_MAGIC, DELTA_VERSION, 0, total_pages, len(changed)))
+    payload += struct.pack(f"<{len(changed)}I", *changed)
+    payload += bytes(-len(payload) % page_length)
+    with memoryview(data) as view:
+        for index in changed:
+            payload += view[index * page_length : (index + 1) * page_length]
+    return payload, changed
+
+
+def _file_view(f):
+    """Returns a read-only buffer with the contents of an open file (a memory map unless empty)."""
+    return map_input(f) if os.fstat(f.fileno()).st_size else b""
+
+
+def generate_delta_bin(
+    prev_input_path: str,
+    input_path: str,
+    output_path: str,
+    product_id: int,
+    app_version: int,
+    prev_app_version: int,
+    bootloader_id: int,
+    key: bytes,
+    page_length: int = 2048,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timings=None,
+    progress=None,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    fsync: str = DEFAULT_FSYNC,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+) -> DeltaSummary:
+    """Builds a delta image holding the pages of input_path that differ from prev_input_path.
+
+    Both inputs are plaintext firmware images. They are memory-mapped and compared page
+    by page through their digests, so the comparison is linear in the number of pages
+    and memory use is bounded by the size of the changed pages. compression optionally
+    compresses the delta payload as in generate_bin. Returns a DeltaSummary. The
+    output is written atomically like in generate_bin (fsync, write_buffer_size).
+    """
+    for path in (prev_input_path, input_path):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Input file '{path}' does not exist.")
+
+    with open(prev_input_path, "rb") as f:
+        prev = _file_view(f)
+        try:
+            prev_digests = page_digests(prev, page_length)
+        finally:
+            if prev:
+                close_mapping(prev)
+
+    with open(input_path, "rb") as f:
+        data = _file_view(f)
+        try:
+            diff = timings.stage("diff", len(data)) if timings is not None else contextlib.nullcontext()
+            with diff:
+                payload, changed = build_delta_payload(prev_digests, data, page_length)
+            total_pages = -(-len(data) // page_length)
+        finally:
+            if data:
+                close_mapping(data)
+    if compression is not None:
+        payload = compress_input(payload, compression, compression_level, page_length, timings)
+
+    with atomic_output(output_path, image_size(len(payload), page_length), fsync, write_buffer_size) as dst:
+        write_image(payload, dst, product_id, app_version, prev_app_version, bootloader_id, key, page_length, chunk_size, timings, progress)
+
+    return DeltaSummary(
+        total_pages,
+        len(changed),
+        HEADER_SIZE + total_pages * page_length,
+        image_size(len(payload), page_length),
+    )
@@ -0,0 +1,70 @@
+"""Per-device key derivation – computes device keys from one master key instead of storing them.
+
+The key of a device is the AES-CMAC key-based KDF of NIST SP 800-108 (counter mode,
+one 128-bit block) keyed with the master key:
+
+    key = AES-CMAC(master_key, 0x01 | "encrypt-bin devkey" | 0x00 | device_id (u64, big endian) | 0x00000080)
+
+The fixed input is exactly two AES blocks and its first block does not depend on the
+device, so after a one-time setup every derivation costs a single AES block
+encryption, and derive_many derives any number of keys in one AES-ECB call.
+"""
+
+import functools
+from typing import Optional
+
+KDF_LABEL = b"encrypt-bin devkey"
+DEFAULT_CACHE_SIZE = 65536
+_RB = 0x87  # constant of the CMAC subkey generation for 128-bit blocks
+
+
+def kdf_input(device_id: int) -> bytes:
+    """Returns the 32-byte SP 800-108 fixed input for device_id."""
+    return b"\x01" + KDF_LABEL + b"\x00" + device_id.to_bytes(8, "big") + (128).to_bytes(4, "big")
+
+
+def _cmac_subkey1(l_block: bytes) -> int:
+    value = int.from_bytes(l_block, "big") << 1
+    if value >> 128:
+        value = (value & ((1 << 128) - 1)) ^ _RB
+    return value
+
+
+class DerivedKeys:
+    """Key provider that derives device keys from a master key, with an LRU cache.
+
+    Like KeyStore it offers get(device_id) -> 16-byte key, so it can be used wherever
+    a key store is; since every device has a key, get never returns None.
+    """
+
+    def __init__(self, master_key: bytes, cache_size: Optional[int] = DEFAULT_CACHE_SIZE):
+        if len(master_key) != 16:
+            raise ValueError(f"master key must be 16 bytes long (got {len(master_key)})")
+        from Crypto.Cipher import AES
+
+        self._ecb = AES.new(master_key, AES.MODE_ECB)
+        k1 = _cmac_subkey1(self._ecb.encrypt(bytes(16)))
+        first_block = self._ecb.encrypt(kdf_input(0)[:16])
+        # CMAC of a two-block message is E(E(M1) ^ M2 ^ K1). Only the device ID in M2 (bits
+        # 32-95) changes, so the block to encrypt is base ^ (device_id << 32).
+        self._base = int.from_bytes(first_block, "big") ^ k1 ^ int.from_bytes(kdf_input(0)[16:], "big")
+        self.get = functools.lru_cache(maxsize=cache_size)(self._derive)
+
+    def _derive(self, device_id: int) -> bytes:
+        return self._ecb.encrypt((self._base ^ (device_id << 32)).to_bytes(16, "big"))
+
+    def derive_many(self, device_ids) -> dict:
+        """Returns {device_id: key} for many devices, derived in a single AES-ECB call (bypasses the cache)."""
+        device_ids = list(device_ids)
+        base = self._base
+        keys = self._ecb.encrypt(b"".join([(base ^ (device_id << 32)).to_bytes(16, "big") for device_id in device_ids]))
+        return {device_id: keys[16 * i : 16 * i + 16] for i, device_id in enumerate(device_ids)}
+
+    def cache_info(self):
+        """Returns the hit/miss statistics of the LRU cache."""
+        return self.get.cache_info()
+
+
+def derive_device_key(master_key: bytes, device_id: int) -> bytes:
+    """Returns the key of one device (without caching)."""
+    return DerivedKeys(master_key, cache_size=0)._derive(device_id)
@@ -0,0 +1,177 @@
+"""Manifest builds – many build targets, possibly from different inputs, in one run.
+
+Targets that share an input image are grouped: the input is read and hashed once and
+the in-memory image is encrypted for every target of the group. All targets run on a
+pool of worker threads (AES and CRC32 release the GIL, so they use several cores).
+"""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from encrypt_bin.core.builder import compress_input, image_size, write_image
+from encrypt_bin.core.output import DEFAULT_FSYNC, DEFAULT_WRITE_BUFFER_SIZE, atomic_output
+
+
+class ManifestTarget(NamedTuple):
+    """One image to build: the generate_bin arguments plus a name for the report."""
+
+    name: str
+    input_path: str
+    output_path: str
+    product_id: int
+    app_version: int
+    prev_app_version: int
+    bootloader_id: int
+    key: bytes
+    page_length: int = 2048
+    compression: Optional[str] = None
+    compression_level: Optional[int] = None
+
+
+class TargetResult(NamedTuple):
+    """Outcome and build time of one target."""
+
+    name: str
+    input_path: str
+    output_path: str
+    product_id: int
+    seconds: float
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class InputSummary(NamedTuple):
+    """An input image shared by one or more targets, read and hashed once."""
+
+    path: str
+    size: int
+    sha256: Optional[str]
+    seconds: float
+    targets: int
+
+
+class ManifestReport(NamedTuple):
+    """Results of a manifest run, in target order, and the inputs it read."""
+
+    results: list
+    inputs: list
+    seconds: float
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    def as_dict(self) -> dict:
+        """Returns the report as a JSON-serialisable dict."""
+        return {
+            "ok": not self.failed,
+            "targets": len(self.results),
+            "failed": len(self.failed),
+            "seconds": self.seconds,
+            "inputs": [i._asdict() for i in self.inputs],
+            "results": [{**r._asdict(), "ok": r.ok} for r in self.results],
+        }
+
+
+def group_targets(targets) -> dict:
+    """Groups targets by input file (resolved path) and returns {path: [(index, target), ...]}."""
+    groups = {}
+    for index, target in enumerate(targets):
+        groups.setdefault(os.path.realpath(target.input_path), []).append((index, target))
+    return groups
+
+
+def _read_input(path: str):
+    """Reads an input image and returns (data, sha256 hex digest)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def _build_target(target: ManifestTarget, payload, output_options) -> TargetResult:
+    start = time.perf_counter()
+    error = None
+    try:
+        with atomic_output(target.output_path, image_size(len(payload), target.page_length), **output_options) as dst:
+            write_image(
+                payload,
+                dst,
+                target.product_id,
+                target.app_version,
+                target.prev_app_version,
+                target.bootloader_id,
+                target.key,
+                target.page_length,
+            )
+    except Exception as e:
+        error = str(e)
+    return TargetResult(target.name, target.input_path, target.output_path, target.product_id, time.perf_counter() - start, error)
+
+
+def _failed(target: ManifestTarget, error: str) -> TargetResult:
+    return TargetResult(target.name, target.input_path, target.output_path, target.product_id, 0.0, error)
+
+
+def _group_payloads(data, group):
+    """Yields (index, target, payload) for a group; targets with the same compression share one payload.
+
+    If compressing fails, payload is the exception.
+    """
+    payloads = {}
+    for index, target in group:
+        variant = (target.compression, target.compression_level, target.page_length) if target.compression else None
+        if variant not in payloads:
+            try:
+                payloads[variant] = compress_input(data, *variant, None) if variant else data
+            except Exception as e:
+                payloads[variant] = e
+        yield index, target, payloads[variant]
+
+
+def build_manifest(
+    targets,
+    max_workers: Optional[int] = None,
+    fsync: str = DEFAULT_FSYNC,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+) -> ManifestReport:
+    """Builds every target and returns a ManifestReport; failures do not stop the run.
+
+    Each distinct input is read and hashed once; compressed payloads are shared by the
+    targets with the same codec, level and page length. A group's targets are queued
+    as soon as its input has been read, so reading the next input overlaps with
+    encrypting the previous one. Images are written atomically with the given fsync
+    policy and buffer size.
+    """
+    output_options = {"fsync": fsync, "buffer_size": write_buffer_size}
+    targets = list(targets)
+    start = time.perf_counter()
+    results = [None] * len(targets)
+    inputs = []
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as executor:
+        for path, group in group_targets(targets).items():
+            read_start = time.perf_counter()
+            try:
+                data, digest = _read_input(path)
+            except OSError as e:
+                inputs.append(InputSummary(path, 0, None, time.perf_counter() - read_start, len(group)))
+                for index, target in group:
+                    results[index] = _failed(target, f"cannot read input file: {e}")
+                continue
+            inputs.append(InputSummary(path, len(data), digest, time.perf_counter() - read_start, len(group)))
+
+            for index, target, payload in _group_payloads(data, group):
+                if isinstance(payload, Exception):
+                    results[index] = _failed(target, str(payload))
+                else:
+                    futures.append((index, executor.submit(_build_target, target, payload, output_options)))
+
+        for index, future in futures:
+            results[index] = future.result()
+    return ManifestReport(results, inputs, time.perf_counter() - start)
@@ -0,0 +1,128 @@
+"""Atomic output files – images appear complete under their final name or not at all.
+
+An image is written to a temporary file in the directory of the output, whose final
+size is preallocated when it is known, and renamed over the output once complete. A
+crash or a failed build therefore never leaves a truncated image behind, and an
+existing output is only replaced by a complete one.
+
+fsync selects how durable the result is when the call returns:
+
+    "none"  no fsync; fastest, the new image may be lost (never torn) on power failure
+    "file"  the image data is flushed to disk before the rename (default)
+    "full"  additionally the directory is flushed, so the rename itself is durable
+"""
+
+import contextlib
+import os
+from typing import Optional
+
+FSYNC_POLICIES = ("none", "file", "full")
+DEFAULT_FSYNC = "file"
+DEFAULT_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def _create_temp(path: str, mode: int = 0o666):
+    """Creates a new temporary file next to path and returns (fd, temp path).
+
+    The file is created with mode, from which the kernel removes the umask; the default
+    gives the permissions open(path, "w") would (tempfile.mkstemp always uses 0o600).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    prefix = f".{os.path.basename(path)}."
+    while True:
+        tmp_path = os.path.join(directory, f"{prefix}{os.urandom(6).hex()}.tmp")
+        try:
+            return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), mode), tmp_path
+        except FileExistsError:
+            continue
+
+
+def _preallocate(fd: int, size: int):
+    """Reserves size bytes for the file, where the platform and filesystem support it."""
+    if size > 0 and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass  # e.g. not supported by the filesystem; the file simply grows while written
+
+
+def _copy_mode(path: str, fd: int):
+    """Gives the temporary file the permissions of the file it replaces, if there is one."""
+    if not hasattr(os, "fchmod"):
+        return
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return
+    os.fchmod(fd, mode)
+
+
+def _fsync_directory(directory: str):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories cannot be opened
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_output(
+    path: str,
+    size: Optional[int] = None,
+    fsync: str = DEFAULT_FSYNC,
+    buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    mode: Optional[int] = None,
+):
+    """Yields a buffered binary file that replaces path when the with block completes.
+
+    size is the expected final size, preallocated up front. buffer_size is the size of
+    the write buffer. The new file keeps the permissions of the file it replaces, or
+    gets mode (minus the umask) if given, e.g. 0o600 for files holding keys. If the
+    block raises, the temporary file is removed and path is left untouched.
+    """
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)} (given: {fsync!r})")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = _create_temp(path, 0o666 if mode is None else mode)
+    try:
+        if mode is None:
+            _copy_mode(path, fd)
+        with open(fd, "wb", buffering=buffer_size) as f:
+            if size:
+                _preallocate(fd, size)
+            yield f
+            if size and f.tell() < size:
+                f.truncate()  # less than the preallocated size was written
+            f.flush()
+            if fsync != "none":
+                os.fsync(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    if fsync == "full":
+        _fsync_directory(directory)
+
+
+@contextlib.contextmanager
+def atomic_path(path: str):
+    """Yields the path of a temporary file that replaces path when the with block completes.
+
+    For writers that need a path rather than a file object (a reflink clone, a hard
+    link). The temporary file already exists, with the permissions of the file it
+    replaces; if the block raises, it is removed and path is left untouched.
+    """
+    fd, tmp_path = _create_temp(path)
+    try:
+        _copy_mode(path, fd)
+        os.close(fd)
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
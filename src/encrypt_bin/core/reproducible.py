@@ -0,0 +1,73 @@
+"""Reproducible builds – deterministic IVs, so identical inputs give byte-identical images.
+
+The IV is an HMAC-SHA256 under a separate IV key, truncated to 16 bytes, of the
+plaintext and of every parameter that ends up in the image:
+
+    iv = HMAC-SHA256(iv_key, "encrypt-bin deterministic iv v1" | 0x00 | fields | codec | 0x00 | SHA-256(input))[:16]
+
+    fields = bootloader_id (u32) | product_id (u64) | app_version (u32) | prev_app_version (u32)
+             | page_length (u32) | segment size (u32, 0 = not segmented) | compression level (i32, -1 = auto)
+
+All integers are little endian and codec is the ASCII name of the compression codec
+(empty without compression). The automatic compression level is timing dependent, so
+reproducible builds resolve it from the data alone first (choose_level(by_size=True))
+and the resolved level goes into the IV. The remaining header fields (page count, CRC32) follow
+from these, so the same input and parameters always yield the same image, on any
+platform, while a change of any byte or field gives an unrelated IV. Without an
+explicit IV key, one is derived from the encryption key.
+"""
+
+import hashlib
+import hmac
+import struct
+from typing import Optional
+
+IV_SCHEME = "hmac-sha256-v1"
+IV_DOMAIN = b"encrypt-bin deterministic iv v1"
+IV_FIELDS = struct.Struct("<IQIIIIi")
+_READ_SIZE = 1024 * 1024
+
+
+def content_digest(path: str) -> bytes:
+    """Returns the SHA-256 digest of a file, read in fixed-size chunks."""
+    h = hashlib.sha256()
+    buf = bytearray(_READ_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.digest()
+
+
+def default_iv_key(key: bytes) -> bytes:
+    """Returns the IV key used when none is given, derived from (and independent of) the encryption key."""
+    return hmac.new(key, b"encrypt-bin iv key", hashlib.sha256).digest()
+
+
+def derive_iv(
+    iv_key: bytes,
+    input_digest: bytes,
+    product_id: int,
+    app_version: int,
+    prev_app_version: int,
+    bootloader_id: int,
+    page_length: int = 2048,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    segment_size: Optional[int] = None,
+) -> bytes:
+    """Returns the deterministic IV of a build; input_digest is the SHA-256 of the plaintext input."""
+    fields = IV_FIELDS.pack(
+        bootloader_id,
+        product_id,
+        app_version,
+        prev_app_version,
+        page_length,
+        segment_size or 0,
+        -1 if compression_level is None else compression_level,
+    )
+    message = IV_DOMAIN + b"\x00" + fields + (compression or "").encode("ascii") + b"\x00" + input_digest
+    return hmac.new(iv_key, message, hashlib.sha256).digest()[:16]
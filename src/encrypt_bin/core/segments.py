@@ -0,0 +1,144 @@
+"""Segmented images – independently chained CBC segments that are encrypted in parallel.
+
+The padded plaintext of a segmented image is cut into segments of segment_size bytes
+(a multiple of the page length); each segment is its own CBC chain, so all of them
+can be encrypted at the same time. Segment 0 uses the header IV and starts with a
+16-byte payload extension:
+
+    magic "EBSG" | version (u8) | reserved (u8, u16) | segment size (u32) | segment count (u32)
+
+Segment i > 0 uses IV_i = AES-ECB(key, IV xor i), with i as a 128-bit little-endian
+integer. A bootloader decrypts the first page with the header IV as usual, reads the
+segment size from the extension and switches to IV_i at every segment boundary,
+which always falls on a page boundary. The CRC32 in the header covers the padded
+plaintext, extension included, like in any other image.
+
+The header is that of a regular image, so the extension is the only thing that marks
+the format: write_image refuses to build a plain image whose payload starts with a
+valid extension, since it would be decrypted as a segmented one.
+"""
+
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+SEGMENT_MAGIC = b"EBSG"
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct("<4sBBHII")
+
+
+def segment_ivs(key: bytes, iv: bytes, count: int) -> list:
+    """Returns the IVs of segments 0 to count - 1 (derived in one AES-ECB call)."""
+    from Crypto.Cipher import AES
+
+    base = int.from_bytes(iv, "little")
+    blocks = b"".join((base ^ index).to_bytes(16, "little") for index in range(1, count))
+    derived = AES.new(key, AES.MODE_ECB).encrypt(blocks)
+    return [bytes(iv)] + [derived[i : i + 16] for i in range(0, len(derived), 16)]
+
+
+def segment_iv(key: bytes, iv: bytes, index: int) -> bytes:
+    """Returns the IV of segment index."""
+    if index == 0:
+        return bytes(iv)
+    from Crypto.Cipher import AES
+
+    return AES.new(key, AES.MODE_ECB).encrypt((int.from_bytes(iv, "little") ^ index).to_bytes(16, "little"))
+
+
+def read_segment_header(block, page_length: int) -> Optional[int]:
+    """Returns the segment size if the first plaintext block is a segment extension, else None."""
+    if len(block) < SEGMENT_HEADER.size:
+        return None
+    magic, version, _, _, segment_size, _ = SEGMENT_HEADER.unpack_from(block)
+    if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION or segment_size <= 0 or segment_size % page_length:
+        return None
+    return segment_size
+
+
+def _segment_parts(view, index: int, segment_size: int, header: bytes, padded_len: int):
+    """Returns the plaintext of segment index as a list of buffers (header, input data, zero padding)."""
+    offset = SEGMENT_HEADER.size
+    start = index * segment_size
+    end = min(start + segment_size, padded_len)
+    parts = [header] if index == 0 else []
+    data = view[max(0, start - offset) : max(0, end - offset)]
+    parts.append(data)
+    used = sum(len(p) for p in parts)
+    if used < end - start:
+        parts.append(bytes(end - start - used))
+    return parts
+
+
+def _encrypt_segment(key: bytes, iv: bytes, parts, out):
+    """Encrypts the parts of one segment as a single CBC chain into out and returns its length."""
+    from Crypto.Cipher import AES
+
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    if any(len(p) % 16 for p in parts):
+        parts = [b"".join(parts)]
+    n = 0
+    for part in parts:
+        cipher.encrypt(part, output=out[n : n + len(part)])
+        n += len(part)
+    return n
+
+
+def _as_view(src):
+    """Returns a byte view of a buffer-protocol object, or of the remaining content of a stream."""
+    try:
+        return memoryview(src).cast("B")
+    except TypeError:
+        return memoryview(src.read())
+
+
+def encrypt_segmented(src, dst, key: bytes, iv: bytes, page_length: int, segment_size: int, max_workers=None, timings=None, progress=None):
+    """Encrypts src as a segmented payload into dst and returns (crc32, padded_length).
+
+    src is a buffer-protocol object or a binary stream (read completely). Up to
+    max_workers segments (default: number of CPUs) are encrypted at once on worker
+    threads while the main thread computes the CRC32 of the same segments; the
+    encrypted segments are then written in order (or, if dst has a reserve(n) method,
+    encrypted directly into the views it returns). progress, if given, is called as
+    progress("encrypt", input_bytes_done) after every group of segments.
+    """
+    if segment_size <= 0 or segment_size % page_length:
+        raise ValueError(f"Segment size ({segment_size}) must be a positive multiple of the page length ({page_length}).")
+    view = _as_view(src)
+    size = SEGMENT_HEADER.size + len(view)
+    padded_len = size + (page_length - size % page_length) % page_length
+    count = -(-padded_len // segment_size)
+    header = SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, 0, 0, segment_size, count)
+    ivs = segment_ivs(key, iv, count)
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, count))
+    reserve = getattr(dst, "reserve", None)
+    outs = [memoryview(bytearray(segment_size)) for _ in range(max_workers)] if reserve is None else None
+
+    crc32, write = zlib.crc32, dst.write
+    if timings is not None:
+        crc32 = timings.wrap("crc", crc32)
+        write = timings.wrap("write", write)
+
+    crc32_val = 0
+    with view, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for first in range(0, count, max_workers):
+            indices = range(first, min(first + max_workers, count))
+            segments = [_segment_parts(view, i, segment_size, header, padded_len) for i in indices]
+            targets = outs if reserve is None else [reserve(min(segment_size, padded_len - i * segment_size)) for i in indices]
+            start = time.perf_counter()
+            futures = [executor.submit(_encrypt_segment, key, ivs[i], parts, out) for i, parts, out in zip(indices, segments, targets)]
+            for part in (part for parts in segments for part in parts):
+                crc32_val = crc32(part, crc32_val)
+            lengths = [future.result() for future in futures]
+            if timings is not None:
+                timings.add("encrypt", start, time.perf_counter(), sum(lengths))
+            if reserve is None:
+                for out, n in zip(outs, lengths):
+                    write(out[:n])
+            if progress is not None:
+                progress("encrypt", min(indices[-1] * segment_size + segment_size - SEGMENT_HEADER.size, len(view)))
+
+    return crc32_val & 0xFFFFFFFF, padded_len
@@ -0,0 +1,91 @@
+"""Per-stage timing of the build pipeline."""
+
+import json
+import time
+from contextlib import contextmanager
+
+# Stage names in pipeline order, used to sort the summary.
+STAGE_ORDER = ["read", "diff", "compress", "pad", "iv", "encrypt", "crc", "write", "header", "total"]
+
+
+class StageTimings:
+    """Collects wall time and bytes processed per build stage.
+
+    Pass an instance as ``timings`` to generate_bin. Instrumentation is only set up
+    when an instance is given, so builds without one run the plain code path.
+    """
+
+    def __init__(self):
+        self._clock = time.perf_counter
+        self._origin = self._clock()
+        self.stages = {}
+        self.events = []
+
+    def add(self, name: str, start: float, end: float, nbytes: int = 0):
+        """Records one execution of a stage between two perf_counter() readings."""
+        seconds, total_bytes, calls = self.stages.get(name, (0.0, 0, 0))
+        self.stages[name] = (seconds + end - start, total_bytes + nbytes, calls + 1)
+        self.events.append((name, start - self._origin, end - start, nbytes))
+
+    @contextmanager
+    def stage(self, name: str, nbytes: int = 0):
+        """Times the body of a with block as one execution of a stage."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.add(name, start, self._clock(), nbytes)
+
+    def wrap(self, name: str, func, count="arg"):
+        """Returns func instrumented as stage name.
+
+        count selects how processed bytes are counted: "arg" uses the length of the first
+        argument, "result" the return value (its length, or the value itself for calls
+        returning a byte count such as readinto) and an int is a fixed size per call.
+        """
+        clock = self._clock
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = func(*args, **kwargs)
+            end = clock()
+            if count == "arg":
+                nbytes = len(args[0])
+            elif count == "result":
+                nbytes = result if isinstance(result, int) else len(result)
+            else:
+                nbytes = count
+            self.add(name, start, end, nbytes)
+            return result
+
+        return timed
+
+    def summary(self) -> list:
+        """Returns one dict per stage with wall time, bytes, calls and throughput."""
+        order = {name: i for i, name in enumerate(STAGE_ORDER)}
+        rows = []
+        for name in sorted(self.stages, key=lambda n: order.get(n, len(order))):
+            seconds, nbytes, calls = self.stages[name]
+            mb_per_s = nbytes / (1024 * 1024) / seconds if seconds > 0 and nbytes else None
+            rows.append({"stage": name, "seconds": seconds, "bytes": nbytes, "calls": calls, "mb_per_s": mb_per_s})
+        return rows
+
+    def print_summary(self):
+        """Prints the per-stage summary as a table."""
+        print(f" {'Stage':<8} {'Time [ms]':>10} {'Bytes':>14} {'Calls':>7} {'MB/s':>10}")
+        for row in self.summary():
+            mb_per_s = f"{row['mb_per_s']:.1f}" if row["mb_per_s"] is not None else "-"
+            print(f" {row['stage']:<8} {row['seconds'] * 1000:>10.3f} {row['bytes']:>14} {row['calls']:>7} {mb_per_s:>10}")
+
+    def to_trace(self) -> dict:
+        """Returns the summary plus every recorded event in Chrome trace-event format."""
+        events = [
+            {"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": 0, "tid": 0, "args": {"bytes": nbytes}}
+            for name, start, duration, nbytes in self.events
+        ]
+        return {"stages": self.summary(), "traceEvents": events}
+
+    def save_json(self, path: str):
+        """Writes to_trace() as JSON (loadable in chrome://tracing or Perfetto)."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_trace(), f, indent=1)
@@ -0,0 +1,127 @@
+"""Verification of generated images – header checks and streaming CRC32 of the decrypted payload."""
+
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from encrypt_bin.core.builder import DEFAULT_CHUNK_SIZE, HEADER_SIZE, HEADER_STRUCT
+
+
+class ImageHeader(NamedTuple):
+    """Decoded 48-byte image header."""
+
+    bootloader_id: int
+    device_id: int
+    app_version: int
+    prev_app_version: int
+    num_pages: int
+    page_length: int
+    iv: bytes
+    crc32: int
+
+    @classmethod
+    def unpack(cls, buf):
+        """Decodes a header from the start of buf with a single struct.unpack_from call."""
+        bootloader_id, id_msb, id_lsb, app_version, prev_app_version, num_pages, page_length, iv, crc32 = HEADER_STRUCT.unpack_from(buf)
+        return cls(bootloader_id, (id_msb << 32) | id_lsb, app_version, prev_app_version, num_pages, page_length, iv, crc32)
+
+
+class VerifyResult(NamedTuple):
+    """Outcome of verifying one image. error is None when the image is valid."""
+
+    path: str
+    header: Optional[ImageHeader] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _decrypt_crc32(f, key: bytes, iv: bytes, payload_size: int, page_length: int, chunk_size: int) -> int:
+    """Decrypts payload_size bytes from f in fixed-size chunks and returns the CRC32 of the plaintext.
+
+    Segmented images are recognised by their first plaintext block; the cipher is then
+    restarted with the segment's IV at every segment boundary. The header does not flag
+    the format, so the builder refuses plain payloads that start with a segment extension.
+    """
+    from Crypto.Cipher import AES
+
+    from encrypt_bin.core.segments import read_segment_header, segment_iv
+
+    chunk_size = max(16, chunk_size // 16 * 16)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    buf = bytearray(chunk_size)
+    plain = bytearray(chunk_size)
+    crc32_val = 0
+    done = 0
+    segment_size = None
+    # The first block is decrypted on its own to find out whether the image is segmented
+    segment_end = min(16, payload_size)
+    while done < payload_size:
+        n = f.readinto(memoryview(buf)[: min(chunk_size, segment_end - done)])
+        if not n:
+            raise ValueError("unexpected end of file")
+        cipher.decrypt(memoryview(buf)[:n], output=memoryview(plain)[:n])
+        crc32_val = zlib.crc32(memoryview(plain)[:n], crc32_val)
+        if done == 0:
+            segment_size = read_segment_header(plain[:n], page_length)
+        done += n
+        if done == segment_end:
+            if segment_size is None:
+                segment_end = payload_size
+            else:
+                if done % segment_size == 0:
+                    cipher = AES.new(key, AES.MODE_CBC, segment_iv(key, iv, done // segment_size))
+                segment_end = min(done - done % segment_size + segment_size, payload_size)
+    return crc32_val & 0xFFFFFFFF
+
+
+def verify_bin(path: str, get_key, chunk_size: int = DEFAULT_CHUNK_SIZE) -> VerifyResult:
+    """Verifies one image.
+
+    get_key is either a 16-byte key or a callable returning the key for a device ID
+    (or None when the device is unknown). The payload is decrypted in chunks of
+    chunk_size bytes, so memory use does not depend on the image size.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(HEADER_SIZE)
+            if len(raw) != HEADER_SIZE:
+                return VerifyResult(path, error="file is too short to contain an image header")
+            header = ImageHeader.unpack(raw)
+
+            payload_size = os.fstat(f.fileno()).st_size - HEADER_SIZE
+            if header.num_pages * header.page_length != payload_size:
+                return VerifyResult(
+                    path, header, f"num_pages * page_length ({header.num_pages} * {header.page_length}) does not match payload size ({payload_size})"
+                )
+            if payload_size % 16:
+                return VerifyResult(path, header, f"payload size ({payload_size}) is not a multiple of 16 bytes")
+
+            key = get_key(header.device_id) if callable(get_key) else get_key
+            if key is None:
+                return VerifyResult(path, header, f"no key for device_id 0x{header.device_id:016X}")
+
+            crc32_val = _decrypt_crc32(f, key, header.iv, payload_size, header.page_length, chunk_size)
+    except (OSError, ValueError) as e:
+        return VerifyResult(path, error=str(e))
+
+    if crc32_val != header.crc32:
+        return VerifyResult(path, header, f"CRC32 mismatch (stored 0x{header.crc32:08X}, computed 0x{crc32_val:08X})")
+    return VerifyResult(path, header)
+
+
+def verify_many(paths, get_key, max_workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """Verifies many images concurrently and returns their results in the order of paths.
+
+    AES and CRC32 release the GIL on large buffers, so a thread pool keeps several
+    cores busy while each file is still streamed with a bounded buffer.
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda p: verify_bin(p, get_key, chunk_size), paths))
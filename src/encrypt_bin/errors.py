@@ -0,0 +1,46 @@
+"""Exceptions raised by encrypt-bin.
+
+Library functions raise these instead of exiting, so the GUI, the build server and
+in-process batch jobs can report a bad parameter and carry on. Only the CLI entry
+point turns them into an error message and a non-zero exit code.
+"""
+
+
+class EncryptBinError(Exception):
+    """Base class of all errors reported by encrypt-bin."""
+
+
+class ParameterError(EncryptBinError, ValueError):
+    """A parameter value (number, key, level, ...) is invalid."""
+
+
+class PathError(EncryptBinError):
+    """An input file is missing or an output path is not usable."""
+
+
+class ConfigFileError(EncryptBinError):
+    """A parameter file cannot be read or contradicts the command line."""
+
+
+class KeyFileError(EncryptBinError):
+    """A key file (or its index) cannot be read, written or contains conflicting entries."""
+
+
+class KeyNotFoundError(KeyFileError, LookupError):
+    """A key file has no entry for the requested device ID."""
+
+
+class BuildError(EncryptBinError):
+    """Generating or rewriting an image failed."""
+
+
+class ConfigValidationError(ParameterError):
+    """One or more parameters are invalid; errors lists every problem found."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        if len(self.errors) == 1:
+            message = self.errors[0]
+        else:
+            message = f"{len(self.errors)} invalid parameters:\n" + "\n".join(f" - {error}" for error in self.errors)
+        super().__init__(message)
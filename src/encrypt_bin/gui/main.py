@@ -14,15 +14,71 @@ from PyQt6.QtWidgets import (
     QGroupBox,
     QMessageBox,
     QTextEdit,
+    QProgressBar,
 )
+from PyQt6.QtCore import QThread, pyqtSignal
 
-# from PyQt6.QtCore import Qt
+import os
 import sys
+import threading
 
-# import os
-from encrypt_bin.cli.parser import get_parsed_args
-from encrypt_bin.core.config import Config
-from encrypt_bin.core.builder import generate_bin
+# The CLI/core stack is imported where it is used, so the window can be shown
+# before argparse, the key-file code and pycryptodome are loaded.
+
+PROGRESS_STEPS = 1000
+
+
+class BuildWorker(QThread):
+    """Parses the arguments and builds the image off the GUI thread."""
+
+    loaded = pyqtSignal(object)  # Config
+    progress = pyqtSignal(str, int, int)  # stage, bytes done, total bytes
+    succeeded = pyqtSignal(str)  # output path
+    failed = pyqtSignal(str)  # error message
+    cancelled = pyqtSignal()
+
+    def __init__(self, argv, parent=None):
+        super().__init__(parent)
+        self._argv = argv
+        self._cancel = threading.Event()
+        self._total = 0
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _on_progress(self, stage, done):
+        if self._cancel.is_set():
+            from encrypt_bin.core.builder import BuildCancelled
+
+            raise BuildCancelled()
+        self.progress.emit(stage, done, self._total)
+
+    def run(self):
+        from encrypt_bin.cli.parser import get_parsed_args
+        from encrypt_bin.core.builder import BuildCancelled, generate_bin
+        from encrypt_bin.core.config import Config
+
+        try:
+            config = Config.from_args(get_parsed_args(self._argv))
+            self.loaded.emit(config)
+            self._total = os.path.getsize(config.input_path)
+            self._on_progress("read", 0)
+            generate_bin(
+                input_path=config.input_path,
+                output_path=config.output_path,
+                product_id=config.device_id,
+                app_version=config.app_version,
+                prev_app_version=config.prev_app_version,
+                bootloader_id=config.bootloader_id,
+                key=config.key,
+                page_length=config.page_length,
+                progress=self._on_progress,
+            )
+            self.succeeded.emit(config.output_path)
+        except BuildCancelled:
+            self.cancelled.emit()
+        except (Exception, SystemExit) as e:
+            self.failed.emit(str(e) if isinstance(e, Exception) else str(e.code))
 
 
 class EncryptBinGUI(QMainWindow):
@@ -142,13 +198,27 @@ class EncryptBinGUI(QMainWindow):
         load_config_button.clicked.connect(self.load_configuration)
         save_config_button = QPushButton("Save Configuration")
         save_config_button.clicked.connect(self.save_configuration)
-        generate_button = QPushButton("Generate Binary")
-        generate_button.clicked.connect(self.generate_binary)
+        self.generate_button = QPushButton("Generate Binary")
+        self.generate_button.clicked.connect(self.generate_binary)
         button_layout.addWidget(load_config_button)
         button_layout.addWidget(save_config_button)
-        button_layout.addWidget(generate_button)
+        button_layout.addWidget(self.generate_button)
         layout.addLayout(button_layout)
 
+        # Build progress
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, PROGRESS_STEPS)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("Idle")
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_build)
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_button)
+        layout.addLayout(progress_layout)
+        self.worker = None
+
         # Log output
         log_group = QGroupBox("Log")
         log_layout = QVBoxLayout(log_group)
@@ -224,6 +294,8 @@ class EncryptBinGUI(QMainWindow):
         }
 
     def generate_binary(self):
+        if self.worker is not None:
+            return
         try:
             params = self._validate_and_get_params()
 
@@ -247,30 +319,64 @@ class EncryptBinGUI(QMainWindow):
                 "-l",
                 params["page_length"],
             ]
-            parsed_args = get_parsed_args(shlex.split(' '.join(args)))
-            config = Config.from_args(parsed_args)
-
-            self.log_message("Parameters loaded successfully:")
-            self.log_message(str(config))
-
-            # Generate binary
-            generate_bin(
-                input_path=config.input_path,
-                output_path=config.output_path,
-                product_id=config.device_id,
-                app_version=config.app_version,
-                prev_app_version=config.prev_app_version,
-                bootloader_id=config.bootloader_id,
-                key=config.key,
-                page_length=config.page_length,
-            )
-
-            self.log_message(f"\nOutput file '{config.output_path}' generated successfully.")
-            QMessageBox.information(self, "Success", f"Binary file generated successfully: {config.output_path}")
-
+            argv = shlex.split(' '.join(args))
         except Exception as e:
             self.log_message(f"Error: {e}")
             QMessageBox.critical(self, "Error", str(e))
+            return
+
+        # Parse and build on a worker thread so the window stays responsive
+        self.worker = BuildWorker(argv, self)
+        self.worker.loaded.connect(self._on_build_loaded)
+        self.worker.progress.connect(self._on_build_progress)
+        self.worker.succeeded.connect(self._on_build_succeeded)
+        self.worker.failed.connect(self._on_build_failed)
+        self.worker.cancelled.connect(self._on_build_cancelled)
+        self.worker.finished.connect(self._on_build_finished)
+        self._set_building(True)
+        self.worker.start()
+
+    def cancel_build(self):
+        if self.worker is not None:
+            self.cancel_button.setEnabled(False)
+            self.progress_bar.setFormat("Cancelling...")
+            self.worker.cancel()
+
+    def _set_building(self, building):
+        self.generate_button.setEnabled(not building)
+        self.cancel_button.setEnabled(building)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%" if building else "Idle")
+
+    def _on_build_loaded(self, config):
+        self.log_message("Parameters loaded successfully:")
+        self.log_message(str(config))
+
+    def _on_build_progress(self, stage, done, total):
+        self.progress_bar.setValue(min(PROGRESS_STEPS, done * PROGRESS_STEPS // total) if total else PROGRESS_STEPS)
+        self.progress_bar.setFormat(f"{stage}: %p%")
+
+    def _on_build_succeeded(self, output_path):
+        self.log_message(f"\nOutput file '{output_path}' generated successfully.")
+        QMessageBox.information(self, "Success", f"Binary file generated successfully: {output_path}")
+
+    def _on_build_failed(self, message):
+        self.log_message(f"Error: {message}")
+        QMessageBox.critical(self, "Error", message)
+
+    def _on_build_cancelled(self):
+        self.log_message("Build cancelled; partial output removed.")
+
+    def _on_build_finished(self):
+        self.worker.deleteLater()
+        self.worker = None
+        self._set_building(False)
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        super().closeEvent(event)
 
     def save_configuration(self):
         try:
@@ -333,6 +439,8 @@ class EncryptBinGUI(QMainWindow):
                 temp_path = temp_file.name
 
             try:
+                from encrypt_bin.cli.parser import get_parsed_args
+
                 # Use the parser's built-in config loading mechanism
                 parsed_args = get_parsed_args(["-c", temp_path])
                 # populate fields from parsed_args
@@ -354,8 +462,6 @@ class EncryptBinGUI(QMainWindow):
                 self.log_message(f"Configuration loaded from {path}")
             finally:
                 # Clean up temp file
-                import os
-
                 os.unlink(temp_path)
 
         except (Exception, SystemExit) as e:
@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+import pytest
+
+from encrypt_bin.core import builder
+from encrypt_bin.core.aio import generate_batch_async, generate_bin_async
+from encrypt_bin.core.builder import generate_bin
+
+KEY = bytes(range(16))
+IV = bytes(range(100, 116))
+
+
+def test_generate_bin_async_matches_sync(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(70000))
+
+    generate_bin(str(input_file), str(tmp_path / "sync.bin"), 0x1234, 2, 1, 0x10, KEY, 256, iv=IV)
+    asyncio.run(generate_bin_async(str(input_file), str(tmp_path / "async.bin"), 0x1234, 2, 1, 0x10, KEY, 256, iv=IV))
+
+    assert (tmp_path / "async.bin").read_bytes() == (tmp_path / "sync.bin").read_bytes()
+
+
+def test_generate_batch_async_limits_concurrency(tmp_path, monkeypatch):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(5000))
+    running, peak = [0], [0]
+    real_write_image = builder.write_image
+
+    def counting_write_image(*args, **kwargs):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        try:
+            return real_write_image(*args, **kwargs)
+        finally:
+            running[0] -= 1
+
+    monkeypatch.setattr(builder, "write_image", counting_write_image)
+    jobs = [
+        dict(input_path=str(input_file), output_path=str(tmp_path / f"{i}.bin"), product_id=i, app_version=1,
+             prev_app_version=0, bootloader_id=1, key=KEY)
+        for i in range(8)
+    ]
+    jobs.append({**jobs[0], "input_path": str(tmp_path / "missing.bin"), "product_id": 99})
+
+    results = asyncio.run(generate_batch_async(jobs, max_concurrency=2))
+
+    assert [r.device_id for r in results] == list(range(8)) + [99]
+    assert all(r.ok for r in results[:8])
+    assert "does not exist" in results[8].error
+    assert peak[0] <= 2
+
+
+def test_generate_bin_async_cancel_removes_output(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(64 * 1024))
+    output_file = tmp_path / "out.bin"
+
+    async def run():
+        started = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        release = asyncio.Event()
+
+        def progress(stage, done):
+            loop.call_soon_threadsafe(started.set)
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+
+        task = asyncio.ensure_future(
+            generate_bin_async(str(input_file), str(output_file), 1, 1, 0, 1, KEY, chunk_size=1024, progress=progress)
+        )
+        await started.wait()
+        task.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert not output_file.exists()
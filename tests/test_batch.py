@@ -0,0 +1,97 @@
+import sys
+import zlib
+import pytest
+from unittest.mock import patch
+from Crypto.Cipher import AES
+from encrypt_bin.__main__ import main
+from encrypt_bin.cli import validators
+from encrypt_bin.core.batch import build_batch, format_output_path
+from encrypt_bin.errors import PathError
+
+KEYS = {
+    0x1234: bytes(range(16)),
+    0x5678: bytes(range(16, 32)),
+    0xABCDEF0012345678: bytes(range(32, 48)),
+}
+
+
+def _decrypt_payload(image, key):
+    iv = image[28:44]
+    crc = int.from_bytes(image[44:48], "little")
+    plain = AES.new(key, AES.MODE_CBC, iv).decrypt(image[48:])
+    assert zlib.crc32(plain) & 0xFFFFFFFF == crc
+    return plain
+
+
+def test_format_output_path():
+    assert format_output_path("out/{device_id:016X}.bin", 0x1234) == "out/0000000000001234.bin"
+
+
+def test_build_batch_all_devices(tmp_path):
+    data = bytes(range(256)) * 3
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(data)
+    template = str(tmp_path / "{device_id:016X}.bin")
+
+    results = build_batch(str(input_file), KEYS, template, 0x1201, 0x1100, 0x10, page_length=256, max_workers=2)
+
+    assert [r.device_id for r in results] == sorted(KEYS)
+    assert all(r.ok for r in results)
+    for device_id, key in KEYS.items():
+        image = (tmp_path / f"{device_id:016X}.bin").read_bytes()
+        assert int.from_bytes(image[4:8], "little") == device_id >> 32
+        assert int.from_bytes(image[8:12], "little") == device_id & 0xFFFFFFFF
+        assert _decrypt_payload(image, key) == data
+
+
+def test_build_batch_reports_failures(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\x01" * 50)
+    template = str(tmp_path / "missing_dir" / "{device_id:X}.bin")
+
+    results = build_batch(str(input_file), {0x1: bytes(16)}, template, 1, 0, 1, page_length=16, max_workers=1)
+
+    assert len(results) == 1
+    assert not results[0].ok
+
+
+def test_build_batch_missing_input(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        build_batch(str(tmp_path / "missing.bin"), KEYS, str(tmp_path / "{device_id}.bin"), 1, 0, 1)
+
+
+@pytest.mark.parametrize(
+    "template, msg",
+    [
+        ("out.bin", "must contain a '{device_id}' field"),
+        ("{device}.bin", "invalid output template"),
+        ("{device_id:X}.txt", "'.bin' extension"),
+    ],
+)
+def test_validate_output_template_invalid(tmp_path, monkeypatch, template, msg):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(PathError) as e:
+        validators.validate_output_template(template)
+    assert msg in str(e.value)
+
+
+def test_main_batch_command(tmp_path, monkeypatch):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(range(50)))
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text(
+        "0x1234;00 11 22 33 44 55 66 77 88 99 AA BB CC DD EE FF\n"
+        "0x5678;11 22 33 44 55 66 77 88 99 AA BB CC DD EE FF 00\n"
+    )
+    key_file.chmod(0o600)
+    template = str(tmp_path / "{device_id:016X}.bin")
+
+    argv = ["prog", "batch", "-i", str(input_file), "-o", template, "-K", str(key_file), "-b", "0x10", "-v", "0x1201", "-p", "0x1100", "-j", "1"]
+    monkeypatch.setattr(sys, "argv", argv)
+    with patch("builtins.print") as mock_print:
+        main()
+
+    printed = "".join(str(call.args[0]) for call in mock_print.mock_calls)
+    assert "2 of 2 images generated successfully" in printed
+    assert (tmp_path / "0000000000001234.bin").exists()
+    assert (tmp_path / "0000000000005678.bin").exists()
@@ -1,6 +1,11 @@
+import io
 import pytest
 import os
-from encrypt_bin.core.builder import generate_bin
+import struct
+import zlib
+from encrypt_bin.core import builder
+from encrypt_bin.core.buffer_build import build_image
+from encrypt_bin.core.builder import generate_bin, pad_bytes, encrypt_aes_cbc
 from encrypt_bin.cli import parser
 
 
@@ -69,3 +74,253 @@ def test_load_requirements_file_success(tmp_path):
     args = parser.load_requirements_file(str(path))
 
     assert args == ["-i", "input.bin", "-o", "output.bin"]
+
+
+def _reference_image(data, product_id, app_version, prev_app_version, bootloader_id, key, page_length, iv):
+    """Builds an image the original single-pass way, for comparison."""
+    padded = pad_bytes(data, page_length)
+    header = struct.pack(
+        "<7I",
+        bootloader_id,
+        (product_id >> 32) & 0xFFFFFFFF,
+        product_id & 0xFFFFFFFF,
+        app_version,
+        prev_app_version,
+        len(padded) // page_length,
+        page_length,
+    )
+    crc = struct.pack("<I", zlib.crc32(padded) & 0xFFFFFFFF)
+    return header + iv + crc + encrypt_aes_cbc(padded, key, iv)
+
+
+@pytest.mark.parametrize("size", [0, 1, 16, 50, 64, 1000, 4096])
+@pytest.mark.parametrize("chunk_size", [16, 48, 1024 * 1024])
+@pytest.mark.parametrize("mmap_threshold", [None, 1])
+def test_generate_bin_streaming_matches_single_pass(tmp_path, monkeypatch, size, chunk_size, mmap_threshold):
+    iv = bytes(range(100, 116))
+    key = bytes(range(16))
+    monkeypatch.setattr(builder, "get_random_bytes", lambda n: iv)
+
+    data = os.urandom(size)
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(data)
+    output_file = tmp_path / "out.bin"
+
+    generate_bin(
+        input_path=str(input_file),
+        output_path=str(output_file),
+        product_id=0x12345678ABCDEF00,
+        app_version=0x1201,
+        prev_app_version=0x1100,
+        bootloader_id=0x10,
+        key=key,
+        page_length=32,
+        chunk_size=chunk_size,
+        mmap_threshold=mmap_threshold,
+    )
+
+    expected = _reference_image(data, 0x12345678ABCDEF00, 0x1201, 0x1100, 0x10, key, 32, iv)
+    assert output_file.read_bytes() == expected
+
+
+def test_aligned_chunk_size():
+    assert builder._aligned_chunk_size(1000, 2048) == 2048
+    assert builder._aligned_chunk_size(5000, 2048) == 4096
+    assert builder._aligned_chunk_size(100, 24) == 96
+
+
+def _build(tmp_path, name="out.bin", size=100):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(range(size)))
+    output_file = tmp_path / name
+    generate_bin(str(input_file), str(output_file), 0x12345678ABCDEF00, 0x1201, 0x1100, 0x10, bytes(range(16)), page_length=32)
+    return output_file
+
+
+def test_rewrap_header_in_place(tmp_path):
+    image = _build(tmp_path)
+    before = image.read_bytes()
+
+    builder.rewrap_header(str(image), app_version=0x1300, prev_app_version=0x1201)
+
+    after = image.read_bytes()
+    fields = builder.HEADER_STRUCT.unpack(after[: builder.HEADER_SIZE])
+    assert fields[0] == 0x10
+    assert fields[3] == 0x1300
+    assert fields[4] == 0x1201
+    # Everything except the two version fields is untouched
+    assert after[:12] == before[:12]
+    assert after[20:] == before[20:]
+
+
+def test_rewrap_header_to_new_file(tmp_path):
+    image = _build(tmp_path)
+    before = image.read_bytes()
+    variant = tmp_path / "variant.bin"
+
+    builder.rewrap_header(str(image), str(variant), bootloader_id=0x20)
+
+    assert image.read_bytes() == before
+    out = variant.read_bytes()
+    assert int.from_bytes(out[0:4], "little") == 0x20
+    assert out[4:] == before[4:]
+
+
+def test_rewrap_header_keeps_existing_output_on_failure(tmp_path, monkeypatch):
+    image = _build(tmp_path)
+    variant = tmp_path / "variant.bin"
+    variant.write_bytes(b"previous variant")
+
+    def failing_clone(src_path, dst_path):
+        with open(dst_path, "wb") as f:
+            f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(builder, "clone_file", failing_clone)
+    with pytest.raises(OSError):
+        builder.rewrap_header(str(image), str(variant), bootloader_id=0x20)
+    assert variant.read_bytes() == b"previous variant"
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_rewrap_header_rejects_invalid_image(tmp_path):
+    bad = tmp_path / "bad.bin"
+    bad.write_bytes(b"\x00" * 10)
+    with pytest.raises(ValueError, match="too short"):
+        builder.rewrap_header(str(bad), app_version=1)
+
+    bad.write_bytes(b"\x00" * 100)
+    with pytest.raises(ValueError, match="not a valid image"):
+        builder.rewrap_header(str(bad), app_version=1)
+
+    with pytest.raises(FileNotFoundError):
+        builder.rewrap_header(str(tmp_path / "missing.bin"), app_version=1)
+
+
+def test_generate_bin_reports_progress(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\x11" * 1000)
+    events = []
+
+    generate_bin(str(input_file), str(tmp_path / "out.bin"), 1, 1, 0, 1, bytes(16), page_length=64, chunk_size=256,
+                 progress=lambda stage, done: events.append((stage, done)))
+
+    assert events == [("encrypt", 256), ("encrypt", 512), ("encrypt", 768), ("encrypt", 1000), ("done", 1024)]
+
+
+@pytest.mark.parametrize("mmap_threshold", [None, 1])
+def test_generate_bin_cancel_removes_partial_output(tmp_path, mmap_threshold):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\x11" * 1000)
+    output_file = tmp_path / "out.bin"
+
+    def cancel_after_first_chunk(stage, done):
+        raise builder.BuildCancelled()
+
+    with pytest.raises(builder.BuildCancelled):
+        generate_bin(str(input_file), str(output_file), 1, 1, 0, 1, bytes(16), page_length=64, chunk_size=256,
+                     progress=cancel_after_first_chunk, mmap_threshold=mmap_threshold)
+    assert not output_file.exists()
+
+
+class _TrickleReader(io.RawIOBase):
+    """Stream that returns at most 7 bytes per read, like a pipe."""
+
+    def __init__(self, data):
+        self._data = memoryview(data)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(7, len(b), len(self._data) - self._pos)
+        b[:n] = self._data[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+
+@pytest.mark.parametrize("size", [0, 100, 1000, 1024])
+def test_write_image_fused_blocks_and_short_reads(monkeypatch, size):
+    iv = bytes(range(100, 116))
+    key = bytes(range(16))
+    monkeypatch.setattr(builder, "get_random_bytes", lambda n: iv)
+    monkeypatch.setattr(builder, "FUSED_BLOCK_SIZE", 64)
+    data = os.urandom(size)
+
+    dst = io.BytesIO()
+    builder.write_image(_TrickleReader(data), dst, 0x1234, 1, 0, 2, key, page_length=32, chunk_size=256)
+
+    assert dst.getvalue() == _reference_image(data, 0x1234, 1, 0, 2, key, 32, iv)
+
+
+@pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview])
+def test_write_image_from_buffer(monkeypatch, wrap):
+    iv = bytes(range(100, 116))
+    key = bytes(range(16))
+    monkeypatch.setattr(builder, "get_random_bytes", lambda n: iv)
+    data = os.urandom(1000)
+
+    dst = io.BytesIO()
+    builder.write_image(wrap(data), dst, 0x1234, 1, 0, 2, key, page_length=32, chunk_size=256)
+
+    assert dst.getvalue() == _reference_image(data, 0x1234, 1, 0, 2, key, 32, iv)
+
+
+class _PipeSink:
+    """Non-seekable sink, like an upload stream."""
+
+    def __init__(self):
+        self.writes = []
+
+    def seekable(self):
+        return False
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return len(data)
+
+
+@pytest.mark.parametrize("size", [0, 1000, 5000])
+def test_build_image_in_memory(size):
+    iv = bytes(range(100, 116))
+    key = bytes(range(16))
+    data = os.urandom(size)
+    expected = _reference_image(data, 0x1234, 1, 0, 2, key, 32, iv)
+    args = (0x1234, 1, 0, 2, key, 32)
+
+    image = build_image(data, *args, iv=iv, chunk_size=256)
+    assert isinstance(image, bytearray) and image == expected
+
+    out = bytearray(len(expected) + 10)
+    assert build_image(memoryview(data), *args, out=out, iv=iv, chunk_size=256) == len(expected)
+    assert out[: len(expected)] == expected and out[len(expected) :] == bytes(10)
+
+    stream, sink = io.BytesIO(b"prefix"), _PipeSink()
+    stream.seek(0, io.SEEK_END)
+    assert build_image(bytearray(data), *args, out=stream, iv=iv) == len(expected)
+    assert stream.getvalue() == b"prefix" + expected
+    assert build_image(data, *args, out=sink, iv=iv) == len(expected)
+    assert sink.writes == [expected]
+
+
+@pytest.mark.parametrize("options", [{"compression": "zlib", "compression_level": 6}, {"segment_size": 1024, "segment_workers": 2}])
+def test_build_image_matches_generate_bin(tmp_path, options):
+    iv = bytes(range(100, 116))
+    key = bytes(range(16))
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(range(256)) * 20)
+    output = tmp_path / "out.bin"
+    generate_bin(str(input_file), str(output), 0x1234, 1, 0, 2, key, page_length=256, iv=iv, **options)
+
+    with open(input_file, "rb") as f, builder.map_input(f) as mm:
+        image = build_image(mm, 0x1234, 1, 0, 2, key, 256, iv=iv, **options)
+    assert image == output.read_bytes()
+
+
+def test_build_image_rejects_unusable_output():
+    key = bytes(range(16))
+    with pytest.raises(ValueError, match="too small"):
+        build_image(bytes(100), 0x1234, 1, 0, 2, key, 32, out=bytearray(64))
+    with pytest.raises(TypeError, match="writable"):
+        build_image(bytes(100), 0x1234, 1, 0, 2, key, 32, out=bytes(200))
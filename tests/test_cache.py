@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from encrypt_bin.core import cache as cache_module
+from encrypt_bin.core.builder import generate_bin
+from encrypt_bin.core.cache import BuildCache, build_key, content_digest, key_fingerprint
+from encrypt_bin.core.compression import choose_level
+from encrypt_bin.core.verifier import verify_bin
+
+KEY = bytes(range(16))
+PARAMS = dict(product_id=0x1234, app_version=2, prev_app_version=1, bootloader_id=0x10)
+
+
+@pytest.fixture
+def firmware(tmp_path):
+    path = tmp_path / "firmware.bin"
+    path.write_bytes(os.urandom(10000))
+    return path
+
+
+def test_cache_hit_returns_identical_image(tmp_path, firmware, monkeypatch):
+    cache = BuildCache(str(tmp_path / "cache"))
+    first, second = tmp_path / "a.bin", tmp_path / "b.bin"
+
+    assert cache.generate_bin(str(firmware), str(first), key=KEY, **PARAMS) is False
+    monkeypatch.setattr(cache_module, "generate_bin", lambda *a, **k: pytest.fail("cache hit must not rebuild"))
+    assert cache.generate_bin(str(firmware), str(second), key=KEY, **PARAMS) is True
+
+    assert second.read_bytes() == first.read_bytes()
+    assert verify_bin(str(second), KEY).ok
+
+
+def test_cache_misses_when_input_parameters_or_key_change(tmp_path, firmware):
+    cache = BuildCache(str(tmp_path / "cache"))
+    out = str(tmp_path / "out.bin")
+    assert cache.generate_bin(str(firmware), out, key=KEY, **PARAMS) is False
+
+    assert cache.generate_bin(str(firmware), out, key=KEY, **{**PARAMS, "app_version": 3}) is False
+    assert cache.generate_bin(str(firmware), out, key=bytes(16), **PARAMS) is False
+    firmware.write_bytes(b"changed")
+    assert cache.generate_bin(str(firmware), out, key=KEY, **PARAMS) is False
+
+
+def test_cache_key_never_contains_the_raw_key():
+    digest = content_digest(__file__)
+    assert KEY.hex() not in build_key(digest, KEY, PARAMS)
+    assert key_fingerprint(KEY) != key_fingerprint(bytes(16))
+    assert KEY.hex() not in key_fingerprint(KEY)
+
+
+def test_deterministic_iv_reproduces_image_after_eviction(tmp_path, firmware):
+    first, second = tmp_path / "a.bin", tmp_path / "b.bin"
+    BuildCache(str(tmp_path / "cache1")).generate_bin(str(firmware), str(first), key=KEY, deterministic_iv=True, **PARAMS)
+    BuildCache(str(tmp_path / "cache2")).generate_bin(str(firmware), str(second), key=KEY, deterministic_iv=True, **PARAMS)
+
+    assert first.read_bytes() == second.read_bytes()
+    # Same derivation as an uncached deterministic build
+    uncached = tmp_path / "c.bin"
+    generate_bin(str(firmware), str(uncached), key=KEY, deterministic_iv=True, **PARAMS)
+    assert uncached.read_bytes() == first.read_bytes()
+    assert verify_bin(str(first), KEY).ok
+
+
+def test_cache_key_holds_the_resolved_compression_level(tmp_path):
+    firmware = tmp_path / "firmware.bin"
+    firmware.write_bytes(b"".join(b"config value %d = %d;\n" % (i, i * i % 97) for i in range(3000)))
+    cache = BuildCache(str(tmp_path / "cache"))
+    auto, explicit = tmp_path / "a.bin", tmp_path / "b.bin"
+    options = dict(key=KEY, page_length=256, compression="zlib", deterministic_iv=True, **PARAMS)
+
+    assert cache.generate_bin(str(firmware), str(auto), **options) is False
+    level = choose_level(firmware.read_bytes(), "zlib", 256, by_size=True)
+    assert cache.generate_bin(str(firmware), str(explicit), compression_level=level, **options) is True
+    assert explicit.read_bytes() == auto.read_bytes()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"), max_bytes=3000)
+    image = tmp_path / "image.bin"
+    image.write_bytes(bytes(1000))
+    for i, name in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+        cache.put(name, str(image))
+        os.utime(cache._entry_path(name), ns=(i * 10**9, i * 10**9))
+
+    assert cache.get("a" * 64, str(tmp_path / "out.bin"))  # touches "a": now "b" is the oldest
+    cache.put("d" * 64, str(image))
+
+    assert cache.get("b" * 64, str(tmp_path / "out.bin")) is False
+    assert cache.get("a" * 64, str(tmp_path / "out.bin"))
+    assert cache.size() <= 3000
+
+
+def test_cache_hardlink(tmp_path, firmware):
+    cache = BuildCache(str(tmp_path / "cache"), hardlink=True)
+    out = tmp_path / "out.bin"
+    cache.generate_bin(str(firmware), str(out), key=KEY, **PARAMS)
+    cache.generate_bin(str(firmware), str(out), key=KEY, **PARAMS)
+
+    assert out.stat().st_nlink == 2
+
+
+def test_failed_export_keeps_previous_output(tmp_path, firmware, monkeypatch):
+    cache = BuildCache(str(tmp_path / "cache"))
+    out = tmp_path / "out.bin"
+    cache.generate_bin(str(firmware), str(out), key=KEY, **PARAMS)
+    out.write_bytes(b"previous image")
+
+    def failing_clone(src_path, dst_path):
+        with open(dst_path, "wb") as f:
+            f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(cache_module, "clone_file", failing_clone)
+    with pytest.raises(OSError):
+        cache.generate_bin(str(firmware), str(out), key=KEY, **PARAMS)
+    assert out.read_bytes() == b"previous image"
+    assert sorted(os.listdir(tmp_path)) == ["cache", "firmware.bin", "out.bin"]
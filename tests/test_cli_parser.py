@@ -1,7 +1,8 @@
 import pytest
 import sys
 from unittest.mock import patch
-from encrypt_bin.cli import parser
+from encrypt_bin.cli import parser, subparsers
+from encrypt_bin.errors import ConfigFileError, ConfigValidationError
 import os
 
 # -----------------------
@@ -18,19 +19,19 @@ def test_load_requirements_file_success(tmp_path):
 
 
 def test_load_requirements_file_missing(tmp_path):
-    """Missing file -> SystemExit"""
+    """Missing file -> ConfigFileError"""
     bad_file = tmp_path / "does_not_exist.txt"
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigFileError) as e:
         parser.load_requirements_file(str(bad_file))
-    assert "Error reading requirements file" in str(e.value)
+    assert "cannot read requirements file" in str(e.value)
 
 
 def test_load_requirements_file_open_exception(monkeypatch):
     """Error opening file (e.g., permissions)"""
     with patch("builtins.open", side_effect=OSError("mocked error")):
-        with pytest.raises(SystemExit) as e:
+        with pytest.raises(ConfigFileError) as e:
             parser.load_requirements_file("dummy.txt")
-        assert "Error reading requirements file" in str(e.value)
+        assert "cannot read requirements file" in str(e.value)
 
 
 def test_load_requirements_file_shlex_exception(tmp_path, monkeypatch):
@@ -40,9 +41,9 @@ def test_load_requirements_file_shlex_exception(tmp_path, monkeypatch):
     monkeypatch.setattr(
         "shlex.split", lambda *_a, **_k: (_ for _ in ()).throw(ValueError("mocked"))
     )
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigFileError) as e:
         parser.load_requirements_file(str(path))
-    assert "Error reading requirements file" in str(e.value)
+    assert "cannot read requirements file" in str(e.value)
 
 
 # -----------------------
@@ -62,7 +63,7 @@ def test_merge_args_conflict():
     """Same flag with different values -> error"""
     file_args = ["-i", "file1.bin"]
     cli_args = ["-i", "file2.bin"]
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigFileError) as e:
         parser.merge_args(file_args, cli_args)
     assert "appears in both file and CLI" in str(e.value)
 
@@ -71,7 +72,7 @@ def test_merge_args_bad_syntax():
     """Missing flag before value -> syntax error"""
     file_args = ["value_without_flag"]
     cli_args = []
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigFileError) as e:
         parser.merge_args(file_args, cli_args)
     assert "invalid parameter syntax" in str(e.value)
 
@@ -202,7 +203,7 @@ def test_get_parsed_args_invalid_input(monkeypatch, tmp_path):
         "1",
     ]
     monkeypatch.setattr(sys, "argv", ["prog"] + argv)
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigValidationError) as e:
         parser.get_parsed_args()
     assert "input file" in str(e.value)
 
@@ -228,7 +229,7 @@ def test_get_parsed_args_invalid_output(monkeypatch, tmp_path):
         "1",
     ]
     monkeypatch.setattr(sys, "argv", ["prog"] + argv)
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigValidationError) as e:
         parser.get_parsed_args()
     assert "output directory" in str(e.value)
 
@@ -254,7 +255,7 @@ def test_get_parsed_args_invalid_number(monkeypatch, tmp_path):
         "0x1100",
     ]
     monkeypatch.setattr(sys, "argv", ["prog"] + argv)
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigValidationError) as e:
         parser.get_parsed_args()
     assert "Device ID" in str(e.value)
 
@@ -280,7 +281,7 @@ def test_get_parsed_args_invalid_key(monkeypatch, tmp_path):
         "0x1100",
     ]
     monkeypatch.setattr(sys, "argv", ["prog"] + argv)
-    with pytest.raises(SystemExit):
+    with pytest.raises(ConfigValidationError):
         parser.get_parsed_args()
 
 
@@ -331,7 +332,35 @@ def test_get_parsed_args_key_file_missing_id(monkeypatch, tmp_path):
     ]
     monkeypatch.setattr(sys, "argv", ["prog"] + argv)
     
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ConfigValidationError) as e:
         parser.get_parsed_args()
     
-    assert "could not find key for device_id" in str(e.value)
\ No newline at end of file
+    assert "could not find key for device_id" in str(e.value)
+
+
+def test_get_parsed_args_reports_all_errors(tmp_path):
+    """Every invalid parameter is reported in one ConfigValidationError"""
+    argv = ["-i", str(tmp_path / "missing.bin"), "-o", str(tmp_path / "out.bin"), "-d", "zz", "-b", "0x10",
+            "-k", "00", "-v", "1", "-p", "0"]
+    with pytest.raises(ConfigValidationError) as e:
+        parser.get_parsed_args(argv)
+    assert len(e.value.errors) == 3
+    assert "input file" in e.value.errors[0]
+    assert "Device ID" in e.value.errors[1]
+    assert "16 bytes" in e.value.errors[2]
+
+
+@pytest.mark.parametrize(
+    "get_args, argv",
+    [
+        (subparsers.get_batch_args, ["-i", "fw.bin", "-o", "out.bin", "-K", "keys.txt", "-b", "1", "-v", "1", "-p", "0"]),
+        (subparsers.get_verify_args, ["out.bin", "-k", "00112233445566778899AABBCCDDEEFF"]),
+        (subparsers.get_manifest_args, ["manifest.json"]),
+        (subparsers.get_serve_args, ["--socket", "build.sock"]),
+    ],
+)
+@pytest.mark.parametrize("jobs", ["0", "-1", "two"])
+def test_subcommands_reject_invalid_jobs(get_args, argv, jobs, capsys):
+    with pytest.raises(SystemExit):
+        get_args(argv + ["-j", jobs])
+    assert f"argument -j/--jobs: must be a positive integer (given: {jobs})" in capsys.readouterr().err
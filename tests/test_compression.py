@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from Crypto.Cipher import AES
+
+from encrypt_bin.core import compression
+from encrypt_bin.core.builder import HEADER_SIZE, generate_bin
+from encrypt_bin.core.compression import (
+    EXT_HEADER,
+    STORED_FLAG,
+    Codec,
+    choose_level,
+    compress_payload,
+    decompress_payload,
+    register_codec,
+)
+from encrypt_bin.core.verifier import ImageHeader, verify_bin
+
+KEY = bytes(range(16))
+
+
+def _firmware(size):
+    """Compressible code-like bytes with an incompressible (random) section and an erased tail."""
+    code = bytes((i * 7 + (i >> 5)) & 0x3F for i in range(size // 2))
+    return (code + os.urandom(size // 4) + b"\xFF" * size)[:size]
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+@pytest.mark.parametrize("size", [0, 1, 2048, 10000])
+def test_compress_payload_round_trip(codec, size):
+    data = _firmware(size)
+    result = compress_payload(data, codec, block_size=2048)
+
+    assert result.codec == codec
+    assert result.uncompressed_size == size
+    assert decompress_payload(bytes(result.data) + bytes(37)) == data
+
+
+def test_compress_payload_stores_incompressible_blocks():
+    data = os.urandom(4096) + bytes(4096)
+    result = compress_payload(data, "zlib", 6, block_size=4096)
+
+    magic, version, codec_id, level, _, size, block_size, count = EXT_HEADER.unpack_from(result.data)
+    assert (magic, version, codec_id, level, size, block_size, count) == (b"EBCZ", 1, 1, 6, 8192, 4096, 2)
+    first, second = (int.from_bytes(result.data[EXT_HEADER.size + 4 * i : EXT_HEADER.size + 4 * i + 4], "little") for i in range(2))
+    assert first == 4096 | STORED_FLAG
+    assert second < 100
+    assert result.ratio < 0.6
+
+
+def test_compress_payload_rejects_invalid_settings():
+    with pytest.raises(ValueError, match="unknown compression codec"):
+        compress_payload(b"x", "lz4")
+    with pytest.raises(ValueError, match="invalid zlib level"):
+        compress_payload(b"x", "zlib", 12)
+
+
+def test_choose_level_prefers_fastest_of_the_smallest(monkeypatch):
+    clock = [0.0]
+    sizes = {1: 12, 2: 10, 3: 10}
+    costs = {1: 1.0, 2: 5.0, 3: 2.0}
+
+    def compress(block, level, block_size):
+        clock[0] += costs[level]
+        return bytes(sizes[level])
+
+    monkeypatch.setitem(compression.CODECS, "test", Codec(200, (1, 2, 3), compress, None))
+    monkeypatch.setattr(compression.time, "perf_counter", lambda: clock[0])
+    # Level 1 is fastest but clearly larger; levels 2 and 3 tie on size and 3 is faster
+    assert choose_level(bytes(8192), "test", 2048) == 3
+
+
+def test_register_codec_rejects_duplicate_id(monkeypatch):
+    monkeypatch.setattr(compression, "CODECS", dict(compression.CODECS))
+    with pytest.raises(ValueError):
+        register_codec("other", Codec(1, (0,), None, None))
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_generate_bin_with_compression(tmp_path, codec):
+    data = _firmware(50000)
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(data)
+    output_file = tmp_path / "out.bin"
+
+    generate_bin(str(input_file), str(output_file), 0x1234, 2, 1, 0x10, KEY, page_length=1024, compression=codec, compression_level=None)
+
+    image = output_file.read_bytes()
+    assert len(image) < HEADER_SIZE + len(data)
+    assert (len(image) - HEADER_SIZE) % 1024 == 0
+    assert verify_bin(str(output_file), KEY).ok
+    header = ImageHeader.unpack(image)
+    payload = AES.new(KEY, AES.MODE_CBC, header.iv).decrypt(image[HEADER_SIZE:])
+    assert decompress_payload(payload) == data
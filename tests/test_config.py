@@ -1,7 +1,11 @@
 # tests/test_config.py
-from encrypt_bin.core.config import Config
 from types import SimpleNamespace
 
+import pytest
+
+from encrypt_bin.core.config import Config
+from encrypt_bin.errors import ConfigValidationError
+
 
 def test_config_from_args_and_summary(tmp_path, capsys):
     args = SimpleNamespace(
@@ -23,3 +27,29 @@ def test_config_from_args_and_summary(tmp_path, capsys):
     captured = capsys.readouterr()
     assert "Input" in captured.out
     assert "Device" in captured.out
+
+
+def test_config_validate_reports_all_errors(tmp_path):
+    cfg = Config(str(tmp_path / "missing.bin"), str(tmp_path / "no_dir" / "out.bin"), 1 << 64, 0x10, b"\x00" * 15, 1, 0, 100)
+
+    errors = cfg.validate()
+    assert len(errors) == 5
+    assert any("Device ID" in e for e in errors)
+    assert any("page length" in e for e in errors)
+    assert any("16 bytes" in e for e in errors)
+    assert any("input file" in e for e in errors)
+    assert any("output directory" in e for e in errors)
+    assert len(cfg.validate(check_paths=False)) == 3
+
+    with pytest.raises(ConfigValidationError) as e:
+        cfg.check()
+    assert e.value.errors == errors
+    assert str(e.value).startswith("5 invalid parameters:")
+
+
+def test_config_check_accepts_valid_parameters(tmp_path):
+    input_file = tmp_path / "in.bin"
+    input_file.write_bytes(b"\x00")
+    cfg = Config(str(input_file), str(tmp_path / "out.bin"), 0x1234, 0x10, b"\x00" * 16, 1, 0, 2048)
+    assert cfg.validate() == []
+    cfg.check()
@@ -0,0 +1,93 @@
+import os
+import struct
+import zlib
+
+import pytest
+from Crypto.Cipher import AES
+
+from encrypt_bin.core import builder
+from encrypt_bin.core.delta import (
+    DELTA_MAGIC,
+    MANIFEST_HEADER,
+    build_delta_payload,
+    changed_pages,
+    generate_delta_bin,
+    page_digests,
+)
+from encrypt_bin.core.verifier import ImageHeader, verify_bin
+
+KEY = bytes(range(16))
+PAGE = 64
+
+
+def _apply_delta(prev, payload, page_length):
+    """Reference bootloader: applies a decrypted delta payload to the previous image."""
+    magic, version, _, total_pages, count = MANIFEST_HEADER.unpack_from(payload)
+    assert (magic, version) == (DELTA_MAGIC, 1)
+    indices = struct.unpack_from(f"<{count}I", payload, MANIFEST_HEADER.size)
+    offset = -(-(MANIFEST_HEADER.size + 4 * count) // page_length) * page_length
+
+    image = bytearray(prev.ljust(total_pages * page_length, b"\0")[: total_pages * page_length])
+    for i, index in enumerate(indices):
+        start = offset + i * page_length
+        image[index * page_length : (index + 1) * page_length] = payload[start : start + page_length]
+    return bytes(image)
+
+
+def test_changed_pages_detects_modified_added_and_padded_pages():
+    prev = bytes(PAGE * 4)
+    new = bytearray(prev + b"\x01" * 10)
+    new[PAGE * 2] = 0xFF
+
+    assert changed_pages(page_digests(prev, PAGE), new, PAGE) == [2, 4]
+    # A trailing partial page equals the same page zero-padded
+    assert changed_pages(page_digests(prev + b"\0" * PAGE, PAGE), prev + b"\0" * 5, PAGE) == []
+
+
+def test_build_delta_payload_rejects_small_pages():
+    with pytest.raises(ValueError):
+        build_delta_payload([], b"", 8)
+
+
+@pytest.mark.parametrize("new_size", [PAGE * 10, PAGE * 12 + 7, PAGE * 6 + 30])
+def test_generate_delta_bin_round_trip(tmp_path, new_size):
+    prev = os.urandom(PAGE * 10)
+    new = bytearray(prev.ljust(new_size, b"\xAA")[:new_size])
+    new[PAGE * 3 + 5] ^= 0xFF
+    new[PAGE * 4 + 1] ^= 0xFF
+    (tmp_path / "prev.bin").write_bytes(prev)
+    (tmp_path / "new.bin").write_bytes(new)
+    output = tmp_path / "delta.bin"
+
+    summary = generate_delta_bin(str(tmp_path / "prev.bin"), str(tmp_path / "new.bin"), str(output), 0x1234, 2, 1, 0x10, KEY, page_length=PAGE)
+
+    image = output.read_bytes()
+    assert summary.delta_size == len(image)
+    assert summary.total_pages == -(-new_size // PAGE)
+    assert summary.full_size == builder.HEADER_SIZE + summary.total_pages * PAGE
+    assert verify_bin(str(output), KEY).ok
+
+    header = ImageHeader.unpack(image)
+    assert header.prev_app_version == 1
+    payload = AES.new(KEY, AES.MODE_CBC, header.iv).decrypt(image[builder.HEADER_SIZE :])
+    assert zlib.crc32(payload) == header.crc32
+    expected = bytes(new).ljust(summary.total_pages * PAGE, b"\0")
+    assert _apply_delta(prev, payload, PAGE) == expected
+
+
+def test_generate_delta_bin_identical_images(tmp_path):
+    data = os.urandom(PAGE * 32)
+    (tmp_path / "prev.bin").write_bytes(data)
+    (tmp_path / "new.bin").write_bytes(data)
+
+    summary = generate_delta_bin(str(tmp_path / "prev.bin"), str(tmp_path / "new.bin"), str(tmp_path / "d.bin"), 1, 2, 1, 1, KEY, page_length=PAGE)
+
+    assert (summary.changed_pages, summary.total_pages) == (0, 32)
+    assert summary.delta_size == builder.HEADER_SIZE + PAGE
+    assert summary.reduction > 0.9
+
+
+def test_generate_delta_bin_missing_previous_image(tmp_path):
+    (tmp_path / "new.bin").write_bytes(b"x")
+    with pytest.raises(FileNotFoundError):
+        generate_delta_bin(str(tmp_path / "missing.bin"), str(tmp_path / "new.bin"), str(tmp_path / "d.bin"), 1, 2, 1, 1, KEY)
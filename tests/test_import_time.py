@@ -0,0 +1,79 @@
+"""Cold-start checks: heavy dependencies must not be imported until they are needed."""
+
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Import time budget for the CLI entry module (best of 3 runs). By default it is relative to the
+# start-up time of a bare interpreter (python -c pass) on the same machine, so that it scales with
+# slow CI runners; ENCRYPT_BIN_IMPORT_BUDGET_MS sets an absolute budget instead.
+IMPORT_BUDGET_STARTUPS = 10
+IMPORT_BUDGET_MS = os.environ.get("ENCRYPT_BIN_IMPORT_BUDGET_MS")
+HEAVY_MODULES = [
+    "Crypto",
+    "PyQt6",
+    "asyncio",
+    "concurrent.futures",
+    "multiprocessing",
+    "cProfile",
+    # Modules of the other commands, imported when the command runs
+    "encrypt_bin.cli.server",
+    "encrypt_bin.core.cache",
+    "encrypt_bin.core.manifest",
+]
+
+
+def importtime(code):
+    """Runs code in a fresh interpreter with -X importtime; returns {module: cumulative_us}."""
+    env = dict(os.environ, PYTHONPATH=SRC)
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    modules = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def startup_ms():
+    """Returns the best-of-3 wall time of starting a bare interpreter, in milliseconds."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def loaded_heavy_modules(modules):
+    return sorted(m for m in modules if any(m == h or m.startswith(h + ".") for h in HEAVY_MODULES))
+
+
+def test_cli_import_does_not_load_heavy_modules():
+    assert loaded_heavy_modules(importtime("import encrypt_bin.__main__")) == []
+
+
+def test_cli_help_does_not_load_heavy_modules():
+    code = "import sys; sys.argv = ['encrypt-bin', '-h']\ntry:\n from encrypt_bin.__main__ import main; main()\nexcept SystemExit: pass"
+    assert loaded_heavy_modules(importtime(code)) == []
+
+
+def test_cli_import_time_budget():
+    if IMPORT_BUDGET_MS is not None:
+        budget = float(IMPORT_BUDGET_MS)
+    else:
+        budget = IMPORT_BUDGET_STARTUPS * startup_ms()
+    best = min(importtime("import encrypt_bin.__main__")["encrypt_bin.__main__"] for _ in range(3))
+    assert best / 1000 < budget, f"import encrypt_bin.__main__ took {best / 1000:.1f} ms (budget {budget:.1f} ms)"
+
+
+def test_gui_import_does_not_load_cli_stack():
+    pytest.importorskip("PyQt6.QtWidgets")
+    modules = importtime("import encrypt_bin.gui.main")
+    assert [m for m in modules if m.startswith(("encrypt_bin.cli", "encrypt_bin.core", "Crypto"))] == []
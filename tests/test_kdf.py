@@ -0,0 +1,100 @@
+import os
+import sys
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Hash import CMAC
+
+from encrypt_bin.__main__ import main
+from encrypt_bin.cli.keystore import KeyStore, open_key_provider
+from encrypt_bin.cli.utils import load_master_key, parse_device_ids
+from encrypt_bin.core.kdf import DerivedKeys, derive_device_key, kdf_input
+from encrypt_bin.core.verifier import verify_bin
+from encrypt_bin.errors import KeyFileError, ParameterError
+
+MASTER = bytes.fromhex("000102030405060708090A0B0C0D0E0F")
+
+
+@pytest.fixture
+def master_key_file(tmp_path):
+    path = tmp_path / "master.key"
+    path.write_text("# production master key\n00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F\n")
+    path.chmod(0o600)
+    return path
+
+
+@pytest.mark.parametrize("device_id", [0, 1, 0x1234, 0xFFFFFFFFFFFFFFFF])
+def test_derived_key_is_sp800_108_aes_cmac(device_id):
+    mac = CMAC.new(MASTER, kdf_input(device_id), ciphermod=AES)
+    assert len(kdf_input(device_id)) == 32
+    assert derive_device_key(MASTER, device_id) == mac.digest()
+
+
+def test_derived_keys_cache_and_bulk_derivation():
+    provider = DerivedKeys(MASTER, cache_size=2)
+    ids = [5, 0x1234, 0x00A0000000000001]
+
+    keys = provider.derive_many(ids)
+    assert keys == {device_id: derive_device_key(MASTER, device_id) for device_id in ids}
+    assert len(set(keys.values())) == 3
+    assert provider.get(5) == provider.get(5) == keys[5]
+    info = provider.cache_info()
+    assert (info.hits, info.misses, info.maxsize) == (1, 1, 2)
+    assert DerivedKeys(bytes(16)).get(5) != keys[5]
+    with pytest.raises(ValueError, match="16 bytes"):
+        DerivedKeys(bytes(8))
+
+
+def test_open_key_provider(tmp_path, master_key_file):
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text(f"0x1;{MASTER.hex()}\n")
+    key_file.chmod(0o600)
+
+    assert isinstance(open_key_provider(str(key_file)), KeyStore)
+    assert open_key_provider(master_key_file=str(master_key_file)).get(7) == derive_device_key(MASTER, 7)
+    assert load_master_key(str(master_key_file)) == MASTER
+
+    empty = tmp_path / "empty.key"
+    empty.write_text("# nothing here\n")
+    with pytest.raises(KeyFileError, match="no master key"):
+        load_master_key(str(empty))
+
+
+def test_parse_device_ids():
+    assert parse_device_ids("0x10-0x12, 5,0x11") == [5, 0x10, 0x11, 0x12]
+    with pytest.raises(ParameterError, match="end is lower than start"):
+        parse_device_ids("9-3")
+    with pytest.raises(ParameterError, match="Device ID"):
+        parse_device_ids("0x1,zz")
+
+
+def test_main_single_build_and_verify_with_master_key(tmp_path, monkeypatch, capsys, master_key_file):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(3000))
+    output = tmp_path / "out.bin"
+    argv = ["prog", "-i", str(input_file), "-o", str(output), "-d", "0x1234", "-b", "0x10", "--master-key", str(master_key_file), "-v", "2", "-p", "1"]
+    monkeypatch.setattr(sys, "argv", argv)
+    main()
+
+    assert verify_bin(str(output), derive_device_key(MASTER, 0x1234)).ok
+    monkeypatch.setattr(sys, "argv", ["prog", "verify", str(output), "--master-key", str(master_key_file)])
+    main()
+    assert "1 OK, 0 failed" in capsys.readouterr().out
+
+
+def test_main_batch_with_master_key(tmp_path, monkeypatch, capsys, master_key_file):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(3000))
+    template = str(tmp_path / "{device_id:04X}.bin")
+    argv = ["prog", "batch", "-i", str(input_file), "-o", template, "--master-key", str(master_key_file), "--device-ids", "0x10-0x12,0x20"]
+    monkeypatch.setattr(sys, "argv", argv + ["-b", "0x10", "-v", "2", "-p", "1", "-j", "1"])
+    main()
+
+    assert "4 of 4 images generated successfully" in capsys.readouterr().out
+    for device_id in (0x10, 0x11, 0x12, 0x20):
+        result = verify_bin(str(tmp_path / f"{device_id:04X}.bin"), derive_device_key(MASTER, device_id))
+        assert result.ok and result.header.device_id == device_id
+
+    monkeypatch.setattr(sys, "argv", argv[:-2] + ["-b", "0x10", "-v", "2", "-p", "1"])
+    with pytest.raises(SystemExit):
+        main()  # --master-key without --device-ids
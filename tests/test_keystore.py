@@ -0,0 +1,250 @@
+import os
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from encrypt_bin.__main__ import main
+from encrypt_bin.cli.keystore import SHARD_INDEX_NAME, KeyIndex, KeyStore, ShardedKeyStore, shard_key_file
+from encrypt_bin.cli.utils import find_key_in_file
+from encrypt_bin.errors import KeyFileError, KeyNotFoundError
+
+KEY_A = bytes.fromhex("00112233445566778899AABBCCDDEEFF")
+KEY_B = bytes.fromhex("112233445566778899AABBCCDDEEFF00")
+
+
+def write_key_file(tmp_path, content, name="keys.txt"):
+    key_file = tmp_path / name
+    key_file.write_text(content)
+    key_file.chmod(0o600)
+    return key_file
+
+
+def test_from_file_parses_all_formats(tmp_path):
+    key_file = write_key_file(
+        tmp_path,
+        "# comment\n"
+        "BADLINE\n"
+        "0x1234;00 11 22 33 44 55 66 77 88 99 AA BB CC DD EE FF\n"
+        "0x5678 112233445566778899AABBCCDDEEFF00\n"
+        "39612, 0x00,0x11,0x22,0x33,0x44,0x55,0x66,0x77,0x88,0x99,0xAA,0xBB,0xCC,0xDD,0xEE,0xFF\n",
+    )
+    store = KeyStore.from_file(str(key_file))
+
+    assert len(store) == 3
+    assert store.get(0x1234) == KEY_A
+    assert store.get(0x5678) == KEY_B
+    assert store.get(0x9ABC) == KEY_A
+    assert 0x9999 not in store
+    assert store.get(0x9999) is None
+
+
+def test_from_file_duplicate_entry_warns(tmp_path, capsys):
+    key_file = write_key_file(tmp_path, f"0x1234;{KEY_A.hex()}\n0x1234;{KEY_A.hex()}\n")
+    store = KeyStore.from_file(str(key_file))
+
+    assert len(store) == 1
+    assert "duplicate entry for device_id 0x1234" in capsys.readouterr().out
+
+
+def test_from_file_conflicting_entry_raises(tmp_path):
+    key_file = write_key_file(tmp_path, f"0x1234;{KEY_A.hex()}\n# other\n0x1234;{KEY_B.hex()}\n")
+    with pytest.raises(KeyFileError) as e:
+        KeyStore.from_file(str(key_file))
+    assert "conflicting keys for device_id 0x1234" in str(e.value)
+    assert "lines 1 and 3" in str(e.value)
+
+
+def test_index_roundtrip(tmp_path):
+    key_file = write_key_file(tmp_path, "".join(f"{i};{KEY_A.hex() if i % 2 else KEY_B.hex()}\n" for i in range(500, 0, -3)))
+    index_path = tmp_path / "keys.idx"
+    store = KeyStore.from_file(str(key_file))
+    store.save_index(str(index_path))
+
+    assert os.stat(index_path).st_mode & 0o777 == 0o600  # the index holds the keys in plain text
+    index = KeyIndex.load(str(index_path), os.stat(key_file))
+    assert index is not None
+    assert len(index) == len(store)
+    assert index.items() == store.items()
+    for device_id, key in store.items():
+        assert index.get(device_id) == key
+    assert index.get(0) is None
+    assert index.get(1 << 63) is None
+    index.close()
+
+
+def test_concurrent_index_writers_do_not_interfere(tmp_path):
+    key_file = write_key_file(tmp_path, "".join(f"{i};{KEY_A.hex()}\n" for i in range(2000)))
+    index_path = tmp_path / "keys.idx"
+    index_path.write_bytes(b"old")
+    index_path.chmod(0o644)
+    store = KeyStore.from_file(str(key_file))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: store.save_index(str(index_path)), range(32)))
+
+    assert os.stat(index_path).st_mode & 0o777 == 0o600
+    assert KeyIndex.load(str(index_path), os.stat(key_file)).items() == store.items()
+    assert sorted(os.listdir(tmp_path)) == ["keys.idx", "keys.txt"]
+
+
+def test_open_rebuilds_stale_index(tmp_path):
+    key_file = write_key_file(tmp_path, f"0x1234;{KEY_A.hex()}\n")
+    index_path = tmp_path / "keys.idx"
+
+    store = KeyStore.open(str(key_file), str(index_path))
+    assert isinstance(store, KeyIndex)
+    assert store.get(0x1234) == KEY_A
+    assert index_path.exists()
+
+    # Same file -> index is reused without parsing the key file again
+    assert isinstance(KeyStore.open(str(key_file), str(index_path)), KeyIndex)
+
+    key_file.write_text(f"0x1234;{KEY_B.hex()}\n0x5678;{KEY_A.hex()}\n")
+    store = KeyStore.open(str(key_file), str(index_path))
+    assert store.get(0x1234) == KEY_B
+    assert store.get(0x5678) == KEY_A
+
+
+def test_index_load_rejects_garbage(tmp_path):
+    bad = tmp_path / "bad.idx"
+    bad.write_bytes(b"not an index at all, definitely not")
+    assert KeyIndex.load(str(bad)) is None
+    assert KeyIndex.load(str(tmp_path / "missing.idx")) is None
+
+
+def test_find_key_in_file_with_index(tmp_path):
+    key_file = write_key_file(tmp_path, f"0x1234;{KEY_A.hex()}\n")
+    index_path = tmp_path / "keys.idx"
+
+    assert find_key_in_file(str(key_file), 0x1234, str(index_path)) == KEY_A
+    with pytest.raises(KeyNotFoundError) as e:
+        find_key_in_file(str(key_file), 0x9999, str(index_path))
+    assert "could not find key" in str(e.value)
+
+
+PRODUCT_LINES = (0x00A0000000000000, 0x00B1000000000000, 0x7F00000000000000)
+
+
+@pytest.fixture
+def fleet_key_file(tmp_path):
+    lines = [f"0x{base + i:016X};{(base + i * 0x9E3779B97F4A7C15) & ((1 << 128) - 1):032X}\n" for base in PRODUCT_LINES for i in range(50)]
+    return write_key_file(tmp_path, "# fleet\n" + "".join(reversed(lines)))
+
+
+def test_sharded_store_matches_key_file(tmp_path, fleet_key_file):
+    flat = KeyStore.from_file(str(fleet_key_file))
+    shard_dir = tmp_path / "keys.d"
+    shard_key_file(str(fleet_key_file), str(shard_dir))
+
+    assert sorted(os.listdir(shard_dir)) == ["00a0.idx", "00b1.idx", "7f00.idx", SHARD_INDEX_NAME]
+    assert all(stat.S_IMODE(os.stat(shard_dir / name).st_mode) == 0o600 for name in os.listdir(shard_dir))
+
+    store = KeyStore.open(str(shard_dir))
+    assert isinstance(store, ShardedKeyStore) and len(store) == len(flat) == 150
+    assert store.get(PRODUCT_LINES[1] + 7) == flat.get(PRODUCT_LINES[1] + 7)
+    assert store.get(PRODUCT_LINES[1] + 50) is None
+    assert store.get(0x0001000000000000) is None
+    assert store.loaded_shards() == 1  # only the shard of the product line looked up
+    assert store.items() == flat.items()
+    assert store.loaded_shards() == 3
+    store.close()
+
+
+def test_find_key_in_shard_directory(tmp_path, fleet_key_file):
+    shard_dir = tmp_path / "keys.d"
+    shard_key_file(str(fleet_key_file), str(shard_dir), prefix_bits=4)
+    assert sorted(os.listdir(shard_dir)) == ["0.idx", "7.idx", SHARD_INDEX_NAME]
+
+    for device_id in (PRODUCT_LINES[0], PRODUCT_LINES[2] + 49):
+        assert find_key_in_file(str(shard_dir), device_id) == find_key_in_file(str(fleet_key_file), device_id)
+    with pytest.raises(KeyNotFoundError):
+        find_key_in_file(str(shard_dir), PRODUCT_LINES[2] + 50)
+
+
+def test_sharded_store_rejects_damaged_directory(tmp_path, fleet_key_file):
+    shard_dir = tmp_path / "keys.d"
+    shard_key_file(str(fleet_key_file), str(shard_dir))
+
+    (shard_dir / "00b1.idx").write_bytes(b"garbage")
+    store = ShardedKeyStore.open(str(shard_dir))
+    assert store.get(PRODUCT_LINES[0]) is not None
+    with pytest.raises(KeyFileError, match="00b1.idx"):
+        store.get(PRODUCT_LINES[1])
+
+    (shard_dir / SHARD_INDEX_NAME).write_bytes(b"EBKS")
+    with pytest.raises(KeyFileError, match="not a valid key shard index"):
+        ShardedKeyStore.open(str(shard_dir))
+    with pytest.raises(KeyFileError):
+        ShardedKeyStore.open(str(tmp_path))
+    with pytest.raises(ValueError, match="prefix bits"):
+        shard_key_file(str(fleet_key_file), str(shard_dir), prefix_bits=0)
+
+
+def test_sharded_store_checks_stamps_against_key_file(tmp_path, fleet_key_file):
+    shard_dir = tmp_path / "keys.d"
+    shard_key_file(str(fleet_key_file), str(shard_dir))
+    store = ShardedKeyStore.open(str(shard_dir))
+    assert store.source == str(fleet_key_file) and store.get(PRODUCT_LINES[0]) is not None
+
+    st = os.stat(fleet_key_file)
+    os.utime(fleet_key_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    with pytest.raises(KeyFileError, match="older than the key file"):
+        ShardedKeyStore.open(str(shard_dir))
+
+    # Shards deployed without their key file are used as they are
+    fleet_key_file.rename(tmp_path / "elsewhere.txt")
+    assert ShardedKeyStore.open(str(shard_dir)).get(PRODUCT_LINES[0]) is not None
+
+
+def test_main_shard_keys_and_batch_for_one_product_line(tmp_path, monkeypatch, capsys, fleet_key_file):
+    shard_dir = tmp_path / "keys.d"
+    monkeypatch.setattr(sys, "argv", ["prog", "shard-keys", str(fleet_key_file), str(shard_dir), "--prefix-bits", "8"])
+    main()
+    assert "Wrote 150 key(s)" in capsys.readouterr().out
+
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(3000))
+    template = str(tmp_path / "out" / "{device_id:016X}.bin")
+    (tmp_path / "out").mkdir()
+    argv = ["prog", "batch", "-i", str(input_file), "-o", template, "-K", str(shard_dir), "-b", "0x10", "-v", "2", "-p", "1", "-j", "1"]
+    monkeypatch.setattr(sys, "argv", argv + ["--device-ids", f"{PRODUCT_LINES[1]:#x}-{PRODUCT_LINES[1] + 2:#x}"])
+    main()
+    assert "3 of 3 images generated successfully" in capsys.readouterr().out
+    assert len(os.listdir(tmp_path / "out")) == 3
+
+    monkeypatch.setattr(sys, "argv", argv + ["--device-ids", f"{PRODUCT_LINES[1] + 60:#x}"])
+    with pytest.raises(SystemExit, match="could not find keys"):
+        main()
+
+
+def test_main_build_with_shards_of_edited_key_file(tmp_path, monkeypatch, capsys, fleet_key_file):
+    shard_dir = tmp_path / "keys.d"
+    monkeypatch.setattr(sys, "argv", ["prog", "shard-keys", str(fleet_key_file), str(shard_dir)])
+    main()
+    new_device = PRODUCT_LINES[0] + 50
+    with open(fleet_key_file, "a") as f:
+        f.write(f"0x{new_device:016X};00112233445566778899AABBCCDDEEFF\n")
+
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(3000))
+    argv = ["-i", str(input_file), "-o", str(tmp_path / "out.bin"), "-d", hex(new_device), "-K", str(shard_dir), "-b", "0x10", "-v", "2", "-p", "1"]
+    monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+    with pytest.raises(SystemExit, match=r"older than the key file .*\(run shard-keys again\)"):
+        main()
+    assert not (tmp_path / "out.bin").exists()
+
+
+def test_index_build_reports_malformed_line(tmp_path, monkeypatch):
+    key_file = write_key_file(tmp_path, f"0xA000;{KEY_A.hex()}\n0xB000;00 11\n")
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(300))
+    argv = ["prog", "-i", str(input_file), "-o", str(tmp_path / "out.bin"), "-d", "0xA000", "-K", str(key_file), "-b", "0x10", "-v", "2", "-p", "1"]
+
+    monkeypatch.setattr(sys, "argv", argv + ["--key-index", str(tmp_path / "keys.idx")])
+    with pytest.raises(SystemExit, match=r"invalid key for device_id 0xb000 in file '.*keys\.txt' \(line 2\): key must be exactly 16 bytes"):
+        main()
+
+    monkeypatch.setattr(sys, "argv", argv)  # the lookup without an index stops at the device's line
+    main()
+    assert (tmp_path / "out.bin").exists()
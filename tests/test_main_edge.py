@@ -33,3 +33,111 @@ def test_main_handles_missing_input_file(tmp_path, monkeypatch):
 
     # Optionally check error message
     assert "input file" in str(e.value)
+
+
+def test_main_rewrap_command(tmp_path, monkeypatch):
+    """rewrap command changes only the requested header fields"""
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(range(50)))
+    image = tmp_path / "out.bin"
+    variant = tmp_path / "variant.bin"
+
+    argv = ["-i", str(input_file), "-o", str(image), "-d", "0x1234", "-b", "0x10",
+            "-k", "00112233445566778899AABBCCDDEEFF", "-v", "0x1201", "-p", "0x1100"]
+    monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+    with patch("builtins.print"):
+        main()
+
+    monkeypatch.setattr(sys, "argv", ["prog", "rewrap", "-i", str(image), "-o", str(variant), "-v", "0x1202"])
+    with patch("builtins.print"):
+        main()
+
+    assert int.from_bytes(variant.read_bytes()[12:16], "little") == 0x1202
+    assert variant.read_bytes()[16:] == image.read_bytes()[16:]
+
+
+def test_main_rewrap_requires_a_field(tmp_path, monkeypatch):
+    """rewrap without any field to change is rejected"""
+    image = tmp_path / "out.bin"
+    image.write_bytes(b"\x00" * 48)
+    monkeypatch.setattr(sys, "argv", ["prog", "rewrap", "-i", str(image)])
+    with pytest.raises(SystemExit):
+        main()
+
+
+def test_main_delta_build(tmp_path, monkeypatch, capsys):
+    """--prev-input builds a delta image and prints the size reduction"""
+    prev_file = tmp_path / "prev.bin"
+    prev_file.write_bytes(bytes(2048 * 8))
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(2048 * 7) + b"\x01" * 2048)
+    image = tmp_path / "delta.bin"
+
+    argv = ["-i", str(input_file), "-o", str(image), "-d", "0x1234", "-b", "0x10", "--prev-input", str(prev_file),
+            "-k", "00112233445566778899AABBCCDDEEFF", "-v", "0x1201", "-p", "0x1100"]
+    monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+    main()
+
+    out = capsys.readouterr().out
+    assert "1 of 8 pages changed" in out
+    assert "74.8% smaller" in out
+    assert image.stat().st_size == 48 + 2 * 2048
+
+
+def test_main_compressed_build(tmp_path, monkeypatch, capsys):
+    """--compress builds a smaller image and reports its size"""
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\xFF" * 2048 * 8)
+    image = tmp_path / "out.bin"
+
+    argv = ["-i", str(input_file), "-o", str(image), "-d", "0x1234", "-b", "0x10", "--compress", "zlib", "--compress-level", "9",
+            "-k", "00112233445566778899AABBCCDDEEFF", "-v", "0x1201", "-p", "0x1100"]
+    monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+    main()
+
+    assert "Compressed image size: 2096 bytes" in capsys.readouterr().out
+    assert image.stat().st_size == 48 + 2048
+
+
+def test_main_rejects_invalid_compression_level(tmp_path, monkeypatch):
+    """--compress-level outside the codec's range is rejected"""
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\x00" * 16)
+
+    argv = ["-i", str(input_file), "-o", str(tmp_path / "out.bin"), "-d", "0x1234", "-b", "0x10", "--compress", "zlib",
+            "--compress-level", "0", "-k", "00112233445566778899AABBCCDDEEFF", "-v", "0x1201", "-p", "0x1100"]
+    monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert "between 1 and 9" in str(e.value)
+
+
+def test_main_build_cache(tmp_path, monkeypatch, capsys):
+    """--cache with --deterministic-iv reuses identical builds"""
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(range(256)) * 10)
+    outputs = [tmp_path / "a.bin", tmp_path / "b.bin"]
+
+    for output in outputs:
+        argv = ["-i", str(input_file), "-o", str(output), "-d", "0x1234", "-b", "0x10", "--cache", str(tmp_path / "cache"),
+                "--deterministic-iv", "-k", "00112233445566778899AABBCCDDEEFF", "-v", "0x1201", "-p", "0x1100"]
+        monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+        main()
+
+    out = capsys.readouterr().out
+    assert "generated successfully" in out and "taken from the build cache" in out
+    assert outputs[0].read_bytes() == outputs[1].read_bytes()
+
+
+def test_main_iv_key_requires_deterministic_iv(tmp_path, monkeypatch):
+    """--iv-key without --deterministic-iv is rejected"""
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\x00" * 16)
+    iv_key = tmp_path / "iv.key"
+    iv_key.write_text("000102030405060708090A0B0C0D0E0F\n")
+
+    argv = ["-i", str(input_file), "-o", str(tmp_path / "out.bin"), "-d", "0x1234", "-b", "0x10", "--iv-key", str(iv_key),
+            "-k", "00112233445566778899AABBCCDDEEFF", "-v", "0x1201", "-p", "0x1100"]
+    monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+    with pytest.raises(SystemExit):
+        main()
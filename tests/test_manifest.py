@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+
+import pytest
+
+from encrypt_bin.__main__ import main
+from encrypt_bin.cli.manifest import load_manifest
+from encrypt_bin.core import manifest as manifest_module
+from encrypt_bin.core.manifest import ManifestTarget, build_manifest
+from encrypt_bin.core.verifier import verify_bin
+from encrypt_bin.errors import ConfigFileError, ConfigValidationError
+
+KEY_HEX = "00112233445566778899AABBCCDDEEFF"
+KEY = bytes.fromhex(KEY_HEX)
+
+
+@pytest.fixture
+def firmware(tmp_path):
+    for name in ("a.bin", "b.bin"):
+        (tmp_path / name).write_bytes(os.urandom(5000))
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text(f"0x1;{KEY_HEX}\n0x2;{KEY_HEX}\n0x3;{KEY_HEX}\n")
+    key_file.chmod(0o600)
+    (tmp_path / "out").mkdir()
+    return tmp_path
+
+
+def _target(tmp_path, name, input_name, device_id, **overrides):
+    return ManifestTarget(name, str(tmp_path / input_name), str(tmp_path / "out" / f"{name}.bin"), device_id, 2, 1, 0x10, KEY, **overrides)
+
+
+def test_build_manifest_reads_each_input_once(firmware, monkeypatch):
+    reads = []
+    read_input = manifest_module._read_input
+    monkeypatch.setattr(manifest_module, "_read_input", lambda path: reads.append(path) or read_input(path))
+    targets = [
+        _target(firmware, "one", "a.bin", 1),
+        _target(firmware, "two", "b.bin", 2, page_length=4096),
+        _target(firmware, "three", "a.bin", 3, compression="zlib"),
+        _target(firmware, "missing", "missing.bin", 3),
+    ]
+
+    report = build_manifest(targets, max_workers=2)
+
+    assert sorted(reads) == sorted(os.path.realpath(firmware / name) for name in ("a.bin", "b.bin", "missing.bin"))
+    assert [r.name for r in report.results] == ["one", "two", "three", "missing"]
+    assert [r.ok for r in report.results] == [True, True, True, False]
+    assert "cannot read input file" in report.results[3].error
+    for target in targets[:3]:
+        result = verify_bin(target.output_path, KEY)
+        assert result.ok and result.header.device_id == target.product_id
+    assert verify_bin(targets[1].output_path, KEY).header.page_length == 4096
+
+    data = report.as_dict()
+    assert data["ok"] is False and data["failed"] == 1
+    assert {i["path"]: i["targets"] for i in data["inputs"]}[os.path.realpath(firmware / "a.bin")] == 2
+    json.dumps(data)
+
+
+def test_load_manifest_toml_with_defaults_and_relative_paths(firmware):
+    manifest = firmware / "manifest.toml"
+    manifest.write_text(
+        '[defaults]\ninput = "a.bin"\nkey_file = "keys.txt"\nbootloader_id = "0x10"\napp_version = 2\nprev_app_version = 1\n\n'
+        '[[targets]]\noutput = "out/1.bin"\ndevice_id = "0x1"\n\n'
+        '[[targets]]\nname = "second"\ninput = "b.bin"\noutput = "out/2.bin"\ndevice_id = 2\npage_length = 4096\ncompress = "zlib"\n'
+    )
+
+    first, second = load_manifest(str(manifest))
+
+    assert first.name == "target 1" and first.input_path == str(firmware / "a.bin") and first.key == KEY
+    assert second.name == "second" and second.input_path == str(firmware / "b.bin")
+    assert (second.product_id, second.page_length, second.compression, second.compression_level) == (2, 4096, "zlib", None)
+
+
+def test_load_manifest_reports_all_invalid_targets(firmware):
+    manifest = firmware / "manifest.json"
+    base = {"input": "a.bin", "bootloader_id": 16, "app_version": 2, "prev_app_version": 1, "key": KEY_HEX}
+    manifest.write_text(
+        json.dumps(
+            {
+                "defaults": base,
+                "targets": [
+                    {"output": "out/1.bin", "device_id": "zz"},
+                    {"output": "out/2.bin", "device_id": 2, "colour": "red"},
+                    {"output": "out/3.bin", "device_id": 3, "page_length": 100},
+                    {"output": "out/4.bin", "device_id": 4, "key": None, "key_file": "keys.txt"},
+                    {"output": "out/5.bin", "device_id": 5},
+                    {"output": "out/5.bin", "device_id": 6},
+                ],
+            }
+        )
+    )
+
+    with pytest.raises(ConfigValidationError) as e:
+        load_manifest(str(manifest))
+
+    errors = e.value.errors
+    assert len(errors) == 5
+    assert errors[0].startswith("target 1: Device ID")
+    assert "unknown field(s): colour" in errors[1]
+    assert "page length" in errors[2]
+    assert "could not find key for device_id 0x4" in errors[3]
+    assert errors[4] == f"target 6: output '{firmware / 'out' / '5.bin'}' is also written by target 5."
+
+
+def test_load_manifest_without_targets(tmp_path):
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text('{"defaults": {}}')
+    with pytest.raises(ConfigFileError, match="non-empty 'targets' list"):
+        load_manifest(str(manifest))
+    with pytest.raises(ConfigFileError, match="cannot read manifest"):
+        load_manifest(str(tmp_path / "missing.json"))
+
+
+def test_main_manifest_command_writes_report(firmware, monkeypatch, capsys):
+    manifest = firmware / "manifest.json"
+    defaults = {"key_file": "keys.txt", "bootloader_id": "0x10", "app_version": "2", "prev_app_version": "1"}
+    targets = [{"input": name, "output": f"out/{i}.bin", "device_id": i} for i, name in ((1, "a.bin"), (2, "b.bin"), (3, "a.bin"))]
+    manifest.write_text(json.dumps({"defaults": defaults, "targets": targets}))
+    report_path = firmware / "report.json"
+
+    monkeypatch.setattr(sys, "argv", ["prog", "manifest", str(manifest), "--report", str(report_path), "-j", "2"])
+    main()
+
+    assert "3 of 3 images generated successfully from 2 input file(s)" in capsys.readouterr().out
+    report = json.loads(report_path.read_text())
+    assert report["ok"] and [r["product_id"] for r in report["results"]] == [1, 2, 3]
+    assert all(r["seconds"] >= 0 for r in report["results"])
+    assert all(verify_bin(str(firmware / "out" / f"{i}.bin"), KEY).ok for i in (1, 2, 3))
+
+
+def test_main_manifest_command_reports_validation_errors(firmware, monkeypatch):
+    manifest = firmware / "manifest.json"
+    base = {"input": "a.bin", "bootloader_id": 16, "app_version": 2, "prev_app_version": 1, "key": KEY_HEX}
+    manifest.write_text(json.dumps({"targets": [{**base, "output": "out/1.bin", "device_id": "zz"}, {**base, "output": "out/2.bin", "device_id": 2}]}))
+    report_path = firmware / "report.json"
+
+    monkeypatch.setattr(sys, "argv", ["prog", "manifest", str(manifest), "--report", str(report_path)])
+    with pytest.raises(SystemExit, match="Device ID"):
+        main()
+
+    report = json.loads(report_path.read_text())
+    assert not report["ok"] and report["results"] == []
+    assert len(report["errors"]) == 1 and report["errors"][0].startswith("target 1: Device ID")
+    assert not (firmware / "out" / "2.bin").exists()
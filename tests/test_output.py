@@ -0,0 +1,110 @@
+import io
+import os
+import stat
+import struct
+
+import pytest
+
+from encrypt_bin.core import output as output_module
+from encrypt_bin.core.builder import BuildCancelled, _write_header, generate_bin
+from encrypt_bin.core.output import atomic_output, atomic_path
+from encrypt_bin.core.verifier import verify_bin
+
+KEY = bytes(range(16))
+PARAMS = dict(product_id=0x0102030405060708, app_version=2, prev_app_version=1, bootloader_id=0x10)
+
+
+def test_atomic_output_replaces_only_on_success(tmp_path):
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"old image")
+    path.chmod(0o640)
+
+    with pytest.raises(RuntimeError):
+        with atomic_output(str(path)) as f:
+            f.write(b"partial")
+            raise RuntimeError("build failed")
+    assert path.read_bytes() == b"old image"
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+    with atomic_output(str(path), size=4096) as f:
+        f.write(b"new image")
+    assert path.read_bytes() == b"new image"  # trimmed to what was written
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+
+def test_new_output_gets_the_current_umask(tmp_path):
+    previous = os.umask(0o027)
+    try:
+        with atomic_output(str(tmp_path / "a.bin")) as f:
+            f.write(b"image")
+        with atomic_path(str(tmp_path / "b.bin")) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(b"image")
+    finally:
+        os.umask(previous)
+    assert stat.S_IMODE((tmp_path / "a.bin").stat().st_mode) == 0o640
+    assert stat.S_IMODE((tmp_path / "b.bin").stat().st_mode) == 0o640
+
+
+def test_atomic_path_replaces_only_on_success(tmp_path):
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"old image")
+
+    with pytest.raises(RuntimeError):
+        with atomic_path(str(path)) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(b"partial")
+            raise RuntimeError("clone failed")
+    assert path.read_bytes() == b"old image"
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+
+@pytest.mark.parametrize("policy, expected_calls", [("none", 0), ("file", 1), ("full", 2)])
+def test_atomic_output_fsync_policy(tmp_path, monkeypatch, policy, expected_calls):
+    calls = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(output_module.os, "fsync", lambda fd: calls.append(fd) or real_fsync(fd))
+    with atomic_output(str(tmp_path / "out.bin"), fsync=policy) as f:
+        f.write(b"data")
+    assert len(calls) == expected_calls
+
+
+def test_atomic_output_rejects_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError, match="fsync must be one of"):
+        with atomic_output(str(tmp_path / "out.bin"), fsync="always"):
+            pass
+
+
+def test_write_header_is_a_single_write():
+    class CountingFile(io.BytesIO):
+        writes = 0
+
+        def write(self, data):
+            self.writes += 1
+            return super().write(data)
+
+    f = CountingFile()
+    iv = bytes(range(16, 32))
+    _write_header(f, 0x10, 0x0102030405060708, 2, 1, 3, 2048, iv, 0xDEADBEEF)
+
+    assert f.writes == 1
+    assert f.getvalue() == struct.pack("<7I", 0x10, 0x01020304, 0x05060708, 2, 1, 3, 2048) + iv + struct.pack("<I", 0xDEADBEEF)
+
+
+def test_cancelled_build_keeps_previous_image(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(10000))
+    output = tmp_path / "out.bin"
+    generate_bin(str(input_file), str(output), key=KEY, **PARAMS)
+    previous = output.read_bytes()
+
+    def cancel(stage, done):
+        raise BuildCancelled()
+
+    with pytest.raises(BuildCancelled):
+        generate_bin(str(input_file), str(output), key=KEY, progress=cancel, chunk_size=2048, fsync="none", **PARAMS)
+
+    assert output.read_bytes() == previous
+    assert verify_bin(str(output), KEY).ok
+    assert sorted(os.listdir(tmp_path)) == ["firmware.bin", "out.bin"]
@@ -0,0 +1,121 @@
+import hashlib
+import hmac
+import os
+import subprocess
+import sys
+
+import pytest
+
+from encrypt_bin.__main__ import main
+from encrypt_bin.core import compression as compression_module
+from encrypt_bin.core.buffer_build import build_image
+from encrypt_bin.core.builder import generate_bin
+from encrypt_bin.core.compression import choose_level
+from encrypt_bin.core.reproducible import default_iv_key, derive_iv
+from encrypt_bin.core.verifier import ImageHeader, verify_bin
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+KEY = bytes(range(16))
+FIRMWARE = bytes(range(256)) * 4
+PARAMS = dict(product_id=0x1234, app_version=0x1201, prev_app_version=0x1100, bootloader_id=0x10)
+
+# Golden vectors: changing any of them breaks reproducibility of already published images
+GOLDEN_IMAGE_SHA256 = "64e83793913c22123b1fc903d934fd0d2c51dddfff115f1267ca2cad8599cd7a"
+GOLDEN_IMAGE_IV = "36b09fcdc29d57885aad57b1d70b6cf6"
+
+
+def test_derive_iv_golden_vectors():
+    message = b"encrypt-bin deterministic iv v1\x00" + bytes(28) + b"\xff\xff\xff\xff" + b"\x00" + hashlib.sha256(b"").digest()
+    expected = hmac.new(bytes(32), message, hashlib.sha256).digest()[:16]
+    assert derive_iv(bytes(32), hashlib.sha256(b"").digest(), 0, 0, 0, 0, 0) == expected
+
+    assert derive_iv(bytes(32), hashlib.sha256(b"").digest(), 0, 0, 0, 0).hex() == "fe52dd2e966092372d728d3ea12fc6e1"
+    digest = hashlib.sha256(bytes(range(256))).digest()
+    iv_key = bytes(range(32))
+    assert derive_iv(iv_key, digest, 0x0102030405060708, 0x1201, 0x1100, 0x10, 256, "zlib", 6).hex() == "df42d5efbb4ad10cb8a7ef6b5688e29c"
+    assert derive_iv(iv_key, digest, 0x0102030405060708, 0x1201, 0x1100, 0x10, 4096, segment_size=8192).hex() == "9e79b22d4555581cd1443ba08227db80"
+    assert default_iv_key(KEY).hex() == "30ef7e3a61afba7ba497fd0b9dc92f29727e036ee13335c543d174124ecb634c"
+
+
+def test_deterministic_image_golden_vector():
+    image = build_image(FIRMWARE, key=KEY, page_length=256, deterministic_iv=True, **PARAMS)
+    assert hashlib.sha256(image).hexdigest() == GOLDEN_IMAGE_SHA256
+    assert ImageHeader.unpack(image).iv.hex() == GOLDEN_IMAGE_IV
+
+
+def test_deterministic_image_is_stable_across_processes(tmp_path):
+    code = (
+        "import hashlib, sys; from encrypt_bin.core.buffer_build import build_image; "
+        "sys.stdout.write(hashlib.sha256(build_image(bytes(range(256)) * 4, 0x1234, 0x1201, 0x1100, 0x10, bytes(range(16)), 256, "
+        "deterministic_iv=True)).hexdigest())"
+    )
+    for seed in ("0", "12345"):
+        env = dict(os.environ, PYTHONPATH=SRC, PYTHONHASHSEED=seed)
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+        assert out.stdout == GOLDEN_IMAGE_SHA256
+
+
+@pytest.mark.parametrize("options", [{}, {"compression": "zlib", "compression_level": 6}, {"segment_size": 512}])
+def test_file_and_buffer_builds_agree(tmp_path, options):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(FIRMWARE)
+    first, second = tmp_path / "a.bin", tmp_path / "b.bin"
+    generate_bin(str(input_file), str(first), key=KEY, page_length=256, deterministic_iv=True, **options, **PARAMS)
+    generate_bin(str(input_file), str(second), key=KEY, page_length=256, deterministic_iv=True, **options, **PARAMS)
+
+    assert first.read_bytes() == second.read_bytes()
+    assert build_image(FIRMWARE, key=KEY, page_length=256, deterministic_iv=True, **options, **PARAMS) == first.read_bytes()
+    assert verify_bin(str(first), KEY).ok
+
+
+def test_automatic_compression_level_is_reproducible(tmp_path, monkeypatch):
+    # Text-like firmware where several levels compress within the size tolerance
+    firmware = b"".join(b"config value %d = %d;\n" % (i, i * i % 97) for i in range(3000))
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(firmware)
+    clock = iter(range(10**6))
+    # A clock that makes a different level look fastest on every measurement
+    monkeypatch.setattr(compression_module.time, "perf_counter", lambda: next(clock) * (1 + next(clock) % 7))
+
+    images = []
+    for name in ("a.bin", "b.bin"):
+        generate_bin(str(input_file), str(tmp_path / name), key=KEY, page_length=256, compression="zlib", deterministic_iv=True, **PARAMS)
+        images.append((tmp_path / name).read_bytes())
+    assert images[0] == images[1]
+
+    level = choose_level(firmware, "zlib", 256, by_size=True)
+    explicit = build_image(firmware, key=KEY, page_length=256, compression="zlib", compression_level=level, deterministic_iv=True, **PARAMS)
+    assert build_image(firmware, key=KEY, page_length=256, compression="zlib", deterministic_iv=True, **PARAMS) == explicit == images[0]
+
+
+def test_iv_changes_with_every_input():
+    base = ImageHeader.unpack(build_image(FIRMWARE, key=KEY, page_length=256, deterministic_iv=True, **PARAMS)).iv
+    variants = [
+        build_image(FIRMWARE[:-1] + b"\x00", key=KEY, page_length=256, deterministic_iv=True, **PARAMS),
+        build_image(FIRMWARE, key=KEY, page_length=256, deterministic_iv=True, **{**PARAMS, "app_version": 0x1202}),
+        build_image(FIRMWARE, key=KEY, page_length=512, deterministic_iv=True, **PARAMS),
+        build_image(FIRMWARE, key=KEY, page_length=256, deterministic_iv=True, iv_key=bytes(32), **PARAMS),
+        build_image(FIRMWARE, key=bytes(16), page_length=256, deterministic_iv=True, **PARAMS),
+        build_image(FIRMWARE, key=KEY, page_length=256, **PARAMS),
+    ]
+    ivs = {ImageHeader.unpack(image).iv for image in variants}
+    assert base not in ivs and len(ivs) == len(variants)
+
+
+def test_main_deterministic_iv_with_iv_key(tmp_path, monkeypatch, capsys):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(FIRMWARE)
+    iv_key = tmp_path / "iv.key"
+    iv_key.write_text("# reproducible builds\n" + bytes(range(32, 48)).hex() + "\n")
+    iv_key.chmod(0o600)
+
+    outputs = [tmp_path / "a.bin", tmp_path / "b.bin"]
+    for output in outputs:
+        argv = ["prog", "-i", str(input_file), "-o", str(output), "-d", "0x1234", "-b", "0x10", "-k", KEY.hex(), "-v", "0x1201", "-p", "0x1100",
+                "-l", "256", "--deterministic-iv", "--iv-key", str(iv_key)]
+        monkeypatch.setattr(sys, "argv", argv)
+        main()
+
+    assert outputs[0].read_bytes() == outputs[1].read_bytes()
+    expected = build_image(FIRMWARE, key=KEY, page_length=256, deterministic_iv=True, iv_key=bytes(range(32, 48)), **PARAMS)
+    assert outputs[0].read_bytes() == expected
@@ -0,0 +1,119 @@
+import io
+import os
+import sys
+import zlib
+
+import pytest
+from Crypto.Cipher import AES
+
+from encrypt_bin.__main__ import main
+from encrypt_bin.core.builder import HEADER_SIZE, generate_bin, write_image
+from encrypt_bin.core.segments import SEGMENT_HEADER, SEGMENT_MAGIC, read_segment_header, segment_iv, segment_ivs
+from encrypt_bin.core.verifier import ImageHeader, verify_bin
+
+KEY = bytes(range(16))
+IV = bytes(range(16, 32))
+PARAMS = dict(product_id=0x1234, app_version=2, prev_app_version=1, bootloader_id=0x10)
+
+
+def _decrypt_segmented(image: bytes, segment_size: int) -> bytes:
+    """Reference decoder: every segment is an independent CBC chain with its derived IV."""
+    header = ImageHeader.unpack(image)
+    payload = image[HEADER_SIZE:]
+    plain = b""
+    for index, offset in enumerate(range(0, len(payload), segment_size)):
+        cipher = AES.new(KEY, AES.MODE_CBC, segment_iv(KEY, header.iv, index))
+        plain += cipher.decrypt(payload[offset : offset + segment_size])
+    return plain
+
+
+@pytest.mark.parametrize("size", [0, 100, 2048 * 5 - 16, 2048 * 5, 50000])
+def test_segmented_image_layout(size):
+    data = os.urandom(size)
+    dst = io.BytesIO()
+    write_image(data, dst, key=KEY, iv=IV, page_length=2048, segment_size=4096, segment_workers=3, **PARAMS)
+    image = dst.getvalue()
+
+    header = ImageHeader.unpack(image)
+    plain = _decrypt_segmented(image, 4096)
+    padded = -(-(len(data) + 16) // 2048) * 2048
+    assert len(plain) == padded == header.num_pages * 2048
+    magic, version, _, _, segment_size, count = SEGMENT_HEADER.unpack_from(plain)
+    assert (magic, version, segment_size, count) == (SEGMENT_MAGIC, 1, 4096, -(-padded // 4096))
+    assert plain[16 : 16 + size] == data and not any(plain[16 + size :])
+    assert header.crc32 == zlib.crc32(plain)
+
+
+def test_segmented_output_does_not_depend_on_worker_count():
+    data = os.urandom(100_000)
+    images = []
+    for workers in (1, 2, 8):
+        dst = io.BytesIO()
+        write_image(data, dst, key=KEY, iv=IV, segment_size=8192, segment_workers=workers, **PARAMS)
+        images.append(dst.getvalue())
+    assert images[0] == images[1] == images[2]
+
+
+def test_segment_ivs_are_distinct_and_match_single_derivation():
+    ivs = segment_ivs(KEY, IV, 5)
+    assert ivs[0] == IV
+    assert len(set(ivs)) == 5
+    assert ivs == [segment_iv(KEY, IV, i) for i in range(5)]
+
+
+def test_read_segment_header_rejects_other_payloads():
+    assert read_segment_header(SEGMENT_HEADER.pack(SEGMENT_MAGIC, 1, 0, 0, 4096, 3), 2048) == 4096
+    assert read_segment_header(SEGMENT_HEADER.pack(SEGMENT_MAGIC, 1, 0, 0, 3000, 3), 2048) is None
+    assert read_segment_header(SEGMENT_HEADER.pack(b"EBCZ", 1, 0, 0, 4096, 3), 2048) is None
+    assert read_segment_header(b"EBSG", 2048) is None
+
+
+def test_invalid_segment_size():
+    with pytest.raises(ValueError, match="multiple of the page length"):
+        write_image(b"data", io.BytesIO(), key=KEY, segment_size=1000, **PARAMS)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_plain_payload_starting_with_segment_extension_is_rejected(stream):
+    # The header does not flag segmented images, so verify would misread this payload
+    data = SEGMENT_HEADER.pack(SEGMENT_MAGIC, 1, 0, 0, 4096, 3) + os.urandom(10000)
+    src = io.BytesIO(data) if stream else data
+    with pytest.raises(ValueError, match="would be read as a segmented image"):
+        write_image(src, io.BytesIO(), key=KEY, iv=IV, **PARAMS)
+
+    # A magic that is not followed by a valid extension is an ordinary payload
+    data = SEGMENT_HEADER.pack(SEGMENT_MAGIC, 1, 0, 0, 3000, 3) + os.urandom(10000)
+    write_image(data, io.BytesIO(), key=KEY, iv=IV, **PARAMS)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_generate_segmented_bin_verifies(tmp_path, compression):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(30000) + bytes(30000))
+    output = tmp_path / "out.bin"
+
+    generate_bin(str(input_file), str(output), key=KEY, segment_size=4096, compression=compression, **PARAMS)
+
+    # Small chunks make the verifier cross segment boundaries inside and between reads
+    for chunk_size in (16, 1000, 1 << 20):
+        assert verify_bin(str(output), KEY, chunk_size=chunk_size).ok
+    tampered = bytearray(output.read_bytes())
+    tampered[HEADER_SIZE + 4096 + 5] ^= 1
+    output.write_bytes(tampered)
+    assert not verify_bin(str(output), KEY).ok
+
+
+def test_main_segment_size(tmp_path, monkeypatch):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(20000))
+    output = tmp_path / "out.bin"
+    argv = ["prog", "-i", str(input_file), "-o", str(output), "-d", "0x1234", "-b", "0x10", "-k", KEY.hex(), "-v", "2", "-p", "1"]
+
+    monkeypatch.setattr(sys, "argv", argv + ["--segment-size", "8192"])
+    main()
+    assert verify_bin(str(output), KEY).ok
+    assert read_segment_header(_decrypt_segmented(output.read_bytes(), 8192), 2048) == 8192
+
+    monkeypatch.setattr(sys, "argv", argv + ["--segment-size", "3000"])
+    with pytest.raises(SystemExit, match="segment size must be a positive multiple of the page length"):
+        main()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from encrypt_bin.cli.subparsers import get_serve_args
+from encrypt_bin.cli.server import BuildServer, read_token
+from encrypt_bin.core.verifier import verify_bin
+
+KEY_HEX = "00112233445566778899AABBCCDDEEFF"
+
+
+def _exchange(server, requests, socket_path=None):
+    """Sends requests on one connection and returns the responses ordered by id."""
+
+    async def run():
+        listener = await server.start(socket_path=socket_path, port=None if socket_path else 0)
+        async with listener:
+            if socket_path:
+                reader, writer = await asyncio.open_unix_connection(socket_path)
+            else:
+                reader, writer = await asyncio.open_connection("127.0.0.1", listener.sockets[0].getsockname()[1])
+            for request in requests:
+                writer.write((request if isinstance(request, str) else json.dumps(request)).encode() + b"\n")
+            writer.write_eof()
+            lines = [json.loads(line) for line in (await reader.read()).splitlines()]
+            writer.close()
+        return sorted(lines, key=lambda r: r.get("id", -1))
+
+    try:
+        return asyncio.run(run())
+    finally:
+        server.close()
+
+
+def test_server_builds_concurrent_requests_with_defaults(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(os.urandom(5000))
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text(f"0x1;{KEY_HEX}\n0x2;{KEY_HEX}\n")
+    os.chmod(key_file, 0o600)
+
+    server = BuildServer({"key_file": str(key_file), "bootloader_id": 0x10, "app_version": 2, "prev_app_version": 1})
+    requests = [{"id": i, "input": str(input_file), "output": str(tmp_path / f"{i}.bin"), "device_id": i} for i in (1, 2)]
+    responses = _exchange(server, requests, socket_path=str(tmp_path / "build.sock"))
+
+    assert [r["ok"] for r in responses] == [True, True]
+    for i in (1, 2):
+        result = verify_bin(str(tmp_path / f"{i}.bin"), bytes.fromhex(KEY_HEX))
+        assert result.ok and result.header.device_id == i
+
+
+def test_server_reports_errors_per_request(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\x01" * 100)
+    base = {"input": str(input_file), "output": str(tmp_path / "out.bin"), "bootloader_id": "0x10", "app_version": 1, "prev_app_version": 0}
+
+    server = BuildServer()
+    responses = _exchange(
+        server,
+        [
+            {"id": 1, **base, "device_id": "0x1234", "key": KEY_HEX, "timings": True},
+            {"id": 2, **base, "device_id": "0x1234"},
+            {"id": 3, **base, "device_id": "zz", "key": KEY_HEX},
+            {"id": 4, **base, "device_id": 1, "key": KEY_HEX, "colour": "red"},
+            {"id": 5, **base, "device_id": 1, "key": KEY_HEX, "page_length": 0},
+            {"id": 6, **base, "device_id": 1, "key": KEY_HEX, "compress": "lz77"},
+            {"id": 7, **base, "device_id": 1, "key": KEY_HEX, "compress": "zlib", "compress_level": 42},
+            "not json",
+        ],
+    )
+
+    error, ok, no_key, bad_int, unknown, page_length, codec, level = responses
+    assert ok["ok"] and any(row["stage"] == "encrypt" for row in ok["timings"])
+    assert no_key == {"id": 2, "ok": False, "error": "either 'key' or 'key_file' is required"}
+    assert "Device ID must be a decimal or hexadecimal number" in bad_int["error"]
+    assert "unknown request field(s): colour" in unknown["error"]
+    assert "page length must be a positive multiple of 16" in page_length["error"]
+    assert "unknown compression codec 'lz77'" in codec["error"]
+    assert "zlib compression level must be between" in level["error"]
+    assert not error["ok"] and error["error"].startswith("invalid request")
+
+
+def test_server_reloads_changed_key_file(tmp_path):
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text(f"0x1;{KEY_HEX}\n")
+    server = BuildServer()
+    try:
+        assert server.key_store(str(key_file)) is server.key_store(str(key_file))
+        key_file.write_text(f"0x1;{KEY_HEX}\n0x2;{KEY_HEX}\n")
+        assert len(server.key_store(str(key_file))) == 2
+    finally:
+        server.close()
+
+
+def test_server_with_token_rejects_other_requests(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(b"\x01" * 100)
+    base = {"input": str(input_file), "output": str(tmp_path / "out.bin"), "device_id": 1, "key": KEY_HEX,
+            "bootloader_id": 1, "app_version": 1, "prev_app_version": 0}
+
+    server = BuildServer(token="s3cret")
+    responses = _exchange(server, [{"id": 1, **base}, {"id": 2, **base, "token": "guess"}, {"id": 3, **base, "token": "s3cret"}])
+
+    assert [r["ok"] for r in responses] == [False, False, True]
+    assert responses[0]["error"] == "invalid or missing token"
+
+
+def test_serve_port_requires_token_file(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        get_serve_args(["--port", "0"])
+    assert "--port requires --token-file" in capsys.readouterr().err
+
+    token_file = tmp_path / "token"
+    token_file.write_text("s3cret\n")
+    assert read_token(get_serve_args(["--port", "0", "--token-file", str(token_file)]).token_file) == "s3cret"
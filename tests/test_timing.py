@@ -0,0 +1,66 @@
+import json
+import sys
+import pstats
+from unittest.mock import patch
+from encrypt_bin.__main__ import main
+from encrypt_bin.core.builder import generate_bin
+from encrypt_bin.core.timing import StageTimings
+
+
+def test_wrap_counts_bytes():
+    timings = StageTimings()
+    echo = timings.wrap("crc", lambda data: data)
+    read = timings.wrap("read", lambda n: b"x" * n, count="result")
+    fixed = timings.wrap("header", lambda: None, count=48)
+
+    echo(b"abcd")
+    echo(b"ef")
+    read(10)
+    fixed()
+
+    stages = {row["stage"]: row for row in timings.summary()}
+    assert stages["crc"]["bytes"] == 6
+    assert stages["crc"]["calls"] == 2
+    assert stages["read"]["bytes"] == 10
+    assert stages["header"]["bytes"] == 48
+    assert [row["stage"] for row in timings.summary()] == ["read", "crc", "header"]
+
+
+def test_generate_bin_records_stages(tmp_path):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(range(250)) * 40)
+    output_file = tmp_path / "out.bin"
+    timings = StageTimings()
+
+    generate_bin(str(input_file), str(output_file), 0x1234, 1, 0, 1, bytes(16), page_length=2048, chunk_size=4096, timings=timings)
+
+    stages = {row["stage"]: row for row in timings.summary()}
+    assert set(stages) == {"read", "pad", "iv", "encrypt", "crc", "write", "header", "total"}
+    assert stages["read"]["bytes"] == 10000
+    assert stages["encrypt"]["bytes"] == 10240
+    assert stages["crc"]["calls"] == 3
+    assert stages["pad"]["calls"] == 1
+    assert stages["total"]["bytes"] == 10000
+    assert len(output_file.read_bytes()) == 48 + 10240
+
+    trace = timings.to_trace()
+    assert trace["traceEvents"][0]["ph"] == "X"
+
+
+def test_main_timings_and_profile(tmp_path, monkeypatch):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(range(50)))
+    trace_file = tmp_path / "trace.json"
+    profile_file = tmp_path / "build.prof"
+
+    argv = ["-i", str(input_file), "-o", str(tmp_path / "out.bin"), "-d", "0x1234", "-b", "0x10",
+            "-k", "00112233445566778899AABBCCDDEEFF", "-v", "0x1201", "-p", "0x1100",
+            "--profile", str(profile_file), "--timings", str(trace_file)]
+    monkeypatch.setattr(sys, "argv", ["prog"] + argv)
+    with patch("builtins.print") as mock_print:
+        main()
+
+    printed = "".join(str(call.args[0]) for call in mock_print.mock_calls if call.args)
+    assert "Stage timings" in printed
+    assert {row["stage"] for row in json.loads(trace_file.read_text())["stages"]} >= {"encrypt", "crc", "total"}
+    assert pstats.Stats(str(profile_file)).total_calls > 0
@@ -1,8 +1,11 @@
+import re
+
 import pytest
 from unittest.mock import patch
 import stat
 from encrypt_bin.cli import utils, validators
 from encrypt_bin.cli.utils import find_key_in_file
+from encrypt_bin.errors import KeyFileError, KeyNotFoundError, ParameterError, PathError
 
 
 # -----------------------
@@ -27,7 +30,7 @@ def test_parse_int_valid(value, expected):
     ],
 )
 def test_parse_int_invalid(value):
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ParameterError) as e:
         utils.parse_int(value, name="test_param", max_bits=32)
     assert "must be a decimal or hexadecimal number" in str(
         e.value
@@ -67,11 +70,80 @@ def test_parse_key_valid(key_str):
     ],
 )
 def test_parse_key_invalid(key_str, msg):
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(ParameterError) as e:
         utils.parse_key(key_str)
     assert msg in str(e.value)
 
 
+KEY_STRINGS = [
+    "00112233445566778899AABBCCDDEEFF",
+    "0x00112233445566778899aabbccddeeff",
+    "  00 11 22 33 44 55 66 77 88 99 AA BB CC DD EE FF\n",
+    "0x00, 0x11,0x22 0x33,0x44,0x55,0x66,0x77,0x88,0x99,0xAA,0xBB,0xCC,0xDD,0xEE,0xFF",
+    "00\t11\u00a022 33 44 55 66 77 88 99 AA BB CC DD EE FF",
+    "0 1 2 3 4 5 6 7 8 9 A B C D E F",
+    "0X00 0X11 0X22 0X33 0X44 0X55 0X66 0X77 0X88 0X99 0XAA 0XBB 0XCC 0XDD 0XEE 0XFF",
+    "0011 2233 4455 6677 8899 AABB CCDD EEFF",
+    "00112233445566778899AABBCCDDEEF",
+    "00112233445566778899AABBCCDDEEFF00",
+    "00 11 22 33 44 55 66 77 88 99 GG BB CC DD EE FF",
+    "",
+]
+
+
+def _parse_or_error(parse, value):
+    try:
+        return parse(value)
+    except Exception as e:
+        return type(e), str(e)
+
+
+@pytest.mark.parametrize("key_str", KEY_STRINGS)
+def test_parse_key_fast_path_matches_general_parser(key_str, monkeypatch):
+    fast = _parse_or_error(utils.parse_key, key_str)
+    monkeypatch.setattr(utils, "_parse_hex_key", lambda value: None)
+    assert fast == _parse_or_error(utils.parse_key, key_str)
+
+
+def test_iter_key_file_matches_general_parser(tmp_path, monkeypatch):
+    lines = [
+        "# device_id ; key",
+        "0x1;00112233445566778899AABBCCDDEEFF",
+        "0X2 ; 0x00112233445566778899aabbccddeeff  # comment",
+        "3 00112233445566778899AABBCCDDEEFF",
+        "0x4, 00112233445566778899AABBCCDDEEFF\r",
+        "5;00 11 22 33 44 55 66 77 88 99 AA BB CC DD EE FF",
+        "0x6 0x00,0x11,0x22,0x33,0x44,0x55,0x66,0x77,0x88,0x99,0xAA,0xBB,0xCC,0xDD,0xEE,0xFF",
+        "007 00112233445566778899AABBCCDDEEFF",
+        "0x8 0x9;00112233445566778899AABBCCDDEEFF",
+        "1_0;00112233445566778899AABBCCDDEEFF",
+        "",
+        "   ",
+        "0x11",
+    ]
+    path = tmp_path / "keys.txt"
+    path.write_text("\n".join(lines) + "\n")
+    path.chmod(0o600)
+
+    entries = list(utils.iter_key_file(str(path)))
+    assert [(line_no, device_id) for line_no, device_id, _ in entries] == [(2, 1), (3, 2), (4, 3), (5, 4), (6, 5), (7, 6), (10, 10)]
+    assert {key for _, _, key in entries} == {bytes.fromhex("00112233445566778899AABBCCDDEEFF")}
+
+    monkeypatch.setattr(utils, "_KEY_LINE", re.compile(r"(?!)"))
+    monkeypatch.setattr(utils, "_parse_hex_key", lambda value: None)
+    assert list(utils.iter_key_file(str(path))) == entries
+
+
+def test_iter_key_file_reports_invalid_keys_with_line(tmp_path):
+    path = tmp_path / "keys.txt"
+    path.write_text("0x1;00112233445566778899AABBCCDDEEFF\n0x2;00112233\n")
+    path.chmod(0o600)
+    entries = utils.iter_key_file(str(path))
+    assert next(entries)[1] == 1
+    with pytest.raises(KeyFileError, match=f"device_id 0x2 in file '{path}' \\(line 2\\): key must be exactly 16 bytes long \\(got 4\\)"):
+        next(entries)
+
+
 # -----------------------
 # validate_file_paths
 # -----------------------
@@ -83,14 +155,14 @@ def test_validate_file_paths(tmp_path):
     # valid paths
     validators.validate_file_paths(str(input_file), str(output_file))
 
-    # missing input file -> SystemExit
-    with pytest.raises(SystemExit) as e:
+    # missing input file -> PathError
+    with pytest.raises(PathError) as e:
         validators.validate_file_paths(str(tmp_path / "missing.bin"), str(output_file))
     assert "input file" in str(e.value)
 
-    # non-existent output directory -> SystemExit
+    # non-existent output directory -> PathError
     invalid_output = tmp_path / "nonexistent_dir" / "out.bin"
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(PathError) as e:
         validators.validate_file_paths(str(input_file), str(invalid_output))
     assert "output directory" in str(e.value)
 
@@ -121,15 +193,15 @@ def test_find_key_in_file_various_formats(tmp_path, capsys):
     key2 = find_key_in_file(str(key_file), 0x5678)
     assert len(key2) == 16
 
-    # device_id not found -> SystemExit
-    with pytest.raises(SystemExit) as e:
+    # device_id not found -> KeyNotFoundError
+    with pytest.raises(KeyNotFoundError) as e:
         find_key_in_file(str(key_file), 0x9999)
     assert "could not find key" in str(e.value)
 
-    # missing file -> SystemExit
-    with pytest.raises(SystemExit) as e:
+    # missing file -> KeyFileError
+    with pytest.raises(KeyFileError) as e:
         find_key_in_file(str(tmp_path / "missing.txt"), 0x1234)
-    assert "Error reading key file" in str(e.value)
+    assert "cannot read key file" in str(e.value)
 
 
 def test_find_key_in_file_open_exception(tmp_path):
@@ -137,6 +209,7 @@ def test_find_key_in_file_open_exception(tmp_path):
     key_file.write_text("0x1234;00 11 22 33 44 55 66 77 88 99 AA BB CC DD EE FF")
 
     with patch("builtins.open", side_effect=OSError("mocked error")):
-        with pytest.raises(SystemExit) as e:
+        with pytest.raises(KeyFileError) as e:
             find_key_in_file(str(key_file), 0x1234)
-        assert "Error reading key file: mocked error" in str(e.value)
+        assert "cannot read key file: mocked error" in str(e.value)
+
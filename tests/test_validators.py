@@ -1,5 +1,6 @@
 import pytest
 from encrypt_bin.cli import validators
+from encrypt_bin.errors import PathError
 
 
 def test_validate_file_paths(tmp_path):
@@ -10,26 +11,26 @@ def test_validate_file_paths(tmp_path):
     # valid case
     validators.validate_file_paths(str(input_file), str(output_file))
 
-    # missing input file -> SystemExit
-    with pytest.raises(SystemExit) as e:
+    # missing input file -> PathError
+    with pytest.raises(PathError) as e:
         validators.validate_file_paths(str(tmp_path / "missing.bin"), str(output_file))
     assert "input file" in str(e.value)
 
-    # input file without .bin extension -> SystemExit
+    # input file without .bin extension -> PathError
     input_txt = tmp_path / "in.txt"
     input_txt.write_bytes(b"\x00")
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(PathError) as e:
         validators.validate_file_paths(str(input_txt), str(output_file))
     assert "must have the '.bin' extension" in str(e.value)
 
-    # non-existent output directory -> SystemExit
+    # non-existent output directory -> PathError
     invalid_output = tmp_path / "nonexistent_dir" / "out.bin"
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(PathError) as e:
         validators.validate_file_paths(str(input_file), str(invalid_output))
     assert "output directory" in str(e.value)
 
-    # output file without .bin extension -> SystemExit
+    # output file without .bin extension -> PathError
     output_txt = tmp_path / "out.txt"
-    with pytest.raises(SystemExit) as e:
+    with pytest.raises(PathError) as e:
         validators.validate_file_paths(str(input_txt), str(output_file))
     assert "must have the '.bin' extension" in str(e.value)
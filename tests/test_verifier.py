@@ -0,0 +1,90 @@
+import sys
+import pytest
+from unittest.mock import patch
+from encrypt_bin.__main__ import main
+from encrypt_bin.core.builder import generate_bin
+from encrypt_bin.core.verifier import ImageHeader, verify_bin, verify_many
+
+KEY = bytes(range(16))
+
+
+def make_image(tmp_path, name="out.bin", size=1000, device_id=0x12345678ABCDEF00, out_dir=None):
+    input_file = tmp_path / "firmware.bin"
+    input_file.write_bytes(bytes(i % 251 for i in range(size)))
+    output_file = (out_dir or tmp_path) / name
+    generate_bin(str(input_file), str(output_file), device_id, 0x1201, 0x1100, 0x10, KEY, page_length=64)
+    return output_file
+
+
+def test_header_unpack(tmp_path):
+    image = make_image(tmp_path)
+    header = ImageHeader.unpack(image.read_bytes())
+    assert header.device_id == 0x12345678ABCDEF00
+    assert header.bootloader_id == 0x10
+    assert header.app_version == 0x1201
+    assert header.prev_app_version == 0x1100
+    assert header.page_length == 64
+    assert header.num_pages == 16
+
+
+@pytest.mark.parametrize("chunk_size", [16, 100, 1 << 20])
+def test_verify_valid_image(tmp_path, chunk_size):
+    image = make_image(tmp_path)
+    result = verify_bin(str(image), KEY, chunk_size=chunk_size)
+    assert result.ok, result.error
+    assert result.header.device_id == 0x12345678ABCDEF00
+
+
+def test_verify_detects_corruption(tmp_path):
+    image = make_image(tmp_path)
+    data = bytearray(image.read_bytes())
+    data[100] ^= 0xFF
+    image.write_bytes(bytes(data))
+
+    result = verify_bin(str(image), KEY)
+    assert not result.ok
+    assert "CRC32 mismatch" in result.error
+
+
+def test_verify_wrong_key(tmp_path):
+    image = make_image(tmp_path)
+    assert "CRC32 mismatch" in verify_bin(str(image), bytes(16)).error
+
+
+def test_verify_size_mismatch(tmp_path):
+    image = make_image(tmp_path)
+    image.write_bytes(image.read_bytes()[:-16])
+    assert "does not match payload size" in verify_bin(str(image), KEY).error
+
+
+def test_verify_short_and_missing_files(tmp_path):
+    short = tmp_path / "short.bin"
+    short.write_bytes(b"\x00" * 10)
+    assert "too short" in verify_bin(str(short), KEY).error
+    assert not verify_bin(str(tmp_path / "missing.bin"), KEY).ok
+
+
+def test_verify_many_with_key_lookup(tmp_path):
+    good = make_image(tmp_path, "a.bin", device_id=0x1)
+    unknown = make_image(tmp_path, "b.bin", device_id=0x2)
+    results = verify_many([str(good), str(unknown)], {0x1: KEY}.get, max_workers=2)
+
+    assert results[0].ok
+    assert "no key for device_id" in results[1].error
+
+
+def test_main_verify_command(tmp_path, monkeypatch):
+    out_dir = tmp_path / "release"
+    out_dir.mkdir()
+    make_image(tmp_path, "a.bin", out_dir=out_dir)
+    make_image(tmp_path, "b.bin", out_dir=out_dir)
+
+    monkeypatch.setattr(sys, "argv", ["prog", "verify", "-k", KEY.hex(), str(out_dir)])
+    with patch("builtins.print") as mock_print:
+        main()
+    printed = "".join(str(call.args[0]) for call in mock_print.mock_calls)
+    assert "2 OK, 0 failed" in printed
+
+    (out_dir / "a.bin").write_bytes(b"\x00" * 64)
+    with patch("builtins.print"), pytest.raises(SystemExit):
+        main()